@@ -1,6 +1,17 @@
 import React, { useState, useEffect } from 'react';
+import { useSearchParams } from 'react-router-dom';
 import { orderService } from '../services/orderService';
 
+// Timeline step reached at each order status pushed by the server
+const ORDER_STEPS = {
+  PAYMENT_CONFIRMED: 0,
+  PREPARING: 1,
+  DISPATCHED: 2,
+  DELIVERED: 3,
+};
+
+const STEP_STATUS = ['preparing', 'preparing', 'dispatched', 'delivered'];
+
 const OrderTrackingPage = () => {
   const [orderStatus, setOrderStatus] = useState({
     id: 'ORDER-' + Date.now(),
@@ -27,9 +38,49 @@ const OrderTrackingPage = () => {
   });
 
   const [currentStep, setCurrentStep] = useState(1);
+  const [driverPosition, setDriverPosition] = useState(null);
+  const [searchParams] = useSearchParams();
+  const orderId = searchParams.get('order');
+
+  const showStep = (step) => {
+    setCurrentStep(step);
+    setOrderStatus(prevStatus => ({
+      ...prevStatus,
+      status: STEP_STATUS[step],
+      timeline: prevStatus.timeline.map((item, index) => ({
+        ...item,
+        completed: index <= step,
+      })),
+    }));
+  };
 
   useEffect(() => {
-    // Simulate real-time updates
+    if (!orderId) {
+      return undefined;
+    }
+    setOrderStatus(prevStatus => ({ ...prevStatus, id: orderId }));
+    // Pushed by the server as they happen, for every member of the group
+    return orderService.subscribeToDelivery(orderId, (event) => {
+      if (event.type === 'driver_position') {
+        setDriverPosition({ lat: event.lat, lng: event.lng });
+        return;
+      }
+      if (event.type === 'snapshot' && event.delivery?.driver_position) {
+        setDriverPosition(event.delivery.driver_position);
+      }
+      if (event.order_status in ORDER_STEPS) {
+        showStep(ORDER_STEPS[event.order_status]);
+      } else if (event.order_status === 'CANCELLED') {
+        setOrderStatus(prevStatus => ({ ...prevStatus, status: 'cancelled' }));
+      }
+    });
+  }, [orderId]);
+
+  useEffect(() => {
+    if (orderId) {
+      return undefined;
+    }
+    // No order to follow: simulate real-time updates
     const interval = setInterval(() => {
       setCurrentStep(prev => {
         if (prev < 3) {
@@ -49,7 +100,7 @@ const OrderTrackingPage = () => {
     }, 30000); // Update every 30 seconds
 
     return () => clearInterval(interval);
-  }, []);
+  }, [orderId]);
 
   const getStatusColor = (status) => {
     switch (status) {
@@ -59,6 +110,8 @@ const OrderTrackingPage = () => {
         return '#007bff';
       case 'delivered':
         return '#28a745';
+      case 'cancelled':
+        return '#dc3545';
       default:
         return '#6c757d';
     }
@@ -72,6 +125,8 @@ const OrderTrackingPage = () => {
         return 'Out for Delivery';
       case 'delivered':
         return 'Delivered';
+      case 'cancelled':
+        return 'Cancelled';
       default:
         return 'Processing';
     }
@@ -163,6 +218,11 @@ const OrderTrackingPage = () => {
                   <div style={{ fontSize: '14px', color: '#666' }}>
                     {orderStatus.driver.vehicle}
                   </div>
+                  {driverPosition && (
+                    <div style={{ fontSize: '12px', color: '#666' }}>
+                      📍 {driverPosition.lat.toFixed(4)}, {driverPosition.lng.toFixed(4)}
+                    </div>
+                  )}
                 </div>
               </div>
               
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import splitPaymentService from '../services/splitPaymentService';
 import toast from 'react-hot-toast';
@@ -23,6 +23,10 @@ const SplitPaymentPage = () => {
   const [userOrderId, setUserOrderId] = useState(null);
   const [isCommitted, setIsCommitted] = useState(false);
   const [paymentStatus, setPaymentStatus] = useState('PENDING');
+  
+  // Idempotency key (plus any generated request fields) per user order and
+  // action, reused by every retry until the server gives a definitive answer
+  const paymentAttempts = useRef({});
 
   useEffect(() => {
     fetchData();
@@ -86,6 +90,23 @@ const SplitPaymentPage = () => {
     }
   };
 
+  const attemptFor = (action, fields = {}) => {
+    const id = `${userOrderId}:${action}`;
+    if (!paymentAttempts.current[id]) {
+      paymentAttempts.current[id] = { key: splitPaymentService.newIdempotencyKey(), ...fields };
+    }
+    return paymentAttempts.current[id];
+  };
+
+  // Keep the key after network errors, server errors and 409 (still running),
+  // so the retry is matched to the first request
+  const settleAttempt = (action, error = null) => {
+    const status = error?.response?.status;
+    if (!error || (status && status < 500 && status !== 409)) {
+      delete paymentAttempts.current[`${userOrderId}:${action}`];
+    }
+  };
+
   const handleCommitToPayment = async () => {
     if (!deliveryAddress || !deliveryPhone) {
       toast.error('Please fill in all required fields');
@@ -93,19 +114,23 @@ const SplitPaymentPage = () => {
     }
 
     setCommitting(true);
+    const attempt = attemptFor('commit');
     try {
       await splitPaymentService.commitToPayment(
         userOrderId,
         paymentMethod,
         deliveryAddress,
         deliveryPhone,
-        specialInstructions
+        specialInstructions,
+        attempt.key
       );
+      settleAttempt('commit');
       
       toast.success('Payment commitment successful!');
       setIsCommitted(true);
       fetchData(); // Refresh data
     } catch (error) {
+      settleAttempt('commit', error);
       console.error('Failed to commit to payment:', error);
       toast.error('Failed to commit to payment');
     } finally {
@@ -115,20 +140,23 @@ const SplitPaymentPage = () => {
 
   const handleConfirmPayment = async () => {
     setConfirming(true);
+    // Simulated gateway transaction id; kept with the key so retries send the same body
+    const attempt = attemptFor(`confirm-${paymentMethod}`, { transactionId: 'TXN_' + Date.now() });
     try {
       if (paymentMethod === 'ONLINE') {
         // Simulate online payment gateway
-        const mockTransactionId = 'TXN_' + Date.now();
-        await splitPaymentService.confirmPayment(userOrderId, mockTransactionId, 'mock_gateway');
+        await splitPaymentService.confirmPayment(userOrderId, attempt.transactionId, 'mock_gateway', attempt.key);
       } else {
         // COD payment
-        await splitPaymentService.confirmPayment(userOrderId);
+        await splitPaymentService.confirmPayment(userOrderId, null, null, attempt.key);
       }
+      settleAttempt(`confirm-${paymentMethod}`);
       
       toast.success('Payment confirmed successfully!');
       setPaymentStatus('CONFIRMED');
       fetchData(); // Refresh data
     } catch (error) {
+      settleAttempt(`confirm-${paymentMethod}`, error);
       console.error('Failed to confirm payment:', error);
       toast.error('Failed to confirm payment');
     } finally {
@@ -141,11 +169,14 @@ const SplitPaymentPage = () => {
       return;
     }
 
+    const attempt = attemptFor('cancel');
     try {
-      const cancellation = await splitPaymentService.cancelOrder(userOrderId);
+      const cancellation = await splitPaymentService.cancelOrder(userOrderId, 'USER_WITHDREW', attempt.key);
+      settleAttempt('cancel');
       toast.error(`Order cancelled. Cancellation fee: ₹${cancellation.cancellation_fee}`);
       navigate('/cart');
     } catch (error) {
+      settleAttempt('cancel', error);
       console.error('Failed to cancel order:', error);
       toast.error('Failed to cancel order');
     }
@@ -30,4 +30,25 @@ export const orderService = {
       throw error.response?.data || error.message;
     }
   },
+
+  // Follow delivery status and driver position as server-sent events.
+  // Returns a function that closes the stream.
+  subscribeToDelivery: (orderId, onEvent) => {
+    // EventSource cannot send headers, so the token travels in the query string
+    const token = localStorage.getItem('token');
+    const url = `${api.defaults.baseURL}/orders/${orderId}/events?token=${encodeURIComponent(token || '')}`;
+    const source = new EventSource(url);
+    const handle = (message) => {
+      const event = JSON.parse(message.data);
+      onEvent(event);
+      if (['DELIVERED', 'CANCELLED'].includes(event.order_status)) {
+        // The server ends the stream here; stop EventSource from reconnecting
+        source.close();
+      }
+    };
+    ['snapshot', 'delivery_status', 'driver_position', 'order_status'].forEach((type) =>
+      source.addEventListener(type, handle)
+    );
+    return () => source.close();
+  },
 };
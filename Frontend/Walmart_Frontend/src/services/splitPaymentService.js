@@ -1,5 +1,15 @@
 import api from './api';
 
+// Retrying a payment call with the same key (and body) replays the original
+// response instead of repeating the payment side effects on the server. Callers
+// mint one key per action and pass it on every retry of that action.
+const newIdempotencyKey = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const idempotent = (key) => (key ? { headers: { 'Idempotency-Key': key } } : {});
+
 const splitPaymentService = {
   // Create user orders for a clubbed order
   createUserOrders: async (clubbedOrderId) => {
@@ -13,7 +23,7 @@ const splitPaymentService = {
   },
 
   // Commit to payment with delivery details
-  commitToPayment: async (userOrderId, paymentMethod, deliveryAddress, deliveryPhone, specialInstructions = null) => {
+  commitToPayment: async (userOrderId, paymentMethod, deliveryAddress, deliveryPhone, specialInstructions = null, idempotencyKey = null) => {
     try {
       const response = await api.post('/split-payment/commit', {
         user_order_id: userOrderId,
@@ -21,7 +31,7 @@ const splitPaymentService = {
         delivery_address: deliveryAddress,
         delivery_phone: deliveryPhone,
         special_instructions: specialInstructions
-      });
+      }, idempotent(idempotencyKey));
       return response.data;
     } catch (error) {
       console.error('Failed to commit to payment:', error);
@@ -30,13 +40,13 @@ const splitPaymentService = {
   },
 
   // Confirm payment
-  confirmPayment: async (userOrderId, externalTransactionId = null, paymentGateway = null) => {
+  confirmPayment: async (userOrderId, externalTransactionId = null, paymentGateway = null, idempotencyKey = null) => {
     try {
       const response = await api.post('/split-payment/confirm', {
         user_order_id: userOrderId,
         external_transaction_id: externalTransactionId,
         payment_gateway: paymentGateway
-      });
+      }, idempotent(idempotencyKey));
       return response.data;
     } catch (error) {
       console.error('Failed to confirm payment:', error);
@@ -45,12 +55,12 @@ const splitPaymentService = {
   },
 
   // Cancel order
-  cancelOrder: async (userOrderId, cancellationReason = 'USER_WITHDREW') => {
+  cancelOrder: async (userOrderId, cancellationReason = 'USER_WITHDREW', idempotencyKey = null) => {
     try {
       const response = await api.post('/split-payment/cancel', {
         user_order_id: userOrderId,
         cancellation_reason: cancellationReason
-      });
+      }, idempotent(idempotencyKey));
       return response.data;
     } catch (error) {
       console.error('Failed to cancel order:', error);
@@ -58,6 +68,9 @@ const splitPaymentService = {
     }
   },
 
+  // Fresh key for one payment action; reuse it across that action's retries
+  newIdempotencyKey,
+
   // Get payment summary
   getPaymentSummary: async (clubbedOrderId) => {
     try {
@@ -1,21 +1,36 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_async_db, get_db
 from app.models import User
+from app.cache import TTLCache
+from app.password_hashing import pwd_context, verify_password_async
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# Resolved users keyed by the token's user id claim (or its email subject for
+# tokens issued before the claim existed). Cached users are detached from any
+# session, so only their column attributes may be used.
+user_cache = TTLCache(maxsize=AUTH_USER_CACHE_SIZE, ttl=AUTH_USER_CACHE_TTL_SECONDS)
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -30,6 +45,21 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+def _load_user_for_login(db: Session, email: str):
+    user = db.query(User).filter(User.email == email).first()
+    # Release the connection while the password is checked; the user stays loaded
+    db.close()
+    return user
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str):
+    """Like authenticate_user, but bcrypt runs on the password hashing pool"""
+    user = await db.run_sync(_load_user_for_login, email)
+    if not user:
+        return False
+    if not await verify_password_async(password, user.password_hash):
+        return False
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -40,32 +70,59 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str):
+def decode_token(token: str):
+    """Return the (email, user_id) carried by a token; user_id is None for older tokens"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return email
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _credentials_exception()
+    email: str = payload.get("sub")
+    if email is None:
+        raise _credentials_exception()
+    return email, payload.get("uid")
+
+def verify_token(token: str):
+    email, _ = decode_token(token)
+    return email
+
+def invalidate_cached_user(user_id: Optional[str] = None, email: Optional[str] = None):
+    """Drop a user from the authenticated-user cache; call after updating or deleting them"""
+    if user_id:
+        user_cache.pop(user_id)
+    if email:
+        user_cache.pop(email)
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    token = credentials.credentials
-    email = verify_token(token)
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    return get_user_for_token(db, credentials.credentials)
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """get_current_user for async routes; a cached user needs no database round trip"""
+    email, user_id = decode_token(credentials.credentials)
+    user = user_cache.get(user_id or email)
+    if user is not None:
+        return user
+    return await db.run_sync(_load_user, email, user_id)
+
+def get_user_for_token(db: Session, token: str):
+    """Resolve a bearer token to its user, through the authenticated-user cache"""
+    email, user_id = decode_token(token)
+    user = user_cache.get(user_id or email)
+    if user is not None:
+        return user
+    return _load_user(db, email, user_id)
+
+def _load_user(db: Session, email: str, user_id: Optional[str]):
+    if user_id:
+        user = db.get(User, user_id)
+    else:
+        user = db.query(User).filter(User.email == email).first()
+    if user is None or user.email != email:
+        raise _credentials_exception()
+
+    if user_cache.enabled:
+        db.expunge(user)
+        user_cache.set(user_id or email, user)
     return user
@@ -0,0 +1,158 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import os
+
+import orjson
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "60"))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "1024"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after `ttl` seconds.
+
+    A `ttl` of 0 disables the cache: every lookup misses and nothing is stored.
+    The cache is per-process; each uvicorn worker keeps its own copy, so the
+    TTL bounds how stale a worker can be after a write handled by another one.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if not self.enabled:
+            self.misses += 1
+            return default
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_where(self, predicate) -> int:
+        """Drop every entry whose key matches `predicate`; returns the count removed."""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CachedResponse:
+    """Pre-encoded JSON body plus its strong ETag"""
+
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Evaluate an If-None-Match header (weak comparison, RFC 9110 13.1.2)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == self.etag:
+                return True
+        return False
+
+
+def encode_json(payload: Any) -> CachedResponse:
+    return CachedResponse(orjson.dumps(payload))
+
+
+# Catalog responses, keyed by ("list", skip, limit) or ("product", product_id)
+catalog_cache = TTLCache(maxsize=CATALOG_CACHE_MAX_ENTRIES, ttl=CATALOG_CACHE_TTL_SECONDS)
+
+
+# When the catalog last changed (time.monotonic())
+_catalog_changed_at = float("-inf")
+
+# Bumped by every invalidation. A read captures it before querying and only
+# stores its response if it is unchanged, so a read that raced a write
+# cannot cache the pre-write body after the invalidation.
+_catalog_generation = 0
+_catalog_generation_lock = threading.Lock()
+
+
+def catalog_changed_within(seconds: float) -> bool:
+    return time.monotonic() - _catalog_changed_at < seconds
+
+
+def catalog_generation() -> int:
+    with _catalog_generation_lock:
+        return _catalog_generation
+
+
+def invalidate_product(product_id: Optional[str] = None) -> None:
+    """Drop cached catalog responses affected by a write to `product_id`.
+
+    Every list page may contain the product, so all pages are dropped; with no
+    `product_id` the whole catalog cache is cleared.
+    """
+    global _catalog_changed_at, _catalog_generation
+    with _catalog_generation_lock:
+        _catalog_generation += 1
+    _catalog_changed_at = time.monotonic()
+    if product_id is None:
+        catalog_cache.clear()
+        return
+    catalog_cache.pop(("product", product_id))
+    catalog_cache.pop_where(lambda key: key[0] == "list")
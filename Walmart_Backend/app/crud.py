@@ -1,30 +1,46 @@
 import uuid
 import hashlib
 import logging
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func, text
-from geopy.distance import geodesic
+from sqlalchemy import Integer, and_, bindparam, case, func, select, text, update, insert
 from app.models import (
     User, Product, Cart, CartItem, BuddyQueue, ClubbedOrder, ClubbedOrderUser,
     Driver, Delivery, UserOrder, PaymentTransaction, OrderCancellation
 )
-from app.enums import BuddyStatus, OrderStatus, DriverStatus
+from app.enums import BuddyStatus, OrderStatus, DriverStatus, DeliveryStatus, CancellationReason
 from app.schemas import (
     UserCreate, ProductCreate, CartItemCreate, BuddyQueueCreate,
     DriverCreate, ClubReadinessResponse
 )
 from app.auth import get_password_hash, verify_password
+from app.cache import invalidate_product
+from app.snapshots import (
+    get_clubbed_order_snapshot, get_member_payment_view, invalidate_cart, invalidate_clubbed_order
+)
+from app import outbox
+from app.driver_index import driver_index, ensure_driver_index, sync_drivers
+from app.events import event_bus
+from app.geo import haversine
+from app.wallet import apply_ledger_rows
 import os
-from math import radians, sin, cos, sqrt, atan2
 
 logger = logging.getLogger(__name__)
 
 CLUB_WAIT_TIME_MINUTES = int(os.getenv("CLUB_WAIT_TIME_MINUTES", "5"))
 MAX_DELIVERY_WEIGHT_KG = float(os.getenv("MAX_DELIVERY_WEIGHT_KG", "5.0"))
 LOCATION_CLUSTER_RADIUS_KM = float(os.getenv("LOCATION_CLUSTER_RADIUS_KM", "2.0"))
+CLUBBED_ORDER_UPDATE_RETRIES = int(os.getenv("CLUBBED_ORDER_UPDATE_RETRIES", "5"))
+CLUB_DISCOUNT_RATE = Decimal("0.05")
+COMMITMENT_WINDOW_MINUTES = 10
+PAYMENT_DEADLINE_BATCH_SIZE = int(os.getenv("PAYMENT_DEADLINE_BATCH_SIZE", "200"))
+# Nearest-driver candidates tried before falling back to the least loaded drivers
+DRIVER_ASSIGNMENT_ATTEMPTS = int(os.getenv("DRIVER_ASSIGNMENT_ATTEMPTS", "5"))
+
+class StaleClubbedOrderError(Exception):
+    """A clubbed order kept changing underneath an optimistic update"""
 
 def generate_uuid():
     return str(uuid.uuid4())
@@ -35,8 +51,9 @@ def generate_location_hash(lat: float, lng: float, precision: int = 3) -> str:
     return hashlib.md5(location_string.encode()).hexdigest()[:8]
 
 # User operations
-def create_user(db: Session, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = User(
         id=generate_uuid(),
         name=user.name,
@@ -70,6 +87,7 @@ def create_product(db: Session, product: ProductCreate):
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    invalidate_product(db_product.id)
     return db_product
 
 def get_products(db: Session, skip: int = 0, limit: int = 100):
@@ -95,7 +113,8 @@ def create_cart(db: Session, user_id: str):
     db.refresh(db_cart)
     return db_cart
 
-def add_item_to_cart(db: Session, cart_id: str, item: CartItemCreate):
+def _stage_cart_item(db: Session, cart_id: str, item: CartItemCreate):
+    """Apply an add-to-cart and its stock change to the session without committing"""
     product = get_product(db, item.product_id)
     if not product:
         return None
@@ -104,35 +123,41 @@ def add_item_to_cart(db: Session, cart_id: str, item: CartItemCreate):
     if product.stock < item.quantity:
         raise Exception("Not enough stock available")
 
+    # Decrement stock by the quantity being added
+    product.stock -= item.quantity
+
     # Check if item already exists in cart
     existing_item = db.query(CartItem).filter(
         and_(CartItem.cart_id == cart_id, CartItem.product_id == item.product_id)
     ).first()
 
     if existing_item:
-        # Decrement stock by the additional quantity
-        product.stock -= item.quantity
         existing_item.quantity += item.quantity
         existing_item.total_price = existing_item.quantity * product.price
-        db.commit()
-        db.refresh(existing_item)
-        db.refresh(product)
-        return existing_item
-    else:
-        # Decrement stock by the quantity being added
-        product.stock -= item.quantity
-        db_item = CartItem(
-            id=generate_uuid(),
-            cart_id=cart_id,
-            product_id=item.product_id,
-            quantity=item.quantity,
-            total_price=item.quantity * product.price
-        )
-        db.add(db_item)
-        db.commit()
-        db.refresh(db_item)
-        db.refresh(product)
-        return db_item
+        return existing_item, product
+
+    db_item = CartItem(
+        id=generate_uuid(),
+        cart_id=cart_id,
+        product_id=item.product_id,
+        quantity=item.quantity,
+        total_price=item.quantity * product.price
+    )
+    db.add(db_item)
+    return db_item, product
+
+def add_item_to_cart(db: Session, cart_id: str, item: CartItemCreate):
+    staged = _stage_cart_item(db, cart_id, item)
+    if not staged:
+        return None
+
+    cart_item, product = staged
+    db.commit()
+    db.refresh(cart_item)
+    db.refresh(product)
+    invalidate_product(product.id)
+    invalidate_cart(cart_id)
+    return cart_item
 def remove_item_from_cart(db: Session, cart_id: str, item_id: str):
     """Remove an item from the cart"""
     cart_item = db.query(CartItem).filter(
@@ -149,8 +174,11 @@ def remove_item_from_cart(db: Session, cart_id: str, item_id: str):
         db.refresh(product)
     
     # Remove the item
+    product_id = cart_item.product_id
     db.delete(cart_item)
     db.commit()
+    invalidate_product(product_id)
+    invalidate_cart(cart_id)
     return True
 
 def update_cart_item_quantity(db: Session, cart_id: str, item_id: str, new_quantity: int):
@@ -186,6 +214,8 @@ def update_cart_item_quantity(db: Session, cart_id: str, item_id: str, new_quant
     db.commit()
     db.refresh(cart_item)
     db.refresh(product)
+    invalidate_product(product.id)
+    invalidate_cart(cart_id)
     
     return cart_item
 
@@ -232,22 +262,6 @@ def check_club_readiness(db: Session, user_id: str, lat: float, lng: float):
         nearby_users_count=nearby_waiting
     )
 
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the distance between two points on Earth in meters.
-    """
-    R = 6371000  # Radius of Earth in meters
-    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
-
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
-
-    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-    distance = R * c
-    return distance
-
 def find_compatible_buddies(db: Session, buddy_id: str) -> List[BuddyQueue]:
     """
     Find compatible buddies for a user based on location and timeout.
@@ -385,73 +399,95 @@ def join_buddy_queue(db: Session, user_id: int, buddy_data: BuddyQueueCreate) ->
         db.refresh(new_buddy)
         return new_buddy
 
+def get_cart_totals(db: Session, cart_ids: List[str]) -> dict:
+    """Return {cart_id: (value, weight_kg)} for several carts with one GROUP BY query"""
+    if not cart_ids:
+        return {}
+    rows = db.query(
+        CartItem.cart_id,
+        func.sum(Product.price * CartItem.quantity),
+        func.sum(CartItem.quantity * Product.weight_grams)
+    ).join(
+        Product, Product.id == CartItem.product_id
+    ).filter(
+        CartItem.cart_id.in_(cart_ids)
+    ).group_by(CartItem.cart_id).all()
+    return {
+        cart_id: (Decimal(value or 0), Decimal(weight_grams or 0) / 1000)
+        for cart_id, value, weight_grams in rows
+    }
+
+def _user_order_rows(clubbed_order_id: str, members, totals: dict, commitment_deadline: datetime) -> List[dict]:
+    """Insert parameters for one UserOrder per (user_id, cart_id) member"""
+    return [
+        {
+            "id": generate_uuid(),
+            "clubbed_order_id": clubbed_order_id,
+            "user_id": user_id,
+            "cart_id": cart_id,
+            "individual_total": totals.get(cart_id, (Decimal(0), 0))[0],
+            "payment_method": 'ONLINE',  # Default, user can change
+            "payment_status": 'PENDING',
+            "commitment_deadline": commitment_deadline,
+            "is_committed": False,
+            "delivery_address": "",  # User must provide
+            "delivery_phone": "",  # User must provide
+            "created_at": datetime.utcnow()
+        }
+        for user_id, cart_id in members
+    ]
+
 def create_clubbed_order(db: Session, buddies: List[BuddyQueue]) -> ClubbedOrder:
     """
     Creates a clubbed order from a list of matched buddies.
+
+    Member totals come from one aggregate query; membership and per-user
+    split-payment orders are bulk inserted, the buddies are flipped to
+    MATCHED with one UPDATE, and everything commits in a single transaction.
     """
-    # Create the main clubbed order
+    members = [(buddy.user_id, buddy.cart_id) for buddy in buddies]
+    buddy_ids = [buddy.id for buddy in buddies]
+    totals = get_cart_totals(db, [cart_id for _, cart_id in members])
+
+    total_amount = sum((value for value, _ in totals.values()), Decimal(0))
+    total_weight = sum((weight for _, weight in totals.values()), Decimal(0))
+    commitment_deadline = datetime.utcnow() + timedelta(minutes=COMMITMENT_WINDOW_MINUTES)
+
+    # Create the main clubbed order, already waiting on split payment
     new_clubbed_order = ClubbedOrder(
         id=generate_uuid(),
-        status=OrderStatus.CREATED.value,
-        combined_value=0,  # Will be calculated later
-        combined_weight=0,  # Will be calculated later
-        total_discount=0
+        status=OrderStatus.PAYMENT_PENDING.value,
+        combined_value=total_amount,
+        combined_weight=total_weight,
+        total_discount=total_amount * CLUB_DISCOUNT_RATE,
+        payment_confirmation_deadline=commitment_deadline,
+        member_count=len(members)
     )
     db.add(new_clubbed_order)
-    db.flush()  # To get the ID for the new_clubbed_order
-
-    total_amount = 0
-    total_weight = 0
-    
-    for buddy in buddies:
-        # Link user to the clubbed order
-        cart = db.query(Cart).filter(Cart.id == buddy.cart_id).first()
-        if not cart:
-            # This should ideally not happen
-            continue
-
-        # Explicitly load cart items with product relationships to ensure accurate calculation
-        cart_items = db.query(CartItem).filter(CartItem.cart_id == cart.id).all()
-        cart_total = sum(item.product.price * item.quantity for item in cart_items)
-        cart_weight = sum(item.quantity * item.product.weight_grams for item in cart_items) / 1000  # Convert to kg
-        
-        total_amount += cart_total
-        total_weight += cart_weight
-
-        club_user = ClubbedOrderUser(
-            id=generate_uuid(),
-            clubbed_order_id=new_clubbed_order.id,
-            user_id=buddy.user_id,
-            cart_id=buddy.cart_id,
-            discount_given=0.05  # Example: 5% discount
-        )
-        db.add(club_user)
-
-        # Update buddy status
-        buddy.status = BuddyStatus.MATCHED.value
-        
-        # Deactivate the user's cart - This should happen after checkout, not here.
-        # cart.is_active = False
+    db.flush()  # The order row must exist before its children are inserted
 
-    new_clubbed_order.combined_value = total_amount
-    new_clubbed_order.combined_weight = total_weight
-    new_clubbed_order.total_discount = total_amount * Decimal('0.05')  # 5% discount
+    db.execute(insert(ClubbedOrderUser), [
+        {
+            "id": generate_uuid(),
+            "clubbed_order_id": new_clubbed_order.id,
+            "user_id": user_id,
+            "cart_id": cart_id,
+            "discount_given": CLUB_DISCOUNT_RATE
+        }
+        for user_id, cart_id in members
+    ])
+    db.execute(insert(UserOrder), _user_order_rows(new_clubbed_order.id, members, totals, commitment_deadline))
+    db.execute(
+        update(BuddyQueue)
+        .where(BuddyQueue.id.in_(buddy_ids))
+        .values(status=BuddyStatus.MATCHED.value)
+        .execution_options(synchronize_session=False)
+    )
+    # Carts stay active; they are deactivated after checkout, not at matching time
+    clubbed_order_id = new_clubbed_order.id
     db.commit()
-    db.refresh(new_clubbed_order)
-    
-    # Automatically initialize split payment process
-    try:
-        print(f"DEBUG: Auto-initializing split payment for clubbed order {new_clubbed_order.id}")
-        user_orders = create_user_orders_for_clubbed_order(db, new_clubbed_order.id)
-        if user_orders:
-            print(f"DEBUG: Created {len(user_orders)} user orders with payment deadline")
-        else:
-            print(f"DEBUG: Failed to create user orders")
-    except Exception as e:
-        print(f"DEBUG: Error auto-initializing split payment: {str(e)}")
-        # Don't fail the entire clubbed order creation if split payment fails
-        pass
-    
+
+    logger.info(f"Created clubbed order {clubbed_order_id} for {len(members)} users with payment deadline {commitment_deadline}")
     return new_clubbed_order
 
 
@@ -459,153 +495,251 @@ def get_clubbed_order_details(db: Session, clubbed_order_id: str, requesting_use
     """
     Get details of a clubbed order, ensuring the requesting user is part of it.
     Returns anonymized data to protect privacy.
+
+    Served from the shared clubbed order snapshot; only the requesting
+    member's projection of it is returned.
     """
-    # First, check if the user is part of this clubbed order
-    user_in_club = db.query(ClubbedOrderUser).filter(
-        ClubbedOrderUser.clubbed_order_id == clubbed_order_id,
-        ClubbedOrderUser.user_id == requesting_user_id
-    ).first()
+    snapshot = get_clubbed_order_snapshot(db, clubbed_order_id)
 
-    if not user_in_club:
+    # Check if the user is part of this clubbed order
+    if not snapshot or not snapshot.member(requesting_user_id):
         return None, [], [], 0.0
 
-    clubbed_order = db.query(ClubbedOrder).filter(ClubbedOrder.id == clubbed_order_id).first()
-    
-    # Get all users in this clubbed order
-    club_users_assoc = db.query(ClubbedOrderUser).filter(ClubbedOrderUser.clubbed_order_id == clubbed_order_id).all()
-    user_ids = [cua.user_id for cua in club_users_assoc]
-    users = db.query(User).filter(User.id.in_(user_ids)).all()
-
-    # Get current user's items only (for privacy)
-    current_user_cart_id = user_in_club.cart_id
-    current_user_items_query = db.query(CartItem, User.name.label("added_by_user")).join(
-        Cart, CartItem.cart_id == Cart.id
-    ).join(
-        User, Cart.user_id == User.id
-    ).filter(CartItem.cart_id == current_user_cart_id)
-    
-    current_user_items = current_user_items_query.all()
+    anonymized_users, formatted_items, other_users_total = snapshot.project_for(requesting_user_id)
+    return snapshot, anonymized_users, formatted_items, other_users_total
 
-    # Format current user's items for the response
-    formatted_items = [
-        {
-            "product_name": item.product.name,
-            "quantity": item.quantity,
-            "price": float(item.product.price),  # Convert Decimal to float
-            "added_by_user": "You"
+
+def add_item_to_clubbed_cart(db: Session, clubbed_order_id: str, user_id: str, item: CartItemCreate,
+                             user_name: str):
+    """
+    Adds an item to a user's original cart that is part of a clubbed order.
+
+    The clubbed order totals are moved by the added item's delta rather than
+    recomputed from every member cart. The update is guarded by the order's
+    version column; if another member's add commits first, the whole
+    transaction is retried. Item, stock and totals commit together.
+    """
+    for attempt in range(CLUBBED_ORDER_UPDATE_RETRIES):
+        # Find the user's cart in this clubbed order and the order version it was read at
+        membership = db.query(ClubbedOrderUser.cart_id, ClubbedOrder.version).join(
+            ClubbedOrder, ClubbedOrder.id == ClubbedOrderUser.clubbed_order_id
+        ).filter(
+            ClubbedOrderUser.clubbed_order_id == clubbed_order_id,
+            ClubbedOrderUser.user_id == user_id
+        ).first()
+
+        if not membership:
+            return None # User is not part of this clubbed order
+
+        cart_id, version = membership
+
+        # Add item to the user's original cart
+        staged = _stage_cart_item(db, cart_id, item)
+        if not staged:
+            db.rollback()
+            return None
+
+        cart_item, product = staged
+        value_delta = product.price * item.quantity
+        weight_delta = Decimal(item.quantity * product.weight_grams) / 1000
+        response = {
+            "product_name": product.name,
+            "quantity": cart_item.quantity,
+            "price": product.price,
+            "added_by_user": user_name
         }
-        for item, added_by_user in current_user_items
-    ]
 
-    # Calculate anonymized user data
-    anonymized_users = []
-    other_users_total = 0.0
-    
-    for i, cua in enumerate(club_users_assoc):
-        # Get cart total for this user - using same calculation method as create_clubbed_order
-        cart_items = db.query(CartItem).filter(CartItem.cart_id == cua.cart_id).all()
-        cart_total = float(sum(item.product.price * item.quantity for item in cart_items))
-        item_count = len(cart_items)
-        
-        is_current_user = cua.user_id == requesting_user_id
-        
-        anonymized_users.append({
-            "user_id": "You" if is_current_user else f"User {i + 1}",
-            "cart_total": cart_total,
-            "item_count": item_count,
-            "is_current_user": is_current_user
-        })
-        
-        if not is_current_user:
-            other_users_total += cart_total
+        updated = db.execute(
+            update(ClubbedOrder)
+            .where(ClubbedOrder.id == clubbed_order_id, ClubbedOrder.version == version)
+            .values(
+                combined_value=func.coalesce(ClubbedOrder.combined_value, 0) + value_delta,
+                combined_weight=func.coalesce(ClubbedOrder.combined_weight, 0) + weight_delta,
+                total_discount=func.coalesce(ClubbedOrder.total_discount, 0) + value_delta * CLUB_DISCOUNT_RATE,
+                version=ClubbedOrder.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
 
-    return clubbed_order, anonymized_users, formatted_items, other_users_total
+        if updated:
+            db.commit()
+            invalidate_product(product.id)
+            invalidate_clubbed_order(clubbed_order_id)
+            return response
 
+        # Another member changed the order since we read it; start over
+        db.rollback()
+        logger.info(f"Clubbed order {clubbed_order_id} changed concurrently, retrying add (attempt {attempt + 1})")
 
-def add_item_to_clubbed_cart(db: Session, clubbed_order_id: str, user_id: str, item: CartItemCreate):
-    """
-    Adds an item to a user's original cart that is part of a clubbed order.
-    """
-    # Find the user's association to the clubbed order to get their cart_id
-    club_user_assoc = db.query(ClubbedOrderUser).filter(
-        ClubbedOrderUser.clubbed_order_id == clubbed_order_id,
-        ClubbedOrderUser.user_id == user_id
-    ).first()
+    raise StaleClubbedOrderError(f"Clubbed order {clubbed_order_id} is being updated concurrently")
 
-    if not club_user_assoc:
-        return None # User is not part of this clubbed order
 
-    # Add item to the user's original cart
-    cart_item = add_item_to_cart(db, club_user_assoc.cart_id, item)
-    if not cart_item:
+def _clubbed_order_location(db: Session, clubbed_order_id: str) -> Optional[tuple]:
+    """Centroid of the members' queued locations, used as the pickup point"""
+    lat, lng = db.query(func.avg(BuddyQueue.lat), func.avg(BuddyQueue.lng)).join(
+        ClubbedOrderUser, ClubbedOrderUser.cart_id == BuddyQueue.cart_id
+    ).filter(ClubbedOrderUser.clubbed_order_id == clubbed_order_id).one()
+    if lat is None or lng is None:
         return None
+    return float(lat), float(lng)
 
-    # Recalculate the total amount for the clubbed order
-    clubbed_order = db.query(ClubbedOrder).filter(ClubbedOrder.id == clubbed_order_id).first()
-    
-    # Get all carts in this clubbed order
-    club_users_assoc = db.query(ClubbedOrderUser).filter(ClubbedOrderUser.clubbed_order_id == clubbed_order_id).all()
-    cart_ids = [cua.cart_id for cua in club_users_assoc]
-    
-    total_amount = 0
-    total_weight = 0
-    for cart_id in cart_ids:
-        cart_total, cart_weight = calculate_cart_totals(db, cart_id)
-        total_amount += cart_total
-        total_weight += cart_weight
-        
-    clubbed_order.combined_value = total_amount
-    clubbed_order.combined_weight = total_weight
-    clubbed_order.total_discount = total_amount * Decimal('0.05')  # Recalculate 5% discount
-    db.commit()
-    db.refresh(clubbed_order)
 
-    return {
-        "product_name": cart_item.product.name,
-        "quantity": cart_item.quantity,
-        "price": cart_item.product.price,
-        "added_by_user": db.query(User).filter(User.id == user_id).first().name
-    }
+def reserve_driver_capacity(db: Session, driver_id: str, weight) -> bool:
+    """
+    Add `weight` to a driver's load only if the driver is still AVAILABLE and
+    the load fits, in one conditional UPDATE; the driver turns BUSY once it
+    reaches 90% of capacity. Returns False when another assignment got there
+    first. Does not commit.
+    """
+    drivers = Driver.__table__
+    new_load = drivers.c.current_load + weight
+    # status is assigned first and reads the pre-update load on every backend
+    reserved = db.execute(
+        drivers.update().where(
+            drivers.c.id == driver_id,
+            drivers.c.status == DriverStatus.AVAILABLE.name,
+            new_load <= drivers.c.max_capacity
+        ).ordered_values(
+            (drivers.c.status, case(
+                (new_load >= drivers.c.max_capacity * Decimal("0.9"), DriverStatus.BUSY.name),  # 90% capacity threshold
+                else_=drivers.c.status
+            )),
+            (drivers.c.current_load, new_load),
+        )
+    ).rowcount
+    return reserved == 1
+
+
+def _candidate_drivers(db: Session, location: Optional[tuple], weight):
+    """
+    Driver ids to try, best first: the nearest indexed drivers with room for
+    `weight`, then (no located driver nearby, or no pickup point) the least
+    loaded drivers with capacity.
+    """
+    tried = set()
+    if location:
+        ensure_driver_index(db)
+        for _ in range(DRIVER_ASSIGNMENT_ATTEMPTS):
+            candidate = driver_index.nearest(location[0], location[1], weight, exclude=tried)
+            if candidate is None:
+                break
+            tried.add(candidate[0])
+            yield candidate[0]
+
+    fallback = db.query(Driver.id).filter(
+        and_(
+            Driver.status == DriverStatus.AVAILABLE.value,
+            Driver.current_load + weight <= Driver.max_capacity
+        )
+    ).order_by(Driver.current_load).limit(DRIVER_ASSIGNMENT_ATTEMPTS + len(tried)).all()
+    for (driver_id,) in fallback:
+        if driver_id not in tried:
+            yield driver_id
 
 
 def assign_driver_to_order(db: Session, clubbed_order_id: str, driver_id: int = None):
-    """Assign the best available driver to a clubbed order"""
+    """
+    Assign the nearest available driver with room for the order. Capacity is
+    reserved with a conditional UPDATE; when a concurrent assignment filled
+    the candidate first, the next candidate is tried.
+    """
     clubbed_order = db.query(ClubbedOrder).filter(ClubbedOrder.id == clubbed_order_id).first()
     if not clubbed_order:
         return None
+    weight = clubbed_order.combined_weight or 0
     
-    # Find driver with sufficient capacity
-    available_drivers = db.query(Driver).filter(
-        and_(
-            Driver.status == DriverStatus.AVAILABLE.value,
-            Driver.current_load + (clubbed_order.combined_weight or 0) <= Driver.max_capacity
-        )
-    ).order_by(Driver.current_load).all()
+    assigned_driver_id = None
+    stale = []
+    for candidate in _candidate_drivers(db, _clubbed_order_location(db, clubbed_order_id), weight):
+        if reserve_driver_capacity(db, candidate, weight):
+            assigned_driver_id = candidate
+            break
+        # The index was out of date for this driver
+        stale.append(candidate)
     
-    if not available_drivers:
+    if assigned_driver_id is None:
+        db.rollback()
+        sync_drivers(db, stale)
         return None
     
-    driver = available_drivers[0]
-    
     # Create delivery
     delivery = Delivery(
         id=generate_uuid(),
-        driver_id=driver.id,
+        driver_id=assigned_driver_id,
         clubbed_order_id=clubbed_order_id,
         estimated_delivery=datetime.utcnow() + timedelta(minutes=30)  # 30 minutes from now
     )
     db.add(delivery)
     
-    # Update driver status and load
-    driver.current_load += (clubbed_order.combined_weight or 0)
-    if driver.current_load >= driver.max_capacity * 0.9:  # 90% capacity threshold
-        driver.status = DriverStatus.BUSY.value
-    
     # Update order status
     clubbed_order.status = OrderStatus.PREPARING.value
     
     db.commit()
+    invalidate_clubbed_order(clubbed_order_id)
+    sync_drivers(db, [assigned_driver_id, *stale])
     db.refresh(delivery)
+    publish_delivery_event(delivery, OrderStatus.PREPARING)
+    return delivery
+
+# Order status each delivery status moves the clubbed order to
+DELIVERY_ORDER_STATUS = {
+    DeliveryStatus.ASSIGNED: OrderStatus.PREPARING,
+    DeliveryStatus.IN_TRANSIT: OrderStatus.DISPATCHED,
+    DeliveryStatus.DELIVERED: OrderStatus.DELIVERED,
+}
+
+def publish_delivery_event(delivery: Delivery, order_status: OrderStatus):
+    """Tell everyone tracking the delivery's clubbed order about its current status"""
+    event_bus.publish(delivery.clubbed_order_id, {
+        "type": "delivery_status",
+        "delivery_id": delivery.id,
+        "driver_id": delivery.driver_id,
+        "status": DeliveryStatus(delivery.status).value,
+        "order_status": order_status.value,
+        "estimated_delivery": delivery.estimated_delivery,
+        "actual_delivery": delivery.actual_delivery,
+    })
+
+def update_delivery_status(db: Session, delivery_id: str, new_status: DeliveryStatus) -> Optional[Delivery]:
+    """
+    Move a delivery forward (ASSIGNED -> IN_TRANSIT -> DELIVERED) and its
+    clubbed order along with it, then publish the transition to the order's
+    trackers. The conditional UPDATE only matches earlier statuses, so
+    repeated or out-of-order reports change nothing. Returns the delivery in
+    its current state, or None when it does not exist.
+    """
+    new_status = DeliveryStatus(new_status)
+    statuses = list(DeliveryStatus)
+    earlier = [status.name for status in statuses[:statuses.index(new_status)]]
+    values = {"status": new_status.name}
+    if new_status == DeliveryStatus.DELIVERED:
+        values["actual_delivery"] = datetime.utcnow()
+    
+    deliveries = Delivery.__table__
+    changed = db.execute(
+        deliveries.update().where(
+            deliveries.c.id == delivery_id,
+            deliveries.c.status.in_(earlier)
+        ).values(**values)
+    ).rowcount == 1
+    
+    delivery = db.query(Delivery).filter(Delivery.id == delivery_id).first()
+    if delivery is None:
+        db.rollback()
+        return None
+    
+    order_status = DELIVERY_ORDER_STATUS[new_status]
+    if changed:
+        db.execute(
+            update(ClubbedOrder)
+            .where(ClubbedOrder.id == delivery.clubbed_order_id, ClubbedOrder.status != OrderStatus.CANCELLED.name)
+            .values(status=order_status.name)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    if changed:
+        invalidate_clubbed_order(delivery.clubbed_order_id)
+        publish_delivery_event(delivery, order_status)
     return delivery
 
 # Get user orders
@@ -655,6 +789,7 @@ def cleanup_old_buddy_entries(db: Session, hours_old: int = 24):
 def clear_cart(db: Session, cart_id: str):
     """Clear all items from a cart and restore stock"""
     cart_items = db.query(CartItem).filter(CartItem.cart_id == cart_id).all()
+    product_ids = {cart_item.product_id for cart_item in cart_items}
     
     # Restore stock for all items
     for cart_item in cart_items:
@@ -666,6 +801,9 @@ def clear_cart(db: Session, cart_id: str):
     # Delete all cart items
     db.query(CartItem).filter(CartItem.cart_id == cart_id).delete()
     db.commit()
+    for product_id in product_ids:
+        invalidate_product(product_id)
+    invalidate_cart(cart_id)
     
     return len(cart_items)  # Return number of items removed
 
@@ -686,201 +824,371 @@ def delete_cart(db: Session, cart_id: str):
 
 def create_user_orders_for_clubbed_order(db: Session, clubbed_order_id: str) -> List[UserOrder]:
     """
-    Create individual user orders for each user in a clubbed order
+    Create individual user orders for each user in a clubbed order.
+
+    create_clubbed_order normally creates them already; then, and on any
+    repeated call, the existing user orders are returned unchanged. The
+    clubbed order row is locked so concurrent calls cannot both insert.
     """
     
     try:
         # Get clubbed order
-        clubbed_order = db.query(ClubbedOrder).filter(ClubbedOrder.id == clubbed_order_id).first()
+        clubbed_order = db.query(ClubbedOrder).filter(
+            ClubbedOrder.id == clubbed_order_id
+        ).with_for_update().first()
         if not clubbed_order:
             return []
         
+        existing = db.query(UserOrder).filter(UserOrder.clubbed_order_id == clubbed_order_id).all()
+        if existing:
+            db.commit()
+            return existing
+        
         # Get all users in this clubbed order
-        clubbed_users = db.query(ClubbedOrderUser).filter(
+        members = db.query(ClubbedOrderUser.user_id, ClubbedOrderUser.cart_id).filter(
             ClubbedOrderUser.clubbed_order_id == clubbed_order_id
         ).all()
+        if not members:
+            return []
         
-        user_orders = []
-        commitment_deadline = datetime.utcnow() + timedelta(minutes=10)  # 10 minutes to commit
-        print(f"DEBUG: Setting commitment deadline to: {commitment_deadline}")
-        print(f"DEBUG: Current time: {datetime.utcnow()}")
-        
-        for clubbed_user in clubbed_users:
-            # Calculate individual total for this user
-            cart_items = db.query(CartItem).filter(CartItem.cart_id == clubbed_user.cart_id).all()
-            individual_total = sum(float(item.product.price) * item.quantity for item in cart_items)
-            
-            # Create user order
-            user_order = UserOrder(
-                id=generate_uuid(),
-                clubbed_order_id=clubbed_order_id,
-                user_id=clubbed_user.user_id,
-                cart_id=clubbed_user.cart_id,
-                individual_total=individual_total,
-                payment_method='ONLINE',  # Default, user can change
-                commitment_deadline=commitment_deadline,
-                delivery_address="",  # User must provide
-                delivery_phone=""  # User must provide
-            )
-            
-            db.add(user_order)
-            user_orders.append(user_order)
+        commitment_deadline = datetime.utcnow() + timedelta(minutes=COMMITMENT_WINDOW_MINUTES)
+        totals = get_cart_totals(db, [cart_id for _, cart_id in members])
+        rows = _user_order_rows(clubbed_order_id, members, totals, commitment_deadline)
+        db.execute(insert(UserOrder), rows)
         
-        # Update clubbed order status and deadline
+        # Update clubbed order status, deadline and member count; nobody has
+        # a user order yet, so the commit and confirm counters are still 0
         clubbed_order.status = OrderStatus.PAYMENT_PENDING
         clubbed_order.payment_confirmation_deadline = commitment_deadline
+        clubbed_order.member_count = len(rows)
         
         db.commit()
-        return user_orders
+        invalidate_clubbed_order(clubbed_order_id)
+        return db.query(UserOrder).filter(UserOrder.id.in_([row["id"] for row in rows])).all()
         
     except Exception as e:
         db.rollback()
         logger.error(f"Failed to create user orders: {str(e)}")
         return []
 
+class PaymentProgress(NamedTuple):
+    """Commitment and payment counters of a clubbed order"""
+    member_count: int
+    committed_count: int
+    confirmed_count: int
+
+    @property
+    def all_committed(self) -> bool:
+        return self.committed_count >= self.member_count
+
+    @property
+    def all_confirmed(self) -> bool:
+        return self.confirmed_count >= self.member_count
+
+def _payment_progress(db: Session, clubbed_order_id: str) -> Optional[PaymentProgress]:
+    row = db.query(
+        ClubbedOrder.member_count, ClubbedOrder.committed_count, ClubbedOrder.confirmed_count
+    ).filter(ClubbedOrder.id == clubbed_order_id).first()
+    return PaymentProgress(*row) if row else None
+
 def commit_to_payment(db: Session, user_order_id: str, payment_method: str, 
                      delivery_address: str, delivery_phone: str, 
-                     special_instructions: str = None) -> bool:
+                     special_instructions: str = None) -> Optional[PaymentProgress]:
     """
-    User commits to payment and provides delivery details
+    User commits to payment and provides delivery details.
+
+    Returns the clubbed order's progress, or None if the commitment failed.
+    The clubbed order's committed_count is bumped only when this call moves
+    the user order to committed, so retries and races cannot double count.
     """
     
     try:
         user_order = db.query(UserOrder).filter(UserOrder.id == user_order_id).first()
         if not user_order:
-            return False
+            return None
         
         # Check if commitment deadline has passed
-        if datetime.utcnow() > user_order.commitment_deadline:
-            return False
-        
-        # Update user order with commitment
-        user_order.payment_method = payment_method
-        user_order.delivery_address = delivery_address
-        user_order.delivery_phone = delivery_phone
-        user_order.special_instructions = special_instructions
-        user_order.is_committed = True
-        user_order.committed_at = datetime.utcnow()
+        now = datetime.utcnow()
+        if now > user_order.commitment_deadline:
+            return None
         
-        db.commit()
+        clubbed_order_id = user_order.clubbed_order_id
+        details = {
+            "payment_method": payment_method,
+            "delivery_address": delivery_address,
+            "delivery_phone": delivery_phone,
+            "special_instructions": special_instructions,
+        }
+        newly_committed = db.execute(
+            update(UserOrder)
+            .where(UserOrder.id == user_order_id, UserOrder.is_committed == False)
+            .values(is_committed=True, committed_at=now, **details)
+            .execution_options(synchronize_session=False)
+        ).rowcount
         
-        # Check if all users have committed
-        check_all_commitments(db, user_order.clubbed_order_id)
+        if newly_committed:
+            # Last commitment opens the payment confirmation window
+            all_committed = ClubbedOrder.committed_count + 1 >= ClubbedOrder.member_count
+            db.execute(
+                update(ClubbedOrder)
+                .where(ClubbedOrder.id == clubbed_order_id)
+                .ordered_values(
+                    (ClubbedOrder.payment_confirmation_deadline, case(
+                        (and_(all_committed, ClubbedOrder.status == OrderStatus.PAYMENT_PENDING.name),
+                         now + timedelta(minutes=30)),
+                        else_=ClubbedOrder.payment_confirmation_deadline
+                    )),
+                    (ClubbedOrder.committed_count, ClubbedOrder.committed_count + 1),
+                )
+                .execution_options(synchronize_session=False)
+            )
+        else:
+            # Already committed: only refresh the delivery details
+            db.execute(
+                update(UserOrder)
+                .where(UserOrder.id == user_order_id)
+                .values(**details)
+                .execution_options(synchronize_session=False)
+            )
         
-        return True
+        progress = _payment_progress(db, clubbed_order_id)
+        db.commit()
+        invalidate_clubbed_order(clubbed_order_id)
+        return progress
         
     except Exception as e:
         db.rollback()
         logger.error(f"Failed to commit to payment: {str(e)}")
-        return False
+        return None
+
+def _count_confirmations(db: Session, confirmed: dict, now: datetime):
+    """
+    Add newly confirmed members to clubbed orders, given as
+    {clubbed_order_id: count}, with one executemany UPDATE. The update that
+    reaches member_count also marks the order PAYMENT_CONFIRMED.
+    """
+    orders = ClubbedOrder.__table__
+    increment = bindparam("confirmed", type_=Integer)
+    all_confirmed = orders.c.confirmed_count + increment >= orders.c.member_count
+    # The counter goes last so every CASE reads its pre-update value
+    stmt = orders.update().where(
+        orders.c.id == bindparam("clubbed_order_id")
+    ).ordered_values(
+        (orders.c.status, case(
+            (all_confirmed, OrderStatus.PAYMENT_CONFIRMED.name), else_=orders.c.status
+        )),
+        (orders.c.all_payments_confirmed, case(
+            (all_confirmed, True), else_=orders.c.all_payments_confirmed
+        )),
+        (orders.c.order_confirmed_at, case(
+            (all_confirmed, now), else_=orders.c.order_confirmed_at
+        )),
+        (orders.c.confirmed_count, orders.c.confirmed_count + increment),
+    )
+    db.execute(stmt, [
+        {"clubbed_order_id": clubbed_order_id, "confirmed": count}
+        for clubbed_order_id, count in confirmed.items()
+    ])
 
 def confirm_payment(db: Session, user_order_id: str, external_transaction_id: str = None,
-                   payment_gateway: str = None) -> bool:
+                   payment_gateway: str = None) -> Optional[PaymentProgress]:
     """
-    Confirm payment for a user order
+    Confirm payment for a user order.
+
+    Returns the clubbed order's progress, or None if the confirmation failed.
+    Only a PENDING user order of a clubbed order that has not been cancelled
+    can be confirmed; confirming an already confirmed one returns the
+    progress unchanged. The confirmation that completes the group marks the
+    clubbed order PAYMENT_CONFIRMED in the same UPDATE that bumps
+    confirmed_count; the PAYMENT transaction row is written by the outbox
+    worker.
     """
     try:
         user_order = db.query(UserOrder).filter(UserOrder.id == user_order_id).first()
         if not user_order:
-            return False
+            return None
         
-        # Update payment status
-        user_order.payment_status = 'CONFIRMED'
-        user_order.payment_confirmed_at = datetime.utcnow()
+        now = datetime.utcnow()
+        clubbed_order_id = user_order.clubbed_order_id
         
-        # Create payment transaction record
-        transaction = PaymentTransaction(
-            id=generate_uuid(),
-            user_order_id=user_order_id,
-            user_id=user_order.user_id,
-            transaction_type='PAYMENT',
-            amount=user_order.individual_total,
-            payment_method=user_order.payment_method,
-            external_transaction_id=external_transaction_id,
-            payment_gateway=payment_gateway,
-            status='SUCCESS',
-            processed_at=datetime.utcnow()
-        )
-        
-        db.add(transaction)
-        db.commit()
+        # Update payment status; confirmed payments and cancelled groups are left alone
+        payable_group = select(ClubbedOrder.id).where(
+            ClubbedOrder.id == UserOrder.clubbed_order_id,
+            ClubbedOrder.status != OrderStatus.CANCELLED
+        ).exists()
+        newly_confirmed = db.execute(
+            update(UserOrder)
+            .where(UserOrder.id == user_order_id, UserOrder.payment_status == 'PENDING', payable_group)
+            .values(payment_status='CONFIRMED', payment_confirmed_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not newly_confirmed:
+            payment_status = db.query(UserOrder.payment_status).filter(UserOrder.id == user_order_id).scalar()
+            if payment_status != 'CONFIRMED':
+                db.rollback()
+                return None
         
-        # Check if all payments are confirmed
-        check_all_payments_confirmed(db, user_order.clubbed_order_id)
+        if newly_confirmed:
+            # The payment transaction record is written by the outbox worker;
+            # repeat confirmations record nothing
+            outbox.enqueue(db, "payment.confirmed", {
+                "user_order_id": user_order_id,
+                "user_id": user_order.user_id,
+                "amount": str(user_order.individual_total),
+                "payment_method": user_order.payment_method,
+                "external_transaction_id": external_transaction_id,
+                "payment_gateway": payment_gateway,
+                "confirmed_at": now.isoformat()
+            }, aggregate_id=clubbed_order_id)
+            _count_confirmations(db, {clubbed_order_id: 1}, now)
         
-        return True
+        progress = _payment_progress(db, clubbed_order_id)
+        db.commit()
+        invalidate_clubbed_order(clubbed_order_id)
+        return progress
         
     except Exception as e:
         db.rollback()
         logger.error(f"Failed to confirm payment: {str(e)}")
-        return False
+        return None
+
+@outbox.handler("payment.confirmed")
+def _handle_payment_confirmed(db: Session, payload: dict):
+    """Record the PAYMENT transaction for a confirmation; one row per event"""
+    transaction_id = outbox.derived_id(payload["event_id"], "payment")
+    if db.get(PaymentTransaction, transaction_id):
+        return
+    row = {
+        "id": transaction_id,
+        "user_order_id": payload["user_order_id"],
+        "user_id": payload["user_id"],
+        "transaction_type": 'PAYMENT',
+        "amount": Decimal(payload["amount"]),
+        "payment_method": payload["payment_method"],
+        "external_transaction_id": payload["external_transaction_id"],
+        "payment_gateway": payload["payment_gateway"],
+        "status": 'SUCCESS',
+        "processed_at": datetime.fromisoformat(payload["confirmed_at"])
+    }
+    db.add(PaymentTransaction(**row))
+    apply_ledger_rows(db, [row])
 
 def check_all_commitments(db: Session, clubbed_order_id: str) -> bool:
     """
     Check if all users have committed to their payments
     """
-    try:
-        user_orders = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id
-        ).all()
-        
-        all_committed = all(order.is_committed for order in user_orders)
-        
-        if all_committed:
-            # Update clubbed order status
-            clubbed_order = db.query(ClubbedOrder).filter(
-                ClubbedOrder.id == clubbed_order_id
-            ).first()
-            
-            if clubbed_order and clubbed_order.status == OrderStatus.PAYMENT_PENDING:
-                # Extend deadline for payment confirmation
-                from datetime import timedelta
-                clubbed_order.payment_confirmation_deadline = datetime.utcnow() + timedelta(minutes=30)
-                db.commit()
-        
-        return all_committed
-        
-    except Exception as e:
-        logger.error(f"Failed to check commitments: {str(e)}")
-        return False
+    progress = _payment_progress(db, clubbed_order_id)
+    return bool(progress and progress.all_committed)
 
 def check_all_payments_confirmed(db: Session, clubbed_order_id: str) -> bool:
     """
     Check if all users have confirmed their payments
     """
-    try:
-        user_orders = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id
-        ).all()
-        
-        all_confirmed = all(order.payment_status == 'CONFIRMED' for order in user_orders)
-        
-        if all_confirmed:
-            # Update clubbed order
-            clubbed_order = db.query(ClubbedOrder).filter(
-                ClubbedOrder.id == clubbed_order_id
-            ).first()
-            
-            if clubbed_order:
-                clubbed_order.status = OrderStatus.PAYMENT_CONFIRMED
-                clubbed_order.all_payments_confirmed = True
-                clubbed_order.order_confirmed_at = datetime.utcnow()
-                
-                # Assign delivery driver (placeholder for now)
-                # assign_delivery_driver(db, clubbed_order_id)
-                
-                db.commit()
-        
-        return all_confirmed
-        
-    except Exception as e:
-        logger.error(f"Failed to check payment confirmations: {str(e)}")
-        return False
+    progress = _payment_progress(db, clubbed_order_id)
+    return bool(progress and progress.all_confirmed)
+
+def apply_payment_confirmations(db: Session, confirmations: List[dict]) -> dict:
+    """
+    Apply a batch of gateway settlement callbacks.
+
+    Each confirmation is a dict with user_order_id, external_transaction_id
+    and payment_gateway. The user orders are resolved with one locking
+    query; committed, still pending orders of groups that have not been
+    cancelled are confirmed with one set-based
+    UPDATE, their PAYMENT transactions are bulk inserted, and group
+    completion is recomputed once per affected clubbed order. Everything
+    commits together. Duplicates (already confirmed, or repeated in the
+    batch), unknown ids and orders that cannot be paid are reported, not
+    applied.
+    """
+    by_order = {}
+    for confirmation in confirmations:
+        by_order.setdefault(confirmation["user_order_id"], confirmation)
+    result = {
+        "received": len(confirmations),
+        "confirmed": 0,
+        "duplicates": len(confirmations) - len(by_order),
+        "unknown": [],
+        "rejected": [],
+        "completed_clubbed_orders": []
+    }
+    if not by_order:
+        return result
+
+    now = datetime.utcnow()
+    user_orders = db.query(
+        UserOrder.id, UserOrder.user_id, UserOrder.clubbed_order_id, UserOrder.individual_total,
+        UserOrder.payment_method, UserOrder.payment_status, UserOrder.is_committed, ClubbedOrder.status
+    ).join(
+        ClubbedOrder, ClubbedOrder.id == UserOrder.clubbed_order_id
+    ).filter(UserOrder.id.in_(list(by_order))).with_for_update().all()
+
+    found = set()
+    payable = []
+    for user_order in user_orders:
+        found.add(user_order.id)
+        if user_order.payment_status == 'CONFIRMED':
+            result["duplicates"] += 1
+        # Same rule as confirm_payment: cancelled groups take no payments
+        elif (user_order.payment_status != 'PENDING' or not user_order.is_committed
+              or user_order.status == OrderStatus.CANCELLED):
+            result["rejected"].append(user_order.id)
+        else:
+            payable.append(user_order)
+    result["unknown"] = [user_order_id for user_order_id in by_order if user_order_id not in found]
+
+    if payable:
+        db.execute(
+            update(UserOrder)
+            .where(UserOrder.id.in_([user_order.id for user_order in payable]), UserOrder.payment_status == 'PENDING')
+            .values(payment_status='CONFIRMED', payment_confirmed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        ledger_rows = [
+            {
+                "id": generate_uuid(),
+                "user_order_id": user_order.id,
+                "user_id": user_order.user_id,
+                "transaction_type": 'PAYMENT',
+                "amount": user_order.individual_total,
+                "payment_method": user_order.payment_method,
+                "external_transaction_id": by_order[user_order.id].get("external_transaction_id"),
+                "payment_gateway": by_order[user_order.id].get("payment_gateway"),
+                "status": 'SUCCESS',
+                "processed_at": now,
+                "created_at": now
+            }
+            for user_order in payable
+        ]
+        db.execute(insert(PaymentTransaction), ledger_rows)
+        apply_ledger_rows(db, ledger_rows)
+
+        confirmed_per_order = {}
+        for user_order in payable:
+            confirmed_per_order[user_order.clubbed_order_id] = confirmed_per_order.get(user_order.clubbed_order_id, 0) + 1
+        _count_confirmations(db, confirmed_per_order, now)
+
+        result["confirmed"] = len(payable)
+        result["completed_clubbed_orders"] = [
+            clubbed_order_id for (clubbed_order_id,) in db.query(ClubbedOrder.id).filter(
+                ClubbedOrder.id.in_(list(confirmed_per_order)),
+                ClubbedOrder.confirmed_count >= ClubbedOrder.member_count
+            )
+        ]
+
+    db.commit()
+    for clubbed_order_id in {user_order.clubbed_order_id for user_order in payable}:
+        invalidate_clubbed_order(clubbed_order_id)
+    return result
 
 def cancel_user_order(db: Session, user_order_id: str, cancelled_by_user_id: str, 
                      reason: str = 'USER_WITHDREW') -> Optional[OrderCancellation]:
     """
-    Cancel a user order and handle penalties/compensation
+    Cancel a user order and handle penalties/compensation.
+
+    The cancellation, the cascade to the whole clubbed order and an
+    "order.cancelled" outbox event are committed together; penalty and
+    compensation rows are written by the outbox worker.
     """
     try:
         user_order = db.query(UserOrder).filter(UserOrder.id == user_order_id).first()
@@ -908,13 +1216,15 @@ def cancel_user_order(db: Session, user_order_id: str, cancelled_by_user_id: str
         
         db.add(cancellation)
         
-        # Update user order status
-        user_order.payment_status = 'CANCELLED'
-        
-        # Cancel the entire clubbed order
+        # Cancel the entire clubbed order, including this user order
         cancel_entire_clubbed_order(db, user_order.clubbed_order_id, cancellation.id)
         
         db.commit()
+        invalidate_clubbed_order(cancellation.clubbed_order_id)
+        event_bus.publish(cancellation.clubbed_order_id, {
+            "type": "order_status",
+            "order_status": OrderStatus.CANCELLED.value,
+        })
         return cancellation
         
     except Exception as e:
@@ -924,126 +1234,114 @@ def cancel_user_order(db: Session, user_order_id: str, cancelled_by_user_id: str
 
 def cancel_entire_clubbed_order(db: Session, clubbed_order_id: str, cancellation_id: str):
     """
-    Cancel the entire clubbed order when one user withdraws
+    Cancel the entire clubbed order when one user withdraws.
+
+    Stages two set-based UPDATEs and the compensation event; does not commit.
     """
-    try:
-        # Get all user orders for this clubbed order
-        user_orders = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id
-        ).all()
-        
-        # Cancel all other user orders
-        for user_order in user_orders:
-            if user_order.payment_status != 'CANCELLED':
-                user_order.payment_status = 'CANCELLED'
-        
-        # Update clubbed order status
-        clubbed_order = db.query(ClubbedOrder).filter(
-            ClubbedOrder.id == clubbed_order_id
-        ).first()
-        
-        if clubbed_order:
-            clubbed_order.status = OrderStatus.CANCELLED
-        
-        # Process compensation to other users
-        process_cancellation_compensation(db, clubbed_order_id, cancellation_id)
-        
-    except Exception as e:
-        logger.error(f"Failed to cancel clubbed order: {str(e)}")
+    # Cancel all user orders of the group
+    db.execute(
+        update(UserOrder)
+        .where(UserOrder.clubbed_order_id == clubbed_order_id, UserOrder.payment_status != 'CANCELLED')
+        .values(payment_status='CANCELLED')
+        .execution_options(synchronize_session=False)
+    )
+    
+    # Update clubbed order status
+    db.execute(
+        update(ClubbedOrder)
+        .where(ClubbedOrder.id == clubbed_order_id)
+        .values(status=OrderStatus.CANCELLED.name)
+        .execution_options(synchronize_session=False)
+    )
+    
+    # Compensation to other users is processed by the outbox worker
+    outbox.enqueue(db, "order.cancelled", {
+        "clubbed_order_id": clubbed_order_id,
+        "cancellation_id": cancellation_id
+    }, aggregate_id=clubbed_order_id)
+
+@outbox.handler("order.cancelled")
+def _handle_order_cancelled(db: Session, payload: dict):
+    process_cancellation_compensation(db, payload["clubbed_order_id"], payload["cancellation_id"])
 
 def process_cancellation_compensation(db: Session, clubbed_order_id: str, cancellation_id: str):
     """
-    Process compensation payments to users affected by cancellation
+    Process compensation payments to users affected by cancellation.
+
+    Stages the rows without committing. Safe to run more than once: the
+    processed flags short-circuit a rerun and row ids derive from the
+    cancellation, so a duplicate insert fails instead of paying twice.
     """
-    try:
-        cancellation = db.query(OrderCancellation).filter(
-            OrderCancellation.id == cancellation_id
-        ).first()
-        
-        if not cancellation or cancellation.compensation_processed:
-            return
-        
-        # Get all other user orders (excluding the one that was cancelled)
-        other_user_orders = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id,
-            UserOrder.id != cancellation.user_order_id
-        ).all()
-        
-        if other_user_orders:
-            # Divide compensation equally among other users
-            compensation_per_user = cancellation.compensation_amount / len(other_user_orders)
-            
-            for user_order in other_user_orders:
-                # Create compensation transaction
-                compensation_transaction = PaymentTransaction(
-                    id=generate_uuid(),
-                    user_order_id=user_order.id,
-                    user_id=user_order.user_id,
-                    transaction_type='COMPENSATION',
-                    amount=compensation_per_user,
-                    payment_method='WALLET',  # Credit to wallet
-                    status='SUCCESS',
-                    processed_at=datetime.utcnow()
-                )
-                
-                db.add(compensation_transaction)
-        
-        # Create penalty transaction for cancelling user
-        penalty_transaction = PaymentTransaction(
-            id=generate_uuid(),
-            user_order_id=cancellation.user_order_id,
-            user_id=cancellation.cancelled_by_user_id,
-            transaction_type='PENALTY',
-            amount=cancellation.cancellation_fee,
-            payment_method='ONLINE',  # Charge to user
-            status='PENDING',  # Will be processed by payment system
-            processed_at=datetime.utcnow()
+    cancellation = db.query(OrderCancellation).filter(
+        OrderCancellation.id == cancellation_id
+    ).first()
+    
+    if not cancellation or cancellation.compensation_processed:
+        return
+    
+    # Get all other user orders (excluding the one that was cancelled)
+    other_user_orders = db.query(UserOrder.id, UserOrder.user_id).filter(
+        UserOrder.clubbed_order_id == clubbed_order_id,
+        UserOrder.id != cancellation.user_order_id
+    ).all()
+    
+    now = datetime.utcnow()
+    rows = []
+    if other_user_orders:
+        # Divide compensation equally among other users, credited to their wallets
+        compensation_per_user = cancellation.compensation_amount / len(other_user_orders)
+        rows.extend(
+            {
+                "id": outbox.derived_id(cancellation_id, f"compensation:{other_order_id}"),
+                "user_order_id": other_order_id,
+                "user_id": other_user_id,
+                "transaction_type": 'COMPENSATION',
+                "amount": compensation_per_user,
+                "payment_method": 'WALLET',
+                "status": 'SUCCESS',
+                "processed_at": now,
+                "created_at": now
+            }
+            for other_order_id, other_user_id in other_user_orders
         )
-        
-        db.add(penalty_transaction)
-        
-        # Mark compensation as processed
-        cancellation.compensation_processed = True
-        cancellation.penalty_processed = True
-        
-        db.commit()
-        
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Failed to process compensation: {str(e)}")
+    
+    # Penalty transaction for cancelling user, charged by the payment system
+    rows.append({
+        "id": outbox.derived_id(cancellation_id, "penalty"),
+        "user_order_id": cancellation.user_order_id,
+        "user_id": cancellation.cancelled_by_user_id,
+        "transaction_type": 'PENALTY',
+        "amount": cancellation.cancellation_fee,
+        "payment_method": 'ONLINE',
+        "status": 'PENDING',
+        "processed_at": now,
+        "created_at": now
+    })
+    db.execute(insert(PaymentTransaction), rows)
+    apply_ledger_rows(db, rows)
+    
+    # Mark compensation as processed
+    cancellation.compensation_processed = True
+    cancellation.penalty_processed = True
 
 def get_split_payment_summary(db: Session, clubbed_order_id: str, user_id: str) -> Optional[dict]:
     """
     Get payment summary for a user in a clubbed order
     """
     try:
-        # Get user's order
-        user_order = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id,
-            UserOrder.user_id == user_id
-        ).first()
-        
-        if not user_order:
+        view = get_member_payment_view(db, clubbed_order_id, user_id)
+        if not view:
             return None
-        
-        # Get clubbed order
-        clubbed_order = db.query(ClubbedOrder).filter(
-            ClubbedOrder.id == clubbed_order_id
-        ).first()
-        
-        # Get all user orders for this clubbed order
-        all_user_orders = db.query(UserOrder).filter(
-            UserOrder.clubbed_order_id == clubbed_order_id
-        ).all()
+        member, group = view
         
         # Calculate totals
-        total_order_value = float(clubbed_order.combined_value)
-        your_portion = float(user_order.individual_total)
+        total_order_value = group.combined_value
+        your_portion = float(member.individual_total)
         other_users_portion = total_order_value - your_portion
         
         # Calculate delivery fee (shared equally)
         delivery_fee = 40.0  # Base delivery fee
-        delivery_fee_per_user = delivery_fee / len(all_user_orders)
+        delivery_fee_per_user = delivery_fee / group.member_count
         
         # Calculate discount (5% for clubbed orders)
         discount_applied = your_portion * 0.05
@@ -1052,9 +1350,8 @@ def get_split_payment_summary(db: Session, clubbed_order_id: str, user_id: str)
         final_amount = your_portion + delivery_fee_per_user - discount_applied
         
         # Check commitment status
-        confirmed_payments = sum(1 for order in all_user_orders if order.payment_status == 'CONFIRMED')
-        pending_payments = len(all_user_orders) - confirmed_payments
-        all_users_committed = all(order.is_committed for order in all_user_orders)
+        confirmed_payments = group.confirmed_count
+        pending_payments = group.member_count - confirmed_payments
         
         return {
             'clubbed_order_id': clubbed_order_id,
@@ -1064,8 +1361,8 @@ def get_split_payment_summary(db: Session, clubbed_order_id: str, user_id: str)
             'delivery_fee': delivery_fee_per_user,
             'discount_applied': discount_applied,
             'final_amount_to_pay': final_amount,
-            'payment_deadline': user_order.commitment_deadline.isoformat() + 'Z' if user_order.commitment_deadline else None,
-            'all_users_committed': all_users_committed,
+            'payment_deadline': member.commitment_deadline.isoformat() + 'Z' if member.commitment_deadline else None,
+            'all_users_committed': group.all_committed,
             'confirmed_payments': confirmed_payments,
             'pending_payments': pending_payments
         }
@@ -1073,3 +1370,122 @@ def get_split_payment_summary(db: Session, clubbed_order_id: str, user_id: str)
     except Exception as e:
         logger.error(f"Failed to get payment summary: {str(e)}")
         return None
+
+
+def _expired_payment_offenders(db: Session, now: datetime, batch_size: int, skip=()) -> dict:
+    """
+    Map clubbed_order_id -> (user_order_id, user_id) of the member who let a
+    deadline pass, oldest deadlines first, leaving out the clubbed orders in
+    `skip`. Both lookups are range scans on the deadline indexes, so the cost
+    follows the number of expired rows.
+    """
+    skipped = [UserOrder.clubbed_order_id.notin_(list(skip))] if skip else []
+    # Members who never committed before their commitment deadline
+    missed_commitments = db.query(
+        UserOrder.clubbed_order_id, UserOrder.id, UserOrder.user_id
+    ).filter(
+        UserOrder.payment_status == 'PENDING',
+        UserOrder.commitment_deadline < now,
+        UserOrder.is_committed == False,
+        *skipped
+    ).order_by(UserOrder.commitment_deadline).limit(batch_size).all()
+
+    # Committed members who did not pay before the clubbed order's confirmation
+    # deadline; matched groups already have a driver and are PREPARING
+    missed_payments = db.query(
+        UserOrder.clubbed_order_id, UserOrder.id, UserOrder.user_id
+    ).join(
+        ClubbedOrder, ClubbedOrder.id == UserOrder.clubbed_order_id
+    ).filter(
+        ClubbedOrder.status.in_((OrderStatus.PAYMENT_PENDING, OrderStatus.PREPARING)),
+        ClubbedOrder.payment_confirmation_deadline < now,
+        UserOrder.payment_status == 'PENDING',
+        UserOrder.is_committed == True,
+        *skipped
+    ).order_by(ClubbedOrder.payment_confirmation_deadline).limit(batch_size).all()
+
+    offenders = {}
+    for clubbed_order_id, user_order_id, user_id in missed_commitments + missed_payments:
+        offenders.setdefault(clubbed_order_id, (user_order_id, user_id))
+    return offenders
+
+def release_driver_capacity(db: Session, clubbed_order_ids: List[str]) -> List[str]:
+    """
+    Give back the load reserved on drivers by still-assigned deliveries of
+    cancelled clubbed orders. One aggregate read, one executemany UPDATE.
+    Returns the ids of the drivers whose load changed. Does not commit.
+    """
+    if not clubbed_order_ids:
+        return []
+
+    released = db.query(
+        Delivery.driver_id, func.sum(ClubbedOrder.combined_weight)
+    ).join(
+        ClubbedOrder, ClubbedOrder.id == Delivery.clubbed_order_id
+    ).filter(
+        Delivery.clubbed_order_id.in_(clubbed_order_ids),
+        Delivery.status == DeliveryStatus.ASSIGNED
+    ).group_by(Delivery.driver_id).all()
+    params = [
+        {"driver_id": driver_id, "released": weight}
+        for driver_id, weight in released if weight
+    ]
+    if not params:
+        return []
+
+    drivers = Driver.__table__
+    remaining_load = drivers.c.current_load - bindparam("released")
+    # status is assigned first and reads the pre-update load on every backend
+    stmt = drivers.update().where(
+        drivers.c.id == bindparam("driver_id")
+    ).ordered_values(
+        (drivers.c.status, case(
+            (and_(drivers.c.status == DriverStatus.BUSY.name, remaining_load < drivers.c.max_capacity * 0.9),
+             DriverStatus.AVAILABLE.name),
+            else_=drivers.c.status
+        )),
+        (drivers.c.current_load, case((remaining_load < 0, 0), else_=remaining_load)),
+    )
+    db.execute(stmt, params)
+    return [param["driver_id"] for param in params]
+
+def enforce_payment_deadlines(db: Session, now: Optional[datetime] = None,
+                              batch_size: int = PAYMENT_DEADLINE_BATCH_SIZE,
+                              failed: Optional[set] = None) -> int:
+    """
+    Cancel clubbed orders whose commitment or payment deadline has passed.
+
+    The member who missed the deadline is cancelled with reason TIMEOUT via
+    cancel_user_order, which cancels the rest of the group and settles
+    penalties; driver capacity held by the cancelled orders is then released
+    in bulk. Handles at most `batch_size` expired rows per call and returns
+    the number of clubbed orders cancelled.
+
+    Clubbed orders that could not be cancelled are added to `failed`, and
+    those already in it are skipped, so a sweep that passes the same set to
+    every batch gets past a group that keeps failing.
+    """
+    now = now or datetime.utcnow()
+    failed = set() if failed is None else failed
+    offenders = _expired_payment_offenders(db, now, batch_size, skip=failed)
+
+    cancelled = []
+    for clubbed_order_id, (user_order_id, user_id) in offenders.items():
+        if cancel_user_order(db, user_order_id, user_id, reason=CancellationReason.TIMEOUT.value):
+            cancelled.append(clubbed_order_id)
+        else:
+            failed.add(clubbed_order_id)
+            logger.warning(f"Could not cancel clubbed order {clubbed_order_id} after a missed deadline; "
+                           f"skipping it until the next sweep")
+
+    if cancelled:
+        try:
+            released = release_driver_capacity(db, cancelled)
+            db.commit()
+            sync_drivers(db, released)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to release driver capacity: {str(e)}")
+        logger.info(f"Cancelled {len(cancelled)} clubbed orders after missed payment deadlines")
+
+    return len(cancelled)
@@ -1,19 +1,147 @@
 from dotenv import load_dotenv
 
 load_dotenv()
-from sqlalchemy import create_engine
+from typing import Optional, Union, get_args, get_origin
+from pydantic import BaseModel
+from sqlalchemy import create_engine, func, inspect, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from app.models import Base
+from app.models import BASELINE_SCHEMA_VERSION, SCHEMA_VERSION, Base, SchemaVersion
+from app.pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_pool, pool_stats
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# asyncio drivers used by the async engine for each backend
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def async_database_url(url) -> str:
+    """The same database as `url`, through its asyncio driver"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No asyncio driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+# Explicit URL for the async engine, e.g. to use mysql+asyncmy instead of aiomysql
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+# Connection pool; size it to the threadpool (40 threads by default) across workers
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds a request waits for a connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Reconnect before MySQL's wait_timeout drops idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def engine_options(url, asynchronous: bool = False) -> dict:
+    """create_engine / create_async_engine arguments for `url`, with the pool settings above"""
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite":
+        # SQLite connections may be touched by several threadpool threads per request
+        options["connect_args"] = {"check_same_thread": False}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases live in a single connection; keep SQLAlchemy's pool for them
+            return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool if asynchronous else InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+instrument_pool(engine.pool)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the hot routers: requests wait on the database on the event
+# loop instead of holding one of the threadpool's threads
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, asynchronous=True))
+instrument_pool(async_engine.pool)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False)
+
+# Optional read replica for the heavy read-only routes (see app/read_replica.py).
+# Its async engine uses the same asyncio driver as the primary's.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+read_engine = None
+ReadSessionLocal = None
+async_read_engine = None
+AsyncReadSessionLocal = None
+if DATABASE_READ_URL:
+    read_engine = create_engine(DATABASE_READ_URL, **engine_options(DATABASE_READ_URL))
+    instrument_pool(read_engine.pool)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, info={"replica": True})
+    ASYNC_DATABASE_READ_URL = make_url(DATABASE_READ_URL).set(
+        drivername=make_url(ASYNC_DATABASE_URL).drivername
+    ).render_as_string(hide_password=False)
+    async_read_engine = create_async_engine(
+        ASYNC_DATABASE_READ_URL, **engine_options(ASYNC_DATABASE_READ_URL, asynchronous=True)
+    )
+    instrument_pool(async_read_engine.pool)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, class_=AsyncSession, autoflush=False, info={"replica": True}
+    )
+
+def is_replica(db) -> bool:
+    """Whether `db` reads from the replica; its rows may lag behind recent writes"""
+    return db.info.get("replica", False)
+
+def connection_pool_stats() -> dict:
+    return pool_stats(engine.pool)
+
+def async_connection_pool_stats() -> dict:
+    return pool_stats(async_engine.pool)
+
+def read_connection_pool_stats() -> Optional[dict]:
+    """Replica pool stats for both engines, or None when no replica is configured"""
+    if read_engine is None:
+        return None
+    return {"sync": pool_stats(read_engine.pool), "async": pool_stats(async_read_engine.pool)}
+
+def schema_version(conn) -> int:
+    """Highest schema version recorded in the database, 0 if it records none"""
+    if not inspect(conn).has_table(SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
 # Create tables
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    """
+    Create the schema on a new database. A database already at SCHEMA_VERSION
+    is left alone, so startup costs one query instead of a check per table.
+
+    A database that predates schema_version gets its missing tables and is
+    recorded at BASELINE_SCHEMA_VERSION; from then on, like any versioned
+    database behind SCHEMA_VERSION, it is only warned about until the
+    migrations bring it up to date.
+    """
+    with engine.connect() as conn:
+        version = schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            return
+        fresh = not inspect(conn).get_table_names()
+
+    if not version:
+        # create_all only adds missing tables; columns and indexes come from the migrations
+        Base.metadata.create_all(bind=engine)
+        version = SCHEMA_VERSION if fresh else BASELINE_SCHEMA_VERSION
+        with engine.begin() as conn:
+            conn.execute(SchemaVersion.__table__.insert().values(version=version))
+    if version < SCHEMA_VERSION:
+        logger.warning(
+            "Database schema is at version %s of %s; apply the database_*_migration.sql scripts after it",
+            version, SCHEMA_VERSION,
+        )
 
 # Dependency to get DB session
 def get_db():
@@ -22,3 +150,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """
+    AsyncSession dependency. crud functions are written against a sync
+    Session and run on it with `await db.run_sync(func, *args)`; their I/O
+    goes through the asyncio driver without blocking the event loop. Return
+    plain data or schemas from run_sync: lazy loads outside it fail.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def to_schema(schema, obj):
+    """
+    `schema.model_validate(obj)` for ORM objects inside run_sync. Every
+    attribute the schema reads is loaded here, in Python, first: a lazy load
+    or refresh triggered from inside pydantic-core switches greenlets midway
+    through validation, which corrupts its per-thread object pool.
+    """
+    return schema.model_validate(_load_fields(schema, obj))
+
+def _load_fields(annotation, value):
+    if value is None:
+        return None
+    origin = get_origin(annotation)
+    if origin is Union:
+        models = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _load_fields(models[0], value) if len(models) == 1 else value
+    if origin is list:
+        (item_type,) = get_args(annotation)
+        return [_load_fields(item_type, item) for item in value]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) and not isinstance(value, BaseModel):
+        return {
+            name: _load_fields(field.annotation, getattr(value, name))
+            for name, field in annotation.model_fields.items()
+            if hasattr(value, name)
+        }
+    return value
+
+def run_with_session(app, func, *args):
+    """
+    Run `func(db, *args)` on a session from get_db, honouring the app's
+    dependency overrides. For code outside request dependencies, such as
+    middleware and long-lived streams, that must not hold a session open.
+    """
+    session_source = app.dependency_overrides.get(get_db, get_db)
+    sessions = session_source()
+    db = next(sessions)
+    try:
+        return func(db, *args)
+    finally:
+        sessions.close()
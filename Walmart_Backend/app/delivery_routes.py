@@ -0,0 +1,129 @@
+"""
+Route planning for assigned deliveries.
+
+Assignment only creates the delivery; a background task picks up deliveries
+that have not been routed yet in batches, orders their drop-offs with
+app.routing and stores the route with per-stop ETAs on the delivery, setting
+`estimated_delivery` to the last stop's ETA.
+
+Delivery addresses are free text and there is no geocoder, so a member's
+drop-off point is the location they queued from. The route starts at the
+driver's latest position (from the telemetry store, else the drivers table),
+or at the drop-offs' centroid when the driver has not reported one.
+"""
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.orm import Session
+
+from app.enums import DeliveryStatus
+from app.models import BuddyQueue, Delivery, Driver, UserOrder
+from app.routing import solve_routes
+from app.telemetry import driver_positions
+
+ROUTING_BATCH_SIZE = int(os.getenv("ROUTING_BATCH_SIZE", "500"))
+ROUTING_POLL_SECONDS = float(os.getenv("ROUTING_POLL_SECONDS", "2"))
+ROUTE_SPEED_KMH = float(os.getenv("ROUTE_SPEED_KMH", "20"))
+ROUTE_STOP_MINUTES = float(os.getenv("ROUTE_STOP_MINUTES", "3"))
+
+
+def _drop_offs(db: Session, clubbed_order_ids) -> dict:
+    """clubbed_order_id -> [(user_order_id, lat, lng)] for members still in the order"""
+    rows = db.query(
+        UserOrder.clubbed_order_id, UserOrder.id, func.avg(BuddyQueue.lat), func.avg(BuddyQueue.lng)
+    ).join(
+        BuddyQueue, BuddyQueue.cart_id == UserOrder.cart_id
+    ).filter(
+        UserOrder.clubbed_order_id.in_(clubbed_order_ids),
+        UserOrder.payment_status != 'CANCELLED'
+    ).group_by(UserOrder.clubbed_order_id, UserOrder.id).order_by(UserOrder.id).all()
+
+    stops = defaultdict(list)
+    for clubbed_order_id, user_order_id, lat, lng in rows:
+        stops[clubbed_order_id].append((user_order_id, float(lat), float(lng)))
+    return stops
+
+
+def plan_delivery_routes(db: Session, batch_size: int = ROUTING_BATCH_SIZE,
+                         now: Optional[datetime] = None) -> int:
+    """Route up to `batch_size` unrouted deliveries and commit; returns the number routed"""
+    now = now or datetime.utcnow()
+    deliveries = db.query(
+        Delivery.id, Delivery.clubbed_order_id, Delivery.driver_id, Driver.lat, Driver.lng
+    ).outerjoin(
+        Driver, Driver.id == Delivery.driver_id
+    ).filter(
+        Delivery.status == DeliveryStatus.ASSIGNED.value,
+        Delivery.routed_at.is_(None)
+    ).limit(batch_size).all()
+    if not deliveries:
+        return 0
+
+    stops = _drop_offs(db, {delivery.clubbed_order_id for delivery in deliveries})
+    problems = []
+    for delivery in deliveries:
+        drop_offs = stops.get(delivery.clubbed_order_id)
+        if not drop_offs:
+            continue
+        position = driver_positions.get(delivery.driver_id) if delivery.driver_id else None
+        if position is not None:
+            origin = (position[0], position[1])
+        elif delivery.lat is not None and delivery.lng is not None:
+            origin = (float(delivery.lat), float(delivery.lng))
+        else:
+            origin = (sum(stop[1] for stop in drop_offs) / len(drop_offs),
+                      sum(stop[2] for stop in drop_offs) / len(drop_offs))
+        problems.append((delivery.id, origin, [(lat, lng) for _, lat, lng in drop_offs]))
+    solved = solve_routes(problems)
+
+    meters_per_second = ROUTE_SPEED_KMH / 3.6
+    rows = []
+    for delivery in deliveries:
+        drop_offs = stops.get(delivery.clubbed_order_id, [])
+        order, cumulative = solved.get(delivery.id, ([], []))
+        route, eta = [], None
+        for sequence, (index, meters) in enumerate(zip(order, cumulative), 1):
+            user_order_id, lat, lng = drop_offs[index]
+            # Travel time plus the time spent at every earlier stop
+            eta = now + timedelta(seconds=meters / meters_per_second + (sequence - 1) * ROUTE_STOP_MINUTES * 60)
+            route.append({
+                "sequence": sequence,
+                "user_order_id": user_order_id,
+                "lat": lat,
+                "lng": lng,
+                "distance_meters": round(meters),
+                "eta": eta.isoformat() + "Z",
+            })
+        rows.append({
+            "delivery_id": delivery.id,
+            "route": json.dumps(route),
+            "route_distance_meters": round(cumulative[-1]) if cumulative else 0,
+            "estimated_delivery": eta,
+            "routed_at": now,
+        })
+
+    deliveries_table = Delivery.__table__
+    # routed_at IS NULL: a delivery routed meanwhile by another worker is left alone
+    db.execute(
+        deliveries_table.update().where(
+            deliveries_table.c.id == bindparam("delivery_id"),
+            deliveries_table.c.routed_at.is_(None)
+        ).values(
+            route=bindparam("route"),
+            route_distance_meters=bindparam("route_distance_meters"),
+            estimated_delivery=func.coalesce(bindparam("estimated_delivery"), deliveries_table.c.estimated_delivery),
+            routed_at=bindparam("routed_at"),
+        ),
+        rows
+    )
+    db.commit()
+    return len(rows)
+
+
+def delivery_route(delivery: Delivery) -> list:
+    """Stops of a routed delivery in visiting order (empty until routed)"""
+    return json.loads(delivery.route) if delivery.route else []
@@ -0,0 +1,205 @@
+"""
+In-memory spatial index of available drivers.
+
+Driver assignment needs the nearest AVAILABLE driver that still has room
+for an order's weight. Drivers are bucketed into a uniform lat/lng grid;
+each cell also tracks the largest remaining capacity among its drivers, so
+cells that cannot take the order are skipped without looking inside. A
+lookup scans rings of cells outwards from the pickup point and stops as soon
+as no unscanned cell can hold anything closer than the best match, so its
+cost follows local driver density rather than the fleet size. Moving a
+driver between cells is a constant-time update.
+
+Positions come from the in-memory telemetry store when the driver has
+pinged this process, and from the drivers table otherwise. The index is per
+process and only a hint: assignment re-checks the chosen driver's row before
+reserving capacity, corrects the index when it was stale, and the whole
+index is rebuilt from the database every DRIVER_INDEX_REFRESH_SECONDS.
+"""
+import os
+import threading
+import time
+from math import cos, floor, radians
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.enums import DriverStatus
+from app.geo import METERS_PER_DEGREE, haversine
+from app.models import Driver
+from app.telemetry import driver_positions
+
+# ~1.1 km of latitude per cell
+DRIVER_INDEX_CELL_DEGREES = float(os.getenv("DRIVER_INDEX_CELL_DEGREES", "0.01"))
+DRIVER_INDEX_REFRESH_SECONDS = float(os.getenv("DRIVER_INDEX_REFRESH_SECONDS", "300"))
+# Drivers further than this from the pickup point are never matched
+DRIVER_SEARCH_RADIUS_METERS = float(os.getenv("DRIVER_SEARCH_RADIUS_METERS", "30000"))
+
+
+def _ring(cell_lat: int, cell_lng: int, ring: int):
+    """Cells at Chebyshev distance `ring` from (cell_lat, cell_lng)"""
+    if ring == 0:
+        yield cell_lat, cell_lng
+        return
+    for offset in range(-ring, ring + 1):
+        yield cell_lat - ring, cell_lng + offset
+        yield cell_lat + ring, cell_lng + offset
+    for offset in range(-ring + 1, ring):
+        yield cell_lat + offset, cell_lng - ring
+        yield cell_lat + offset, cell_lng + ring
+
+
+class DriverIndex:
+    """Grid of available drivers keyed by cell, with per-cell capacity maxima"""
+
+    def __init__(self, cell_degrees: float = DRIVER_INDEX_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.RLock()
+        # cell -> {driver_id: (lat, lng, remaining_capacity)}
+        self._cells = {}
+        # cell -> largest remaining capacity in the cell
+        self._cell_capacity = {}
+        # driver_id -> cell
+        self._driver_cells = {}
+        self.loaded_at = None
+
+    def __len__(self) -> int:
+        return len(self._driver_cells)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return floor(lat / self.cell_degrees), floor(lng / self.cell_degrees)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cells.clear()
+            self._cell_capacity.clear()
+            self._driver_cells.clear()
+            self.loaded_at = None
+
+    def remove(self, driver_id: str) -> None:
+        with self._lock:
+            cell = self._driver_cells.pop(driver_id, None)
+            if cell is None:
+                return
+            drivers = self._cells[cell]
+            _, _, remaining = drivers.pop(driver_id)
+            if not drivers:
+                del self._cells[cell]
+                del self._cell_capacity[cell]
+            elif remaining >= self._cell_capacity[cell]:
+                self._cell_capacity[cell] = max(entry[2] for entry in drivers.values())
+
+    def put(self, driver_id: str, lat: float, lng: float, remaining: float) -> None:
+        """Insert or move an available driver"""
+        cell = self._cell(lat, lng)
+        with self._lock:
+            if self._driver_cells.get(driver_id) != cell:
+                self.remove(driver_id)
+                self._driver_cells[driver_id] = cell
+                self._cells.setdefault(cell, {})
+            previous = self._cells[cell].get(driver_id)
+            self._cells[cell][driver_id] = (lat, lng, remaining)
+            if remaining >= self._cell_capacity.get(cell, remaining):
+                self._cell_capacity[cell] = remaining
+            elif previous is not None and previous[2] >= self._cell_capacity[cell]:
+                self._cell_capacity[cell] = max(entry[2] for entry in self._cells[cell].values())
+
+    def move(self, driver_id: str, lat: float, lng: float) -> None:
+        """Follow a position update of an indexed driver"""
+        with self._lock:
+            cell = self._driver_cells.get(driver_id)
+            if cell is not None:
+                self.put(driver_id, lat, lng, self._cells[cell][driver_id][2])
+
+    def update(self, driver_id: str, status, lat, lng, current_load, max_capacity) -> None:
+        """Mirror one driver's row: indexed while AVAILABLE with a known position"""
+        position = driver_positions.get(driver_id)
+        if position is not None:
+            lat, lng = position[0], position[1]
+        if status != DriverStatus.AVAILABLE or lat is None or lng is None:
+            self.remove(driver_id)
+            return
+        remaining = float(max_capacity or 0) - float(current_load or 0)
+        self.put(driver_id, float(lat), float(lng), remaining)
+
+    def sync(self, driver) -> None:
+        self.update(driver.id, driver.status, driver.lat, driver.lng, driver.current_load, driver.max_capacity)
+
+    def rebuild(self, drivers: Iterable) -> None:
+        with self._lock:
+            self.clear()
+            for driver in drivers:
+                self.sync(driver)
+            self.loaded_at = time.monotonic()
+
+    def _scan_cell(self, cell, lat, lng, weight, exclude, best):
+        if self._cell_capacity.get(cell, -1.0) < weight:
+            return best
+        for driver_id, (driver_lat, driver_lng, remaining) in self._cells[cell].items():
+            if remaining < weight or driver_id in exclude:
+                continue
+            distance = haversine(lat, lng, driver_lat, driver_lng)
+            if best is None or distance < best[1]:
+                best = (driver_id, distance)
+        return best
+
+    def nearest(self, lat: float, lng: float, weight: float = 0.0, exclude=frozenset(),
+                max_distance: float = DRIVER_SEARCH_RADIUS_METERS) -> Optional[Tuple[str, float]]:
+        """(driver_id, meters) of the closest driver with `weight` spare capacity, or None"""
+        lat, lng, weight = float(lat), float(lng), float(weight)
+        center_lat, center_lng = self._cell(lat, lng)
+        # Narrowest cell side within the search area; longitude cells shrink towards the poles
+        search_degrees = max_distance / METERS_PER_DEGREE
+        cell_meters = self.cell_degrees * METERS_PER_DEGREE * max(
+            cos(radians(min(abs(lat) + search_degrees, 89.0))), 0.01
+        )
+        max_ring = int(max_distance / cell_meters) + 1
+
+        best = None
+        with self._lock:
+            for ring in range(max_ring + 1):
+                # Everything in this ring and beyond is at least (ring - 1) cells away
+                if best is not None and best[1] <= (ring - 1) * cell_meters:
+                    break
+                if 8 * ring > len(self._cells):
+                    # Sparse grid: the remaining occupied cells are fewer than the ring's cells
+                    for cell in list(self._cells):
+                        if max(abs(cell[0] - center_lat), abs(cell[1] - center_lng)) >= ring:
+                            best = self._scan_cell(cell, lat, lng, weight, exclude, best)
+                    break
+                for cell in _ring(center_lat, center_lng, ring):
+                    if cell in self._cells:
+                        best = self._scan_cell(cell, lat, lng, weight, exclude, best)
+
+        if best is None or best[1] > max_distance:
+            return None
+        return best
+
+
+driver_index = DriverIndex()
+
+
+def ensure_driver_index(db: Session) -> DriverIndex:
+    """Load the index on first use and rebuild it once it is older than the refresh interval"""
+    loaded_at = driver_index.loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > DRIVER_INDEX_REFRESH_SECONDS:
+        driver_index.rebuild(db.query(
+            Driver.id, Driver.status, Driver.lat, Driver.lng, Driver.current_load, Driver.max_capacity
+        ).filter(
+            Driver.status == DriverStatus.AVAILABLE.value
+        ).all())
+    return driver_index
+
+
+def sync_drivers(db: Session, driver_ids: Iterable[str]) -> None:
+    """Re-read the given drivers after a committed change and update the index"""
+    driver_ids = list(driver_ids)
+    if not driver_ids or driver_index.loaded_at is None:
+        return
+    rows = db.query(
+        Driver.id, Driver.status, Driver.lat, Driver.lng, Driver.current_load, Driver.max_capacity
+    ).filter(Driver.id.in_(driver_ids)).all()
+    for row in rows:
+        driver_index.sync(row)
+    for driver_id in set(driver_ids) - {row.id for row in rows}:
+        driver_index.remove(driver_id)
@@ -0,0 +1,164 @@
+"""
+In-process event bus for delivery tracking streams.
+
+Members of a clubbed order follow its delivery over a server-sent event
+stream instead of polling. Each stream subscribes to its clubbed order's
+topic with a bounded asyncio queue. Publishers (request handlers running in
+the threadpool, background tasks) hand an event to the subscribers' event
+loop with one thread-safe call per event; the loop then fans it out to every
+subscriber of the topic. A subscriber that falls behind loses its oldest events rather
+than growing without bound.
+
+Driver position updates are routed to the topics of the deliveries the
+driver is carrying, registered with `watch_driver` by the streams that
+follow them and dropped once a topic has no subscribers left.
+
+The bus is per process: a stream only sees events published by the worker
+that serves it.
+"""
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from typing import Optional
+
+EVENT_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("EVENT_SUBSCRIBER_QUEUE_SIZE", "100"))
+
+
+class Subscription:
+    __slots__ = ("topic", "queue", "loop")
+
+    def __init__(self, topic: str, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self.topic = topic
+        self.queue = queue
+        self.loop = loop
+
+
+class EventBus:
+    def __init__(self, queue_size: int = EVENT_SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # topic -> event loop -> subscriptions served by that loop
+        self._subscribers = {}
+        # driver_id -> topics following the driver's position, and back
+        self._driver_topics = defaultdict(set)
+        self._topic_drivers = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Subscribe from a coroutine; events are delivered on its event loop"""
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(topic, asyncio.Queue(maxsize=self.queue_size), loop)
+        with self._lock:
+            self._subscribers.setdefault(topic, {}).setdefault(loop, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        topic = subscription.topic
+        with self._lock:
+            loops = self._subscribers.get(topic)
+            if loops is None or subscription not in loops.get(subscription.loop, ()):
+                return
+            subscribers = loops[subscription.loop]
+            subscribers.discard(subscription)
+            if not subscribers:
+                del loops[subscription.loop]
+            if loops:
+                return
+            del self._subscribers[topic]
+        self.unwatch_topic(topic)
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        with self._lock:
+            topics = [self._subscribers.get(topic, {})] if topic is not None else list(self._subscribers.values())
+            return sum(len(subscribers) for loops in topics for subscribers in loops.values())
+
+    def watch_driver(self, driver_id: Optional[str], topic: str) -> None:
+        if driver_id:
+            with self._lock:
+                self._driver_topics[driver_id].add(topic)
+                self._topic_drivers[topic].add(driver_id)
+
+    def unwatch_topic(self, topic: str) -> None:
+        """Stop routing driver positions to a topic"""
+        with self._lock:
+            for driver_id in self._topic_drivers.pop(topic, ()):
+                topics = self._driver_topics[driver_id]
+                topics.discard(topic)
+                if not topics:
+                    del self._driver_topics[driver_id]
+
+    def _fan_out(self, topic: str, loop: asyncio.AbstractEventLoop, event: dict) -> None:
+        """Runs on `loop`: queue the event for that loop's subscribers of `topic`"""
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(topic, {}).get(loop, ()))
+        dropped = 0
+        for subscription in subscribers:
+            queue = subscription.queue
+            if queue.full():
+                queue.get_nowait()
+                dropped += 1
+            queue.put_nowait(event)
+        with self._lock:
+            self.delivered += len(subscribers)
+            self.dropped += dropped
+
+    def publish(self, topic: str, event: dict) -> None:
+        """Publish `event` to everyone following `topic`; safe to call from any thread"""
+        with self._lock:
+            loops = tuple(self._subscribers.get(topic, ()))
+            if not loops:
+                return
+            self.published += 1
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for loop in loops:
+            if loop is running:
+                self._fan_out(topic, loop, event)
+            elif not loop.is_closed():
+                # One wake-up per loop, however many subscribers it serves
+                loop.call_soon_threadsafe(self._fan_out, topic, loop, event)
+
+    def publish_driver_positions(self, positions, recorded_at: str) -> None:
+        """Route (driver_id, lat, lng) updates to the topics following each driver"""
+        with self._lock:
+            if not self._driver_topics:
+                return
+            routed = [
+                (topic, driver_id, lat, lng)
+                for driver_id, lat, lng in positions
+                for topic in self._driver_topics.get(driver_id, ())
+            ]
+        for topic, driver_id, lat, lng in routed:
+            self.publish(topic, {
+                "type": "driver_position",
+                "driver_id": driver_id,
+                "lat": lat,
+                "lng": lng,
+                "recorded_at": recorded_at,
+            })
+
+    def reset(self) -> None:
+        with self._lock:
+            self._subscribers.clear()
+            self._driver_topics.clear()
+            self._topic_drivers.clear()
+            self.published = self.delivered = self.dropped = 0
+
+    def stats(self) -> dict:
+        subscribers = self.subscriber_count()
+        return {
+            "topics": len(self._subscribers),
+            "subscribers": subscribers,
+            "watched_drivers": len(self._driver_topics),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+event_bus = EventBus()
@@ -0,0 +1,23 @@
+"""
+Geographic helpers shared by buddy matching, driver assignment and routing.
+"""
+from math import atan2, cos, radians, sin, sqrt
+
+EARTH_RADIUS_METERS = 6371000
+# Length of one degree of latitude; a degree of longitude is this times cos(latitude)
+METERS_PER_DEGREE = 111195
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculate the distance between two points on Earth in meters.
+    """
+    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
+
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+
+    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    return EARTH_RADIUS_METERS * c
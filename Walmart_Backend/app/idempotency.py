@@ -0,0 +1,253 @@
+"""
+Idempotency-Key handling for retried payment requests.
+
+Clients retry split-payment commit/confirm/cancel when responses are slow.
+For requests carrying an `Idempotency-Key` header the first response is
+recorded and every retry with the same key gets that response back without
+reaching the route, so order tables are not touched again.
+
+Records live in an in-process LRU backed by the `idempotency_keys` table, so
+a retry routed to another worker still finds the original response. A key is
+scoped to the caller (the user in their bearer token, so a retry after a
+token refresh still matches) and the request path; reusing it
+with a different body is rejected with 422, and a retry that arrives while
+the first request is still running gets 409.
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+
+from fastapi import HTTPException
+
+from app.auth import decode_token
+from app.cache import TTLCache
+from app.database import run_with_session
+from app.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# An in-flight record older than this is assumed abandoned (worker crashed) and can be taken over
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+IDEMPOTENT_PATHS = (
+    "/split-payment/commit",
+    "/split-payment/confirm",
+    "/split-payment/cancel",
+)
+
+MAX_KEY_LENGTH = 255
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status_code", "body", "content_type")
+
+    def __init__(self, fingerprint: str, status_code: int, body: bytes, content_type: Optional[str]):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.content_type = content_type
+
+    def to_response(self) -> Response:
+        return Response(
+            content=self.body,
+            status_code=self.status_code,
+            media_type=self.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+# scope key -> StoredResponse for completed requests
+response_cache = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_KEY_TTL_SECONDS)
+
+# Outcomes of _claim
+_CLAIMED = "claimed"
+_IN_FLIGHT = "in_flight"
+
+
+def _caller(authorization: str) -> str:
+    """The user a request acts for; the raw header when it carries no valid bearer token"""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return authorization
+    try:
+        email, user_id = decode_token(token)
+    except HTTPException:
+        return authorization
+    return f"user:{user_id or email}"
+
+
+def _scope_key(caller: str, path: str, idempotency_key: str) -> str:
+    return hashlib.sha256("\n".join((caller, path, idempotency_key)).encode()).hexdigest()
+
+
+def _claim(db: Session, key: str, fingerprint: str):
+    """
+    Return a StoredResponse to replay, _IN_FLIGHT, or _CLAIMED once this
+    request owns the key and should run.
+    """
+    now = datetime.utcnow()
+    record = db.get(IdempotencyKey, key)
+    if record is not None and record.expires_at <= now:
+        db.delete(record)
+        db.commit()
+        record = None
+
+    if record is None:
+        db.add(IdempotencyKey(
+            key=key,
+            request_fingerprint=fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+        ))
+        try:
+            db.commit()
+            return _CLAIMED
+        except IntegrityError:
+            # Another worker claimed the key between our read and insert
+            db.rollback()
+            return _IN_FLIGHT
+
+    if record.status_code is not None:
+        return StoredResponse(record.request_fingerprint, record.status_code,
+                              record.response_body or b"", record.content_type)
+
+    if record.created_at > now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS):
+        return _IN_FLIGHT
+
+    # Take over an abandoned claim; the conditional update lets only one caller win
+    taken = db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key, IdempotencyKey.created_at == record.created_at,
+               IdempotencyKey.status_code.is_(None))
+        .values(created_at=now, request_fingerprint=fingerprint)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return _CLAIMED if taken else _IN_FLIGHT
+
+
+def _complete(db: Session, key: str, stored: StoredResponse) -> None:
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key)
+        .values(status_code=stored.status_code, response_body=stored.body, content_type=stored.content_type)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def _release(db: Session, key: str) -> None:
+    db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    db.commit()
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Delete stored responses past their TTL"""
+    deleted = db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow())
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that records and replays responses for keyed POSTs to `paths`"""
+
+    def __init__(self, app, paths=IDEMPOTENT_PATHS):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        idempotency_key = headers.get("idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            await JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)(scope, receive, send)
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        key = _scope_key(_caller(headers.get("authorization", "")), scope["path"], idempotency_key)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        stored = response_cache.get(key)
+        if stored is None:
+            claim = await run_in_threadpool(run_with_session, scope["app"], _claim, key, fingerprint)
+            if claim == _IN_FLIGHT:
+                response = JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still being processed"},
+                    status_code=409,
+                    headers={"Retry-After": "1"},
+                )
+                await response(scope, receive, send)
+                return
+            if claim != _CLAIMED:
+                stored = claim
+                response_cache.set(key, stored)
+
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                response = JSONResponse(
+                    {"detail": "Idempotency-Key was already used with a different request body"},
+                    status_code=422,
+                )
+            else:
+                response = stored.to_response()
+            await response(scope, receive, send)
+            return
+
+        await self._run_and_record(scope, body, send, key, fingerprint)
+
+    async def _run_and_record(self, scope, body, send, key, fingerprint):
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        status_code = None
+        content_type = None
+        chunks = []
+
+        async def recording_send(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, recording_send)
+        finally:
+            # Server errors are not replayed: the client may retry with the same key
+            if status_code is None or status_code >= 500:
+                await run_in_threadpool(run_with_session, scope["app"], _release, key)
+            else:
+                stored = StoredResponse(fingerprint, status_code, b"".join(chunks), content_type)
+                await run_in_threadpool(run_with_session, scope["app"], _complete, key, stored)
+                response_cache.set(key, stored)
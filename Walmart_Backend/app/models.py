@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, String, Integer, DECIMAL, Boolean, TIMESTAMP, Enum, ForeignKey, Text
+from sqlalchemy import create_engine, Column, String, Integer, DECIMAL, Boolean, TIMESTAMP, Enum, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -6,6 +6,25 @@ from .enums import BuddyStatus, OrderStatus, DriverStatus, DeliveryStatus
 
 Base = declarative_base()
 
+# Version of the schema these models describe. Each versioned migration
+# (database_*_migration.sql) records the version it brings a database to in
+# schema_version; bump this together with a new migration.
+#   1  the schema before versioning: database_setup.sql and the split payment migration
+#   2  clubbed_order_version      6  outbox                10  query_indexes
+#   3  payment_deadline           7  wallet
+#   4  idempotency                8  penalty_collection
+#   5  clubbed_order_counters     9  delivery_route
+SCHEMA_VERSION = 10
+# Recorded for databases that predate schema_version
+BASELINE_SCHEMA_VERSION = 1
+
+class SchemaVersion(Base):
+    """Schema versions applied to this database"""
+    __tablename__ = "schema_version"
+    
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    applied_at = Column(TIMESTAMP, default=datetime.utcnow)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -47,6 +66,11 @@ class Cart(Base):
     user = relationship("User", back_populates="carts")
     cart_items = relationship("CartItem", back_populates="cart")
     buddy_queue_entries = relationship("BuddyQueue", back_populates="cart")
+    
+    __table_args__ = (
+        # A user's active cart
+        Index("idx_carts_user_active", "user_id", "is_active"),
+    )
 
 class CartItem(Base):
     __tablename__ = "cart_items"
@@ -60,6 +84,11 @@ class CartItem(Base):
     # Relationships
     cart = relationship("Cart", back_populates="cart_items")
     product = relationship("Product", back_populates="cart_items")
+    
+    __table_args__ = (
+        # Items of a cart, and the line for a product within it
+        Index("idx_cart_items_cart_product", "cart_id", "product_id"),
+    )
 
 class BuddyQueue(Base):
     __tablename__ = "buddy_queue"
@@ -79,6 +108,16 @@ class BuddyQueue(Base):
     # Relationships
     user = relationship("User", back_populates="buddy_queue_entries")
     cart = relationship("Cart", back_populates="buddy_queue_entries")
+    
+    __table_args__ = (
+        # A user's waiting entry
+        Index("idx_buddy_queue_user_status", "user_id", "status"),
+        # Matching: waiting entries, and those in one geohash cell
+        Index("idx_buddy_queue_status_location", "status", "location_hash"),
+        Index("idx_buddy_queue_cart", "cart_id"),
+        # Cleanup of old entries
+        Index("idx_buddy_queue_created", "created_at"),
+    )
 
 class ClubbedOrder(Base):
     __tablename__ = "clubbed_orders"
@@ -94,11 +133,24 @@ class ClubbedOrder(Base):
     payment_confirmation_deadline = Column(TIMESTAMP)
     order_confirmed_at = Column(TIMESTAMP)
     
+    # Optimistic concurrency guard for incremental total updates
+    version = Column(Integer, nullable=False, default=0)
+    
+    # Split payment progress, maintained by conditional updates
+    member_count = Column(Integer, nullable=False, default=0)
+    committed_count = Column(Integer, nullable=False, default=0)
+    confirmed_count = Column(Integer, nullable=False, default=0)
+    
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     
     # Relationships
     clubbed_order_users = relationship("ClubbedOrderUser", back_populates="clubbed_order")
     user_orders = relationship("UserOrder", back_populates="clubbed_order")
+    
+    __table_args__ = (
+        # Deadline scheduler: open orders whose payment window has closed
+        Index("idx_clubbed_orders_payment_deadline", "status", "payment_confirmation_deadline"),
+    )
 
 class ClubbedOrderUser(Base):
     __tablename__ = "clubbed_order_users"
@@ -113,6 +165,13 @@ class ClubbedOrderUser(Base):
     clubbed_order = relationship("ClubbedOrder", back_populates="clubbed_order_users")
     user = relationship("User")
     cart = relationship("Cart")
+    
+    __table_args__ = (
+        # Members of a clubbed order, and one user's membership
+        Index("idx_clubbed_order_users_order_user", "clubbed_order_id", "user_id"),
+        # The clubbed orders a user (or one of their carts) belongs to
+        Index("idx_clubbed_order_users_user_cart", "user_id", "cart_id"),
+    )
 
 class Driver(Base):
     __tablename__ = "drivers"
@@ -129,6 +188,11 @@ class Driver(Base):
     
     # Relationships
     deliveries = relationship("Delivery", back_populates="driver")
+    
+    __table_args__ = (
+        # Assignment: available drivers
+        Index("idx_drivers_status", "status"),
+    )
 
 class Delivery(Base):
     __tablename__ = "deliveries"
@@ -140,9 +204,20 @@ class Delivery(Base):
     estimated_delivery = Column(TIMESTAMP)
     actual_delivery = Column(TIMESTAMP)
     
+    # Planned stop order with per-stop ETAs (JSON), filled in by the routing task
+    route = Column(Text)
+    route_distance_meters = Column(Integer)
+    routed_at = Column(TIMESTAMP)
+    
     # Relationships
     clubbed_order = relationship("ClubbedOrder")
     driver = relationship("Driver", back_populates="deliveries")
+    
+    __table_args__ = (
+        # Routing task: assigned deliveries that have no route yet
+        Index("idx_deliveries_routing", "status", "routed_at"),
+        Index("idx_deliveries_clubbed_order", "clubbed_order_id"),
+    )
 
 # New models for split payment and commitment system
 
@@ -178,6 +253,13 @@ class UserOrder(Base):
     user = relationship("User")
     cart = relationship("Cart")
     cancellation = relationship("OrderCancellation", back_populates="user_order", uselist=False)
+    
+    __table_args__ = (
+        # Deadline scheduler: pending orders whose commitment window has closed
+        Index("idx_user_orders_commitment_deadline", "payment_status", "commitment_deadline"),
+        # Members' orders in a clubbed order, and one user's order in it
+        Index("idx_user_orders_clubbed_order_user", "clubbed_order_id", "user_id"),
+    )
 
 class OrderCancellation(Base):
     """Tracks order cancellations and penalties"""
@@ -228,8 +310,61 @@ class PaymentTransaction(Base):
     processed_at = Column(TIMESTAMP)
     failure_reason = Column(Text)
     
+    # Collection of PENDING charges (see app/penalties.py)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(TIMESTAMP)
+    claimed_by = Column(String(36))  # claim token of the collector batch holding the row
+    claimed_at = Column(TIMESTAMP)
+    
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     
     # Relationships
     user_order = relationship("UserOrder")
     user = relationship("User")
+    
+    __table_args__ = (
+        Index("idx_payment_transactions_collectable", "transaction_type", "status", "next_attempt_at"),
+        Index("idx_payment_transactions_claim", "claimed_by"),
+        Index("idx_payment_transactions_user_order", "user_order_id"),
+    )
+
+class IdempotencyKey(Base):
+    """Recorded response for a request sent with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(64), primary_key=True)  # sha256 of caller, path and client key
+    request_fingerprint = Column(String(64), nullable=False)  # sha256 of the request body
+    
+    # NULL while the first request is still running
+    status_code = Column(Integer)
+    response_body = Column(LargeBinary)
+    content_type = Column(String(100))
+    
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+
+class OutboxEvent(Base):
+    """Side effect recorded in the same commit as the state change that caused it"""
+    __tablename__ = "outbox_events"
+    
+    id = Column(String(36), primary_key=True)
+    event_type = Column(String(50), nullable=False)
+    aggregate_id = Column(String(36))  # e.g. the clubbed order the event belongs to
+    payload = Column(Text, nullable=False)  # JSON
+    
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    processed_at = Column(TIMESTAMP)  # NULL until a handler succeeded
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    
+    __table_args__ = (
+        Index("idx_outbox_events_pending", "processed_at", "created_at"),
+    )
+
+class WalletBalance(Base):
+    """Running wallet balance per user, kept in step with the WALLET ledger rows"""
+    __tablename__ = "wallet_balances"
+    
+    user_id = Column(String(36), ForeignKey("users.id"), primary_key=True)
+    balance = Column(DECIMAL(10, 2), nullable=False, default=0)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow)
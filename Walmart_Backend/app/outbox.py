@@ -0,0 +1,101 @@
+"""
+Transactional outbox for payment side effects.
+
+Request handlers record the state change and an outbox event in the same
+commit; the bookkeeping that follows (transaction ledger rows, compensation
+and penalty rows) is done by a background worker that drains the outbox in
+batches. Delivery is at least once: an event whose handler fails stays
+pending and is retried, so handlers must be idempotent. They derive the ids
+of the rows they create from the event id with `derived_id`, which turns a
+redelivery into a no-op.
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+_OUTBOX_NAMESPACE = uuid.UUID("3f6c2a52-7d1e-4b59-9a43-6f0c1f3b8e21")
+
+_handlers: Dict[str, Callable[[Session, dict], None]] = {}
+
+
+def handler(event_type: str):
+    """Register `func(db, payload)` as the handler for `event_type`.
+
+    The handler stages its writes on `db`; the worker commits them together
+    with marking the event processed.
+    """
+    def register(func):
+        _handlers[event_type] = func
+        return func
+    return register
+
+
+def enqueue(db: Session, event_type: str, payload: dict, aggregate_id: Optional[str] = None) -> OutboxEvent:
+    """Stage an event on `db`; it is published by the caller's commit"""
+    event = OutboxEvent(
+        id=str(uuid.uuid4()),
+        event_type=event_type,
+        aggregate_id=aggregate_id,
+        payload=json.dumps(payload, default=str),
+        created_at=datetime.utcnow(),
+    )
+    db.add(event)
+    return event
+
+
+def derived_id(event_id: str, name: str) -> str:
+    """Deterministic row id for something an event handler creates"""
+    return str(uuid.uuid5(_OUTBOX_NAMESPACE, f"{event_id}:{name}"))
+
+
+def process_batch(db: Session, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Run handlers for up to `batch_size` pending events, oldest first; returns the number handled"""
+    events = db.query(OutboxEvent).filter(
+        OutboxEvent.processed_at.is_(None),
+        OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS
+    ).order_by(OutboxEvent.created_at).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    handled = 0
+    for event in events:
+        event_id = event.id
+        func = _handlers.get(event.event_type)
+        try:
+            if func is None:
+                raise LookupError(f"No outbox handler for {event.event_type}")
+            payload = json.loads(event.payload)
+            payload["event_id"] = event_id
+            func(db, payload)
+            event.processed_at = datetime.utcnow()
+            db.commit()
+            handled += 1
+        except Exception as e:
+            db.rollback()
+            failed = db.get(OutboxEvent, event_id)
+            failed.attempts = (failed.attempts or 0) + 1
+            failed.last_error = str(e)[:1000]
+            db.commit()
+            logger.error(f"Outbox event {event_id} ({failed.event_type}) failed, attempt {failed.attempts}: {str(e)}")
+    return handled
+
+
+def drain(db: Session, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Process batches until no pending event can be handled"""
+    total = 0
+    while True:
+        handled = process_batch(db, batch_size)
+        total += handled
+        if handled == 0:
+            return total
@@ -0,0 +1,145 @@
+"""
+Password hashing on a dedicated, bounded process pool.
+
+bcrypt is deliberately CPU-bound. Running it on the AnyIO threadpool lets a
+burst of logins occupy every worker thread (and the GIL), so unrelated cart and
+club requests queue up behind them. The async helpers here run hashing in a
+separate process pool with its own worker count and pending-request limit, and
+record how long each job waited before a worker picked it up.
+
+This module must stay importable without the database or web stack, because
+pool workers import it in a fresh interpreter.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+PASSWORD_HASH_SLOW_WAIT_MS = float(os.getenv("PASSWORD_HASH_SLOW_WAIT_MS", "500"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing queue already holds PASSWORD_HASH_MAX_PENDING jobs"""
+
+
+# Worker-side functions: module level so they can be pickled by reference.
+# Each returns the wall-clock time it started so the caller can derive queue wait.
+
+def _hash_job(password: str):
+    started_at = time.time()
+    return pwd_context.hash(password), started_at
+
+
+def _verify_job(plain_password: str, hashed_password: str):
+    started_at = time.time()
+    return pwd_context.verify(plain_password, hashed_password), started_at
+
+
+class _QueueStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.last_wait_ms = 0.0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.pending >= PASSWORD_HASH_MAX_PENDING:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self, wait_ms: Optional[float]):
+        with self._lock:
+            self.pending -= 1
+            if wait_ms is None:
+                return
+            self.completed += 1
+            self.total_wait_ms += wait_ms
+            self.last_wait_ms = wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": PASSWORD_HASH_WORKERS,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "pending": self.pending,
+                "max_pending": PASSWORD_HASH_MAX_PENDING,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_queue_wait_ms": round(self.total_wait_ms / self.completed, 2) if self.completed else 0.0,
+                "max_queue_wait_ms": round(self.max_wait_ms, 2),
+                "last_queue_wait_ms": round(self.last_wait_ms, 2),
+            }
+
+
+_stats = _QueueStats()
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: workers must not inherit the server's threads and locks
+                _executor = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def shutdown_password_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def _run(job, *args):
+    if not _stats.try_acquire():
+        raise PasswordHashingBusy("Password hashing queue is full")
+    wait_ms = None
+    try:
+        submitted_at = time.time()
+        loop = asyncio.get_running_loop()
+        result, started_at = await loop.run_in_executor(_get_executor(), job, *args)
+        wait_ms = max(0.0, (started_at - submitted_at) * 1000)
+        if wait_ms >= PASSWORD_HASH_SLOW_WAIT_MS:
+            logger.warning(f"Password hashing job waited {wait_ms:.0f}ms in queue")
+        return result
+    finally:
+        _stats.release(wait_ms)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(_hash_job, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(_verify_job, plain_password, hashed_password)
+
+
+def hash_queue_stats() -> dict:
+    return _stats.snapshot()
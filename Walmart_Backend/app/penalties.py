@@ -0,0 +1,279 @@
+"""
+Penalty collection.
+
+Cancellation penalties are recorded as PENDING PENALTY transactions. The
+collector claims them in bounded batches, charges them through a pluggable
+gateway and records the outcomes with bulk updates. Several collectors can
+run side by side (threads or processes): on MySQL a batch is claimed with
+SELECT ... FOR UPDATE SKIP LOCKED, elsewhere with a compare-and-set UPDATE
+on the claim columns, so no row is handed to two collectors at once. A claim
+is a lease; rows whose collector died are picked up again once it expires.
+Outcomes are only recorded on rows the collector still holds, so a collector
+whose lease ran out mid-charge cannot overwrite the settlement of the one that
+reclaimed the rows.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional
+
+from sqlalchemy import and_, bindparam, or_, update
+from sqlalchemy.orm import Session
+
+from app.models import PaymentTransaction
+
+logger = logging.getLogger(__name__)
+
+PENALTY_BATCH_SIZE = int(os.getenv("PENALTY_BATCH_SIZE", "100"))
+PENALTY_COLLECTORS = int(os.getenv("PENALTY_COLLECTORS", "1"))
+PENALTY_POLL_SECONDS = float(os.getenv("PENALTY_POLL_SECONDS", "5"))
+PENALTY_CLAIM_LEASE_SECONDS = int(os.getenv("PENALTY_CLAIM_LEASE_SECONDS", "300"))
+PENALTY_MAX_ATTEMPTS = int(os.getenv("PENALTY_MAX_ATTEMPTS", "5"))
+PENALTY_RETRY_BASE_SECONDS = int(os.getenv("PENALTY_RETRY_BASE_SECONDS", "60"))
+# "module:Class" of the gateway used by collectors
+PENALTY_GATEWAY = os.getenv("PENALTY_GATEWAY", "app.penalties:StubPenaltyGateway")
+
+
+@dataclass
+class PenaltyCharge:
+    transaction_id: str
+    user_id: str
+    amount: Decimal
+    claim_token: str
+
+
+@dataclass
+class ChargeResult:
+    transaction_id: str
+    success: bool
+    external_transaction_id: Optional[str] = None
+    error: Optional[str] = None
+    retryable: bool = True
+
+
+class PenaltyGateway(ABC):
+    """Interface for charging penalties; `charge` must return one result per charge"""
+
+    name = "gateway"
+
+    @abstractmethod
+    def charge(self, charges: List[PenaltyCharge]) -> List[ChargeResult]:
+        ...
+
+
+class StubPenaltyGateway(PenaltyGateway):
+    """Local stand-in that approves every charge, or declines the ids in `declined`"""
+
+    name = "stub"
+
+    def __init__(self, declined=(), retryable: bool = True):
+        self.declined = set(declined)
+        self.retryable = retryable
+
+    def charge(self, charges: List[PenaltyCharge]) -> List[ChargeResult]:
+        return [
+            ChargeResult(charge.transaction_id, False, error="Declined by stub gateway", retryable=self.retryable)
+            if charge.transaction_id in self.declined
+            else ChargeResult(charge.transaction_id, True, external_transaction_id=f"stub-{charge.transaction_id}")
+            for charge in charges
+        ]
+
+
+def load_gateway(path: str = PENALTY_GATEWAY) -> PenaltyGateway:
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class _CollectorStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.batches = 0
+        self.claimed = 0
+        self.collected = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_batch_ms = 0.0
+
+    def record(self, claimed: int, collected: int, retried: int, failed: int, elapsed_ms: float):
+        with self._lock:
+            self.batches += 1
+            self.claimed += claimed
+            self.collected += collected
+            self.retried += retried
+            self.failed += failed
+            self.last_batch_ms = elapsed_ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            uptime = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                "collectors": PENALTY_COLLECTORS,
+                "batches": self.batches,
+                "claimed": self.claimed,
+                "collected": self.collected,
+                "retried": self.retried,
+                "failed": self.failed,
+                "collected_per_second": round(self.collected / uptime, 3),
+                "last_batch_ms": round(self.last_batch_ms, 2),
+            }
+
+
+_stats = _CollectorStats()
+
+
+def penalty_collector_stats() -> dict:
+    return _stats.snapshot()
+
+
+def _collectable(now: datetime):
+    lease_expired = now - timedelta(seconds=PENALTY_CLAIM_LEASE_SECONDS)
+    return and_(
+        PaymentTransaction.transaction_type == 'PENALTY',
+        PaymentTransaction.status == 'PENDING',
+        or_(PaymentTransaction.next_attempt_at.is_(None), PaymentTransaction.next_attempt_at <= now),
+        or_(PaymentTransaction.claimed_at.is_(None), PaymentTransaction.claimed_at < lease_expired)
+    )
+
+
+def claim_penalties(db: Session, batch_size: int = PENALTY_BATCH_SIZE, now: Optional[datetime] = None) -> List[PenaltyCharge]:
+    """Claim up to `batch_size` collectable penalties for this caller and commit the claim"""
+    now = now or datetime.utcnow()
+    token = str(uuid.uuid4())
+
+    candidates = db.query(PaymentTransaction.id).filter(_collectable(now)).order_by(
+        PaymentTransaction.created_at
+    ).limit(batch_size)
+    if db.get_bind().dialect.name == "mysql":
+        # Rows locked by another collector are skipped, not waited on
+        candidate_ids = [row.id for row in candidates.with_for_update(skip_locked=True)]
+    else:
+        candidate_ids = [row.id for row in candidates]
+    if not candidate_ids:
+        db.rollback()
+        return []
+
+    # Compare-and-set: a row another collector claimed meanwhile no longer matches
+    db.execute(
+        update(PaymentTransaction)
+        .where(PaymentTransaction.id.in_(candidate_ids), _collectable(now))
+        .values(claimed_by=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    claimed = db.query(
+        PaymentTransaction.id, PaymentTransaction.user_id, PaymentTransaction.amount
+    ).filter(PaymentTransaction.claimed_by == token).all()
+    return [PenaltyCharge(row.id, row.user_id, row.amount, token) for row in claimed]
+
+
+def _apply_held(db: Session, stmt, rows: List[dict], outcome: str) -> int:
+    """Run an executemany outcome UPDATE; returns the rows applied and logs the claims lost meanwhile"""
+    applied = db.execute(stmt, rows).rowcount
+    if applied < len(rows):
+        logger.warning(
+            f"Dropped {len(rows) - applied} of {len(rows)} penalty {outcome} results: "
+            f"their lease expired and another collector reclaimed them"
+        )
+    return applied
+
+
+def record_outcomes(db: Session, results: List[ChargeResult], gateway_name: str, token: str,
+                    now: Optional[datetime] = None):
+    """
+    Apply gateway results with one executemany UPDATE per outcome kind, only
+    to rows still claimed with `token`; returns (collected, retried, failed).
+    """
+    now = now or datetime.utcnow()
+    transactions = PaymentTransaction.__table__
+    held = and_(transactions.c.id == bindparam("transaction_id"), transactions.c.claimed_by == token)
+    succeeded = [result for result in results if result.success]
+    unsuccessful = [result for result in results if not result.success]
+
+    collected = 0
+    if succeeded:
+        settle = transactions.update().where(held).values(
+            status='SUCCESS',
+            processed_at=now,
+            payment_gateway=gateway_name,
+            external_transaction_id=bindparam("external_transaction_id"),
+            attempts=transactions.c.attempts + 1,
+            claimed_by=None,
+            claimed_at=None,
+        )
+        collected = _apply_held(db, settle, [
+            {"transaction_id": r.transaction_id, "external_transaction_id": r.external_transaction_id}
+            for r in succeeded
+        ], "success")
+
+    retried = failed = 0
+    if unsuccessful:
+        attempts = dict(db.query(PaymentTransaction.id, PaymentTransaction.attempts).filter(
+            PaymentTransaction.id.in_([r.transaction_id for r in unsuccessful])
+        ).all())
+        retry_rows, failed_rows = [], []
+        for result in unsuccessful:
+            attempt = (attempts.get(result.transaction_id) or 0) + 1
+            row = {"transaction_id": result.transaction_id, "attempts": attempt, "failure_reason": result.error}
+            if result.retryable and attempt < PENALTY_MAX_ATTEMPTS:
+                # Exponential backoff between attempts
+                row["next_attempt_at"] = now + timedelta(seconds=PENALTY_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+                retry_rows.append(row)
+            else:
+                failed_rows.append(row)
+        if retry_rows:
+            retry = transactions.update().where(held).values(
+                attempts=bindparam("attempts"),
+                failure_reason=bindparam("failure_reason"),
+                next_attempt_at=bindparam("next_attempt_at"),
+                claimed_by=None,
+                claimed_at=None,
+            )
+            retried = _apply_held(db, retry, retry_rows, "retry")
+        if failed_rows:
+            fail = transactions.update().where(held).values(
+                status='FAILED',
+                processed_at=now,
+                attempts=bindparam("attempts"),
+                failure_reason=bindparam("failure_reason"),
+                claimed_by=None,
+                claimed_at=None,
+            )
+            failed = _apply_held(db, fail, failed_rows, "failure")
+
+    db.commit()
+    return collected, retried, failed
+
+
+def collect_penalties(db: Session, gateway: PenaltyGateway, batch_size: int = PENALTY_BATCH_SIZE) -> int:
+    """Claim, charge and settle one batch; returns the number of penalties claimed"""
+    started = time.perf_counter()
+    charges = claim_penalties(db, batch_size)
+    if not charges:
+        return 0
+
+    try:
+        results = gateway.charge(charges)
+    except Exception as e:
+        # The whole batch failed to reach the gateway; retry every charge later
+        logger.error(f"Penalty gateway error: {str(e)}")
+        results = [ChargeResult(charge.transaction_id, False, error=str(e)[:500]) for charge in charges]
+
+    # A charge the gateway did not answer for is retried
+    answered = {result.transaction_id for result in results}
+    results += [
+        ChargeResult(charge.transaction_id, False, error="No result from gateway")
+        for charge in charges if charge.transaction_id not in answered
+    ]
+
+    collected, retried, failed = record_outcomes(db, results, gateway.name, charges[0].claim_token)
+    _stats.record(len(charges), collected, retried, failed, (time.perf_counter() - started) * 1000)
+    return len(charges)
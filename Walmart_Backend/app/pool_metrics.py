@@ -0,0 +1,169 @@
+"""
+Connection pool instrumentation.
+
+Request threads block in the pool when every connection is checked out and
+overflow is exhausted, which is invisible from the outside. The engine uses
+`InstrumentedQueuePool` (`InstrumentedAsyncQueuePool` for the async
+engine), a QueuePool that times each checkout (the wait for
+a free slot plus opening a connection when the pool grows), and pool events
+count connects, checkouts, checkins and invalidations and track the peak
+number of connections in use. `pool_stats()` combines both with the live
+pool state for the metrics endpoint.
+"""
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+# Recent checkout waits kept for percentiles
+WAIT_SAMPLE_SIZE = 1000
+# Checkouts slower than this count as having waited for a connection
+WAIT_THRESHOLD_SECONDS = 0.001
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # The pool currently being measured; replaced when the engine recreates it
+        self.pool = None
+        self._waits = deque(maxlen=WAIT_SAMPLE_SIZE)
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_in_use = 0
+        self.peak_overflow = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._waits.append(seconds)
+            self.total_wait += seconds
+            if seconds > self.max_wait:
+                self.max_wait = seconds
+            if seconds >= WAIT_THRESHOLD_SECONDS:
+                self.waited += 1
+
+    def record_timeout(self, seconds: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.total_wait += seconds
+            if seconds > self.max_wait:
+                self.max_wait = seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            timed = len(waits)
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "peak_in_use": self.peak_in_use,
+                "peak_overflow": self.peak_overflow,
+                "wait_ms": {
+                    "p50": waits[timed // 2] * 1000 if timed else 0.0,
+                    "p99": waits[max(0, int(timed * 0.99) - 1)] * 1000 if timed else 0.0,
+                    "max": self.max_wait * 1000,
+                    "total": self.total_wait * 1000,
+                },
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits"""
+
+    def __init__(self, *args, **kwargs):
+        # recreate() hands over the old pool's listeners in _dispatch
+        recreated = "_dispatch" in kwargs
+        super().__init__(*args, **kwargs)
+        self.metrics = None
+        if not recreated:
+            instrument_pool(self)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep the counters and listeners
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        self.metrics.pool = pool
+        return pool
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for asyncio engines"""
+
+
+def instrument_pool(pool: Pool) -> Pool:
+    """Count pool events into `pool.metrics`; also works on SQLite's single-connection pools"""
+    if getattr(pool, "metrics", None) is not None:
+        return pool
+    metrics = PoolMetrics()
+    metrics.pool = pool
+    pool.metrics = metrics
+
+    def on_connect(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.connects += 1
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        current = metrics.pool
+        queued = isinstance(current, QueuePool)
+        in_use = current.checkedout() if queued else 0
+        overflow = max(current.overflow(), 0) if queued else 0
+        with metrics._lock:
+            metrics.checkouts += 1
+            if in_use > metrics.peak_in_use:
+                metrics.peak_in_use = in_use
+            if overflow > metrics.peak_overflow:
+                metrics.peak_overflow = overflow
+
+    def on_checkin(dbapi_connection, connection_record):
+        with metrics._lock:
+            metrics.checkins += 1
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        with metrics._lock:
+            metrics.invalidations += 1
+
+    event.listen(pool, "connect", on_connect)
+    event.listen(pool, "checkout", on_checkout)
+    event.listen(pool, "checkin", on_checkin)
+    event.listen(pool, "invalidate", on_invalidate)
+    return pool
+
+
+def pool_stats(pool: Pool) -> dict:
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "in_use": pool.checkedout(),
+            "idle": pool.checkedin(),
+            # Connections open beyond the base size (overflow() counts up from -size)
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout_seconds": pool.timeout(),
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+    return stats
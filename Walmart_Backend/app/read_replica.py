@@ -0,0 +1,145 @@
+"""
+Read-replica routing.
+
+When DATABASE_READ_URL is set, the heavy read-only routes take their session
+from `get_read_db` / `get_async_read_db`, which read from the replica. A user
+whose request wrote to the primary keeps reading from the primary for
+READ_YOUR_WRITES_SECONDS afterwards, so replication lag never hides their
+own changes from them.
+
+Writes are noticed on the session itself (flushes and ORM insert/update/delete
+statements) and attributed to the bearer token of the request that made them,
+which `ReadYourWritesMiddleware` stashes in a context variable. Writes made
+outside a request, such as by the background workers, mark nobody.
+
+The record of recent writers lives in each worker process. Under several
+workers (`gunicorn -w 4`) a user's next request may land on a worker that did
+not see their write and read from the replica, unless the load balancer keeps
+their requests on one worker. So only routes that tolerate a few seconds of
+lag use the replica; anything a user checks right after their own write, such
+as the split-payment summary after paying, stays on `get_db` / `get_async_db`.
+"""
+from contextvars import ContextVar
+from typing import Optional
+import os
+
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import database
+from app.auth import decode_token
+from app.cache import TTLCache
+
+# Longer than the replica's usual lag; 0 turns the fallback off
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_YOUR_WRITES_MAX_USERS = int(os.getenv("READ_YOUR_WRITES_MAX_USERS", "100000"))
+
+# Users (by token user id, or email for older tokens) who wrote recently
+recent_writers = TTLCache(maxsize=READ_YOUR_WRITES_MAX_USERS, ttl=READ_YOUR_WRITES_SECONDS)
+
+_request_token: ContextVar[Optional[str]] = ContextVar("request_token", default=None)
+
+
+def _bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token
+
+
+def _writer_key(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        email, user_id = decode_token(token)
+    except HTTPException:
+        return None
+    return user_id or email
+
+
+def record_write() -> None:
+    """Send the current request's user to the primary for the next few seconds"""
+    key = _writer_key(_request_token.get())
+    if key is not None:
+        recent_writers.set(key, True)
+
+
+def wrote_recently(token: Optional[str]) -> bool:
+    key = _writer_key(token)
+    return key is not None and recent_writers.get(key) is not None
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    record_write()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _after_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        record_write()
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware exposing the request's bearer token to record_write"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        authorization = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        reset = _request_token.set(_bearer_token(authorization))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_token.reset(reset)
+
+
+def _use_primary(request: Request) -> bool:
+    if database.ReadSessionLocal is None:
+        return True
+    return wrote_recently(_bearer_token(request.headers.get("authorization")))
+
+
+def get_read_db(request: Request):
+    """get_db for read-only routes: the replica, unless this user wrote recently"""
+    if _use_primary(request):
+        sessions = request.app.dependency_overrides.get(database.get_db, database.get_db)()
+        db = next(sessions)
+        try:
+            yield db
+        finally:
+            sessions.close()
+        return
+
+    db = database.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    """get_async_db for read-only routes: the replica, unless this user wrote recently"""
+    if _use_primary(request):
+        sessions = request.app.dependency_overrides.get(database.get_async_db, database.get_async_db)()
+        db = await sessions.__anext__()
+        try:
+            yield db
+        finally:
+            await sessions.aclose()
+        return
+
+    async with database.AsyncReadSessionLocal() as db:
+        yield db
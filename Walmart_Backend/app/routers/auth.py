@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_async_db, to_schema
 from app.schemas import UserCreate, UserResponse, UserLogin, Token
-from app.auth import authenticate_user, create_access_token, get_current_user
+from app.auth import authenticate_user_async, create_access_token, get_current_user_async
 from app.crud import create_user, get_user_by_email
+from app.password_hashing import hash_password_async, PasswordHashingBusy
 from datetime import timedelta
 import os
 
@@ -11,23 +13,45 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+def _hashing_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+def _email_taken(db: Session, email: str) -> bool:
+    taken = get_user_by_email(db, email=email) is not None
+    # Don't hold a pooled connection while the password is hashed
+    db.close()
+    return taken
+
+def _create_user(db: Session, user: UserCreate, hashed_password: str) -> UserResponse:
+    return to_schema(UserResponse, create_user(db, user=user, hashed_password=hashed_password))
+
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    db_user = get_user_by_email(db, email=user.email)
-    if db_user:
+    if await db.run_sync(_email_taken, user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
+    try:
+        hashed_password = await hash_password_async(user.password)
+    except PasswordHashingBusy:
+        raise _hashing_busy()
+    
     # Create new user
-    db_user = create_user(db=db, user=user)
-    return db_user
+    return await db.run_sync(_create_user, user, hashed_password)
 
 @router.post("/login", response_model=Token)
-def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = authenticate_user(db, user_credentials.email, user_credentials.password)
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    try:
+        user = await authenticate_user_async(db, user_credentials.email, user_credentials.password)
+    except PasswordHashingBusy:
+        raise _hashing_busy()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -37,10 +61,10 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
-def read_users_me(current_user = Depends(get_current_user)):
+async def read_users_me(current_user = Depends(get_current_user_async)):
     return current_user
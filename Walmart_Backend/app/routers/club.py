@@ -1,7 +1,9 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db, SessionLocal
+from starlette.concurrency import run_in_threadpool
+from app.database import get_async_db, to_schema, SessionLocal
 from app.schemas import (
     ClubReadinessResponse, BuddyQueueCreate, BuddyQueueResponse,
     ClubbedOrderDetailResponse, LocationUpdate
@@ -10,30 +12,37 @@ from app.crud import (
     check_club_readiness, join_buddy_queue, find_compatible_buddies,
     create_clubbed_order, assign_driver_to_order, timeout_expired_buddies
 )
-from app.auth import get_current_user
+from app.auth import get_current_user_async
+from app.read_replica import get_async_read_db
 from app.models import BuddyQueue, ClubbedOrderUser
 from app.enums import BuddyStatus
 
 router = APIRouter(prefix="/club", tags=["Club & Save"])
 
+# Route bodies run on the request's AsyncSession via run_sync and return
+# plain data or schemas, so nothing is lazy loaded after they return.
+
 @router.post("/check-readiness", response_model=ClubReadinessResponse)
-def check_readiness(
+async def check_readiness(
     location: LocationUpdate,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Check if user can club orders in their location"""
-    return check_club_readiness(db, current_user.id, float(location.lat), float(location.lng))
+    return await db.run_sync(check_club_readiness, current_user.id, float(location.lat), float(location.lng))
+
+def _join_queue(db: Session, user_id: str, buddy_data: BuddyQueueCreate) -> BuddyQueueResponse:
+    return to_schema(BuddyQueueResponse, join_buddy_queue(db, user_id, buddy_data))
 
 @router.post("/join-queue", response_model=BuddyQueueResponse)
-def join_queue(
+async def join_queue(
     buddy_data: BuddyQueueCreate,
     background_tasks: BackgroundTasks,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Join the buddy queue for order clubbing"""
-    buddy_entry = join_buddy_queue(db, current_user.id, buddy_data)
+    buddy_entry = await db.run_sync(_join_queue, current_user.id, buddy_data)
     
     # Schedule background task to handle matching
     background_tasks.add_task(process_buddy_matching, buddy_entry.id)
@@ -41,24 +50,19 @@ def join_queue(
     # Also try immediate matching for faster response (testing)
     try:
         print(f"DEBUG: Attempting immediate matching for {buddy_entry.id}")
-        process_buddy_matching(buddy_entry.id)
+        # Matching uses its own sync session; keep it off the event loop
+        await run_in_threadpool(process_buddy_matching, buddy_entry.id)
     except Exception as e:
         print(f"DEBUG: Immediate matching failed: {e}")
     
     return buddy_entry
 
-@router.get("/status/{buddy_queue_id}")
-def get_club_status(
-    buddy_queue_id: str,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get the status of user's club request"""
+def _get_club_status(db: Session, user_id: str, buddy_queue_id: str) -> dict:
     buddy = db.query(BuddyQueue).filter(BuddyQueue.id == buddy_queue_id).first()
     if not buddy:
         raise HTTPException(status_code=404, detail="Buddy queue entry not found")
     
-    if buddy.user_id != current_user.id:
+    if buddy.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Check if entry has timed out and update status if needed
@@ -72,7 +76,7 @@ def get_club_status(
     if buddy.status == BuddyStatus.MATCHED.value:
         # Find the clubbed order
         clubbed_user = db.query(ClubbedOrderUser).filter(
-            ClubbedOrderUser.user_id == current_user.id,
+            ClubbedOrderUser.user_id == user_id,
             ClubbedOrderUser.cart_id == buddy.cart_id
         ).first()
         
@@ -88,13 +92,16 @@ def get_club_status(
         "created_at": buddy.created_at
     }
 
-@router.get("/detailed-status/{buddy_queue_id}")
-def get_detailed_club_status(
+@router.get("/status/{buddy_queue_id}")
+async def get_club_status(
     buddy_queue_id: str,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get detailed status of user's club request with nearby users and match potential"""
+    """Get the status of user's club request"""
+    return await db.run_sync(_get_club_status, current_user.id, buddy_queue_id)
+
+def _get_detailed_club_status(db: Session, user_id: str, buddy_queue_id: str) -> dict:
     from app.models import BuddyQueue, ClubbedOrderUser
     from app.enums import BuddyStatus
     from sqlalchemy import and_, func
@@ -105,7 +112,7 @@ def get_detailed_club_status(
     if not buddy:
         raise HTTPException(status_code=404, detail="Buddy queue entry not found")
     
-    if buddy.user_id != current_user.id:
+    if buddy.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Check if entry has timed out and update status if needed
@@ -160,7 +167,7 @@ def get_detailed_club_status(
     elif buddy.status == BuddyStatus.MATCHED.value:
         # Find clubbed order details
         clubbed_user = db.query(ClubbedOrderUser).filter(
-            ClubbedOrderUser.user_id == current_user.id,
+            ClubbedOrderUser.user_id == user_id,
             ClubbedOrderUser.cart_id == buddy.cart_id
         ).first()
         
@@ -187,6 +194,15 @@ def get_detailed_club_status(
     
     return response
 
+@router.get("/detailed-status/{buddy_queue_id}")
+async def get_detailed_club_status(
+    buddy_queue_id: str,
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get detailed status of user's club request with nearby users and match potential"""
+    return await db.run_sync(_get_detailed_club_status, current_user.id, buddy_queue_id)
+
 def process_buddy_matching(buddy_queue_id: str):
     """Background task to process buddy matching"""
     print(f"DEBUG: Starting buddy matching for {buddy_queue_id}")
@@ -223,13 +239,7 @@ def process_buddy_matching(buddy_queue_id: str):
     finally:
         db.close()
 
-@router.post("/queue-stats")
-def get_queue_statistics(
-    location: LocationUpdate,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get queue statistics for a specific location"""
+def _get_queue_statistics(db: Session, user_id: str, location: LocationUpdate) -> dict:
     from app.models import BuddyQueue
     from app.enums import BuddyStatus
     from sqlalchemy import and_, func
@@ -313,18 +323,21 @@ def get_queue_statistics(
         "peak_hours": peak_hours[:2]  # Limit to top 2 peak times
     }
 
-@router.post("/leave-queue/{buddy_queue_id}")
-def leave_queue(
-    buddy_queue_id: str,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.post("/queue-stats")
+async def get_queue_statistics(
+    location: LocationUpdate,
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Leave the buddy queue"""
+    """Get queue statistics for a specific location"""
+    return await db.run_sync(_get_queue_statistics, current_user.id, location)
+
+def _leave_queue(db: Session, user_id: str, buddy_queue_id: str) -> dict:
     buddy = db.query(BuddyQueue).filter(BuddyQueue.id == buddy_queue_id).first()
     if not buddy:
         raise HTTPException(status_code=404, detail="Buddy queue entry not found")
     
-    if buddy.user_id != current_user.id:
+    if buddy.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Remove from queue
@@ -333,19 +346,21 @@ def leave_queue(
     
     return {"success": True, "message": "Left buddy queue successfully"}
 
-@router.post("/extend-timeout/{buddy_queue_id}")
-def extend_timeout(
+@router.post("/leave-queue/{buddy_queue_id}")
+async def leave_queue(
     buddy_queue_id: str,
-    additional_minutes: int,
-    current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Extend the timeout for a buddy queue entry"""
+    """Leave the buddy queue"""
+    return await db.run_sync(_leave_queue, current_user.id, buddy_queue_id)
+
+def _extend_timeout(db: Session, user_id: str, buddy_queue_id: str, additional_minutes: int) -> dict:
     buddy = db.query(BuddyQueue).filter(BuddyQueue.id == buddy_queue_id).first()
     if not buddy:
         raise HTTPException(status_code=404, detail="Buddy queue entry not found")
     
-    if buddy.user_id != current_user.id:
+    if buddy.user_id != user_id:
         raise HTTPException(status_code=403, detail="Access denied")
     
     if buddy.status != BuddyStatus.WAITING.value:
@@ -360,3 +375,13 @@ def extend_timeout(
         "message": f"Timeout extended by {additional_minutes} minutes",
         "new_timeout_minutes": buddy.timeout_minutes
     }
+
+@router.post("/extend-timeout/{buddy_queue_id}")
+async def extend_timeout(
+    buddy_queue_id: str,
+    additional_minutes: int,
+    current_user = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Extend the timeout for a buddy queue entry"""
+    return await db.run_sync(_extend_timeout, current_user.id, buddy_queue_id, additional_minutes)
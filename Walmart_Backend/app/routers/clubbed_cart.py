@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.schemas import ClubbedCartResponse, ClubbedCartItem, CartItemCreate, AnonymizedUserCart
-from app.crud import get_clubbed_order_details, add_item_to_clubbed_cart
+from app.crud import get_clubbed_order_details, add_item_to_clubbed_cart, StaleClubbedOrderError
 from app.auth import get_current_user
 from app.models import User
 
@@ -45,7 +45,12 @@ def add_to_clubbed_cart(
     """
     Add an item to a user's cart within a clubbed order.
     """
-    new_item = add_item_to_clubbed_cart(db, clubbed_order_id, current_user.id, item)
+    try:
+        new_item = add_item_to_clubbed_cart(db, clubbed_order_id, current_user.id, item, current_user.name)
+    except StaleClubbedOrderError:
+        raise HTTPException(status_code=409, detail="The clubbed cart is busy, please retry.")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     if not new_item:
         raise HTTPException(status_code=400, detail="Could not add item. Ensure the clubbed order exists and you are a part of it.")
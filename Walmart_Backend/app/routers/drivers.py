@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+from typing import Optional, Set
+import hashlib
+import hmac
+import os
+from fastapi import APIRouter, HTTPException, Header, Request
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.schemas import DeliveryResponse, DeliveryStatusUpdate, DriverTelemetryBatch, DriverTelemetryResult
+from app.telemetry import driver_positions
+from app.driver_index import driver_index
+from app.database import run_with_session
+from app.events import event_bus
+from app.crud import update_delivery_status
+from app.models import Driver
+
+# Shared secret for signed driver requests; when unset the driver endpoints refuse everything
+DRIVER_TELEMETRY_SECRET = os.getenv("DRIVER_TELEMETRY_SECRET")
+DRIVER_TELEMETRY_MAX_BATCH = int(os.getenv("DRIVER_TELEMETRY_MAX_BATCH", "1000"))
+
+router = APIRouter(prefix="/drivers", tags=["Drivers"])
+
+def _unix_time(recorded_at) -> Optional[float]:
+    if recorded_at is None:
+        return None
+    if recorded_at.tzinfo is None:
+        recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+    return recorded_at.timestamp()
+
+def _verify_signature(message: bytes, signature: Optional[str]):
+    if not DRIVER_TELEMETRY_SECRET:
+        raise HTTPException(status_code=503, detail="Driver endpoints are not configured")
+    expected = hmac.new(DRIVER_TELEMETRY_SECRET.encode(), message, hashlib.sha256).hexdigest()
+    if not signature or not hmac.compare_digest(expected, signature):
+        raise HTTPException(status_code=401, detail="Invalid telemetry signature")
+
+def _existing_drivers(db: Session, driver_ids: Set[str]) -> Set[str]:
+    return {driver_id for (driver_id,) in db.query(Driver.id).filter(Driver.id.in_(list(driver_ids)))}
+
+@router.post("/telemetry", response_model=DriverTelemetryResult)
+async def ingest_telemetry(
+    request: Request,
+    x_telemetry_signature: Optional[str] = Header(None)
+):
+    """
+    Record a batch of driver GPS pings in the in-memory position store.
+    Positions reach the drivers table on the next periodic flush. The raw
+    body must carry a hex HMAC-SHA256 signature, keyed with
+    DRIVER_TELEMETRY_SECRET, in X-Telemetry-Signature. Pings for driver ids
+    that are not in the drivers table are dropped; ids are looked up only
+    the first time they are seen.
+    """
+    body = await request.body()
+    _verify_signature(body, x_telemetry_signature)
+    
+    try:
+        batch = DriverTelemetryBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    
+    if len(batch.pings) > DRIVER_TELEMETRY_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {DRIVER_TELEMETRY_MAX_BATCH} pings per batch")
+    
+    unknown = driver_positions.unseen({ping.driver_id for ping in batch.pings})
+    if unknown:
+        unknown -= await run_in_threadpool(run_with_session, request.app, _existing_drivers, unknown)
+    pings = [ping for ping in batch.pings if ping.driver_id not in unknown]
+    
+    applied = driver_positions.record_many(
+        (ping.driver_id, ping.lat, ping.lng, _unix_time(ping.recorded_at)) for ping in pings
+    )
+    for driver_id, lat, lng in applied:
+        driver_index.move(driver_id, lat, lng)
+    # Live positions for members tracking an order this driver carries
+    event_bus.publish_driver_positions(applied, datetime.utcnow())
+    
+    return DriverTelemetryResult(
+        received=len(batch.pings),
+        accepted=len(applied),
+        stale=len(pings) - len(applied),
+        unknown_drivers=len(batch.pings) - len(pings)
+    )
+
+@router.post("/deliveries/{delivery_id}/status", response_model=DeliveryResponse)
+async def report_delivery_status(
+    delivery_id: str,
+    request: Request,
+    x_telemetry_signature: Optional[str] = Header(None)
+):
+    """
+    Move a delivery to IN_TRANSIT or DELIVERED. Signed like telemetry
+    batches, except that the signed message is the delivery id, a newline
+    and the raw body, so a report cannot be replayed against another
+    delivery. Refused when DRIVER_TELEMETRY_SECRET is unset. Repeated or
+    out-of-order reports leave the delivery as it is and return its current
+    state. Members tracking the order are notified.
+    """
+    body = await request.body()
+    _verify_signature(delivery_id.encode() + b"\n" + body, x_telemetry_signature)
+    
+    try:
+        reported = DeliveryStatusUpdate.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    
+    def report(db):
+        delivery = update_delivery_status(db, delivery_id, reported.status)
+        return DeliveryResponse.model_validate(delivery) if delivery else None
+    
+    delivery = await run_in_threadpool(run_with_session, request.app, report)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
@@ -1,18 +1,35 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import List, Optional
+import asyncio
+import os
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.schemas import ClubbedOrderDetailResponse, DeliveryResponse
+from starlette.concurrency import run_in_threadpool
+from app.database import run_with_session
+from app.schemas import ClubbedOrderDetailResponse, DeliveryResponse, DriverPosition
 from app.crud import get_user_orders
-from app.auth import get_current_user
+from app.auth import get_current_user, get_user_for_token
+from app.enums import OrderStatus
+from app.events import event_bus
+from app.read_replica import get_read_db
 from app.models import ClubbedOrder, ClubbedOrderUser, Delivery
+from app.telemetry import driver_positions
+
+# Comment lines sent on idle streams so proxies do not close them
+EVENT_STREAM_HEARTBEAT_SECONDS = float(os.getenv("EVENT_STREAM_HEARTBEAT_SECONDS", "15"))
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
+# Optional here: browsers' EventSource cannot send headers and passes ?token= instead
+optional_security = HTTPBearer(auto_error=False)
+
 @router.get("/", response_model=List[ClubbedOrderDetailResponse])
 def get_my_orders(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get user's order history"""
     user_orders = get_user_orders(db, current_user.id)
@@ -22,7 +39,7 @@ def get_my_orders(
 def get_order_details(
     order_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get detailed information about a specific order"""
     
@@ -42,7 +59,7 @@ def get_order_details(
 def get_delivery_status(
     order_id: str,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get delivery status for an order"""
     
@@ -59,4 +76,100 @@ def get_delivery_status(
     if not delivery:
         raise HTTPException(status_code=404, detail="Delivery not found")
     
-    return delivery
+    return _delivery_response(delivery)
+
+def _delivery_response(delivery: Delivery) -> DeliveryResponse:
+    response = DeliveryResponse.model_validate(delivery)
+    # Live position from the telemetry store; the drivers table lags by a flush interval
+    position = driver_positions.get(delivery.driver_id)
+    if position is not None:
+        lat, lng, recorded_at = position
+        response.driver_position = DriverPosition(lat=lat, lng=lng, recorded_at=datetime.utcfromtimestamp(recorded_at))
+    return response
+
+def _is_order_member(db: Session, token: str, order_id: str) -> bool:
+    user = get_user_for_token(db, token)
+    return db.query(ClubbedOrderUser.id).filter(
+        ClubbedOrderUser.clubbed_order_id == order_id,
+        ClubbedOrderUser.user_id == user.id
+    ).first() is not None
+
+def _tracking_snapshot(db: Session, order_id: str) -> dict:
+    order_status = db.query(ClubbedOrder.status).filter(ClubbedOrder.id == order_id).scalar()
+    delivery = db.query(Delivery).filter(Delivery.clubbed_order_id == order_id).first()
+    return {
+        "type": "snapshot",
+        "order_status": OrderStatus(order_status).value if order_status else None,
+        "delivery": _delivery_response(delivery).model_dump(mode="json") if delivery else None,
+    }
+
+def _is_final(event: dict) -> bool:
+    """Nothing follows a delivered or cancelled order"""
+    return event.get("order_status") in (OrderStatus.DELIVERED.value, OrderStatus.CANCELLED.value)
+
+def _sse(event: dict) -> bytes:
+    return b"event: " + event["type"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+
+@router.get("/{order_id}/events")
+async def stream_order_events(
+    order_id: str,
+    request: Request,
+    token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """
+    Server-sent events for an order's delivery, replacing polling of
+    /orders/{order_id}/delivery. Starts with a `snapshot` of the current
+    state, then pushes `delivery_status`, `driver_position` and
+    `order_status` events to every member following the order. The stream
+    ends once the order is delivered or cancelled; idle streams also check
+    for that at each heartbeat, in case another worker made the change. Authenticates with a
+    Bearer header or, for EventSource clients, a `token` query parameter.
+    """
+    token = credentials.credentials if credentials else token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # No session is held for the life of the stream: each lookup opens and closes its own
+    if not await run_in_threadpool(run_with_session, request.app, _is_order_member, token, order_id):
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    async def events():
+        # Subscribe before reading the snapshot so no transition falls in between
+        subscription = event_bus.subscribe(order_id)
+        try:
+            snapshot = await run_in_threadpool(run_with_session, request.app, _tracking_snapshot, order_id)
+            yield _sse(snapshot)
+            if _is_final(snapshot):
+                return
+            if snapshot["delivery"]:
+                event_bus.watch_driver(snapshot["delivery"]["driver_id"], order_id)
+            
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENT_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # The bus is per process: a transition committed by another
+                    # worker never reaches this queue, so check the database
+                    snapshot = await run_in_threadpool(run_with_session, request.app, _tracking_snapshot, order_id)
+                    if _is_final(snapshot):
+                        yield _sse(snapshot)
+                        return
+                    yield b": keepalive\n\n"
+                    continue
+                if event["type"] == "delivery_status":
+                    event_bus.watch_driver(event["driver_id"], order_id)
+                yield _sse(event)
+                if _is_final(event):
+                    return
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
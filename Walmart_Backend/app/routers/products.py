@@ -1,16 +1,36 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, status
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, is_replica
 from app.schemas import ProductCreate, ProductResponse
 from app.crud import create_product, get_products, get_product
 from app.auth import get_current_user
+from app.read_replica import READ_YOUR_WRITES_SECONDS, get_read_db
+from app.cache import catalog_cache, catalog_changed_within, catalog_generation, encode_json, CachedResponse
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
+def _cached_json_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """Serve pre-encoded bytes, or 304 when the client already holds this version"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if cached.matches(if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+def _cacheable(db: Session, generation: int) -> bool:
+    """
+    Whether a response read at catalog `generation` may be cached: not if the
+    catalog was invalidated since, nor for replica reads just after a catalog
+    write, which may predate it.
+    """
+    if catalog_generation() != generation:
+        return False
+    return not (is_replica(db) and catalog_changed_within(READ_YOUR_WRITES_SECONDS))
+
 @router.post("/", response_model=ProductResponse)
 def create_new_product(
-    product: ProductCreate, 
+    product: ProductCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
@@ -18,15 +38,41 @@ def create_new_product(
     return create_product(db=db, product=product)
 
 @router.get("/", response_model=List[ProductResponse])
-def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def read_products(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get all products"""
-    products = get_products(db, skip=skip, limit=limit)
-    return products
+    cache_key = ("list", skip, limit)
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        generation = catalog_generation()
+        products = get_products(db, skip=skip, limit=limit)
+        cached = encode_json([
+            ProductResponse.model_validate(product).model_dump(mode="json")
+            for product in products
+        ])
+        if _cacheable(db, generation):
+            catalog_cache.set(cache_key, cached)
+    return _cached_json_response(cached, if_none_match)
 
 @router.get("/{product_id}", response_model=ProductResponse)
-def read_product(product_id: str, db: Session = Depends(get_db)):
+def read_product(
+    product_id: str,
+    db: Session = Depends(get_read_db),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get a specific product"""
-    db_product = get_product(db, product_id=product_id)
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
+    cache_key = ("product", product_id)
+    cached = catalog_cache.get(cache_key)
+    if cached is None:
+        generation = catalog_generation()
+        db_product = get_product(db, product_id=product_id)
+        if db_product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        cached = encode_json(ProductResponse.model_validate(db_product).model_dump(mode="json"))
+        if _cacheable(db, generation):
+            catalog_cache.set(cache_key, cached)
+    return _cached_json_response(cached, if_none_match)
@@ -1,35 +1,35 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+import hashlib
+import hmac
+import os
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header, Request
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_async_db
 from app.schemas import (
     UserOrderCreate, UserOrderResponse, PaymentCommitRequest, 
     PaymentConfirmationRequest, OrderCancellationRequest, OrderCancellationResponse,
-    PaymentTransactionResponse, SplitPaymentSummary, OrderCommitmentStatus
+    PaymentTransactionResponse, SplitPaymentSummary, OrderCommitmentStatus,
+    PaymentWebhookBatch, PaymentWebhookBatchResult
 )
 from app.crud import (
     create_user_orders_for_clubbed_order, commit_to_payment, confirm_payment,
-    cancel_user_order, get_split_payment_summary, check_all_commitments,
-    check_all_payments_confirmed
+    cancel_user_order, get_split_payment_summary, apply_payment_confirmations
 )
-from app.auth import get_current_user
+from app.auth import get_current_user_async
 from app.models import User, UserOrder, PaymentTransaction, OrderCancellation
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Shared secret for signed gateway callbacks; when unset signatures are not checked
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET")
+PAYMENT_WEBHOOK_MAX_BATCH = int(os.getenv("PAYMENT_WEBHOOK_MAX_BATCH", "1000"))
+
 router = APIRouter(prefix="/split-payment", tags=["Split Payment"])
 
-@router.post("/create-user-orders/{clubbed_order_id}")
-def create_user_orders(
-    clubbed_order_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """
-    Create individual user orders for a clubbed order
-    This is called when a clubbed order is successfully matched
-    """
+def _create_user_orders(db: Session, user_id: str, clubbed_order_id: str):
     try:
         user_orders = create_user_orders_for_clubbed_order(db, clubbed_order_id)
         
@@ -48,26 +48,30 @@ def create_user_orders(
         logger.error(f"Failed to create user orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create user orders")
 
-@router.post("/commit")
-def commit_payment(
-    request: PaymentCommitRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.post("/create-user-orders/{clubbed_order_id}")
+async def create_user_orders(
+    clubbed_order_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    User commits to payment and provides delivery details
+    Create individual user orders for a clubbed order
+    This is called when a clubbed order is successfully matched
     """
+    return await db.run_sync(_create_user_orders, current_user.id, clubbed_order_id)
+
+def _commit_payment(db: Session, user_id: str, request: PaymentCommitRequest):
     try:
         # Verify that the user order belongs to the current user
         user_order = db.query(UserOrder).filter(
             UserOrder.id == request.user_order_id,
-            UserOrder.user_id == current_user.id
+            UserOrder.user_id == user_id
         ).first()
         
         if not user_order:
             raise HTTPException(status_code=404, detail="User order not found")
         
-        success = commit_to_payment(
+        progress = commit_to_payment(
             db,
             request.user_order_id,
             request.payment_method,
@@ -76,11 +80,10 @@ def commit_payment(
             request.special_instructions
         )
         
-        if not success:
+        if not progress:
             raise HTTPException(status_code=400, detail="Failed to commit to payment or deadline passed")
         
-        # Check if all users have committed
-        all_committed = check_all_commitments(db, user_order.clubbed_order_id)
+        all_committed = progress.all_committed
         
         return {
             "success": True,
@@ -95,20 +98,23 @@ def commit_payment(
         logger.error(f"Failed to commit payment: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to commit to payment")
 
-@router.post("/confirm")
-def confirm_payment_endpoint(
-    request: PaymentConfirmationRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.post("/commit")
+async def commit_payment(
+    request: PaymentCommitRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Confirm payment for a user order
+    User commits to payment and provides delivery details
     """
+    return await db.run_sync(_commit_payment, current_user.id, request)
+
+def _confirm_payment(db: Session, user_id: str, request: PaymentConfirmationRequest):
     try:
         # Verify that the user order belongs to the current user
         user_order = db.query(UserOrder).filter(
             UserOrder.id == request.user_order_id,
-            UserOrder.user_id == current_user.id
+            UserOrder.user_id == user_id
         ).first()
         
         if not user_order:
@@ -117,18 +123,17 @@ def confirm_payment_endpoint(
         if not user_order.is_committed:
             raise HTTPException(status_code=400, detail="Must commit to payment first")
         
-        success = confirm_payment(
+        progress = confirm_payment(
             db,
             request.user_order_id,
             request.external_transaction_id,
             request.payment_gateway
         )
         
-        if not success:
+        if not progress:
             raise HTTPException(status_code=400, detail="Failed to confirm payment")
         
-        # Check if all payments are confirmed
-        all_confirmed = check_all_payments_confirmed(db, user_order.clubbed_order_id)
+        all_confirmed = progress.all_confirmed
         
         return {
             "success": True,
@@ -143,20 +148,59 @@ def confirm_payment_endpoint(
         logger.error(f"Failed to confirm payment: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to confirm payment")
 
-@router.post("/cancel", response_model=OrderCancellationResponse)
-def cancel_order(
-    request: OrderCancellationRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.post("/confirm")
+async def confirm_payment_endpoint(
+    request: PaymentConfirmationRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Cancel a user order and apply penalties/compensation
+    Confirm payment for a user order
+    """
+    return await db.run_sync(_confirm_payment, current_user.id, request)
+
+@router.post("/webhooks/batch", response_model=PaymentWebhookBatchResult)
+async def payment_webhook_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    x_webhook_signature: Optional[str] = Header(None)
+):
+    """
+    Apply a burst of payment gateway settlement callbacks in one transaction.
+    The raw body must carry a hex HMAC-SHA256 signature, keyed with
+    PAYMENT_WEBHOOK_SECRET, in X-Webhook-Signature; without a configured
+    secret every batch is refused.
     """
+    if not PAYMENT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Payment webhooks are not configured")
+    body = await request.body()
+    expected = hmac.new(PAYMENT_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    if not x_webhook_signature or not hmac.compare_digest(expected, x_webhook_signature):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    try:
+        batch = PaymentWebhookBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    
+    if len(batch.confirmations) > PAYMENT_WEBHOOK_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {PAYMENT_WEBHOOK_MAX_BATCH} confirmations per batch")
+    
+    try:
+        return await db.run_sync(
+            apply_payment_confirmations, [confirmation.model_dump() for confirmation in batch.confirmations]
+        )
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Failed to apply payment webhook batch: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to apply payment webhook batch")
+
+def _cancel_order(db: Session, user_id: str, request: OrderCancellationRequest):
     try:
         # Verify that the user order belongs to the current user
         user_order = db.query(UserOrder).filter(
             UserOrder.id == request.user_order_id,
-            UserOrder.user_id == current_user.id
+            UserOrder.user_id == user_id
         ).first()
         
         if not user_order:
@@ -168,7 +212,7 @@ def cancel_order(
         cancellation = cancel_user_order(
             db,
             request.user_order_id,
-            current_user.id,
+            user_id,
             request.cancellation_reason
         )
         
@@ -192,17 +236,20 @@ def cancel_order(
         logger.error(f"Failed to cancel order: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to cancel order")
 
-@router.get("/summary/{clubbed_order_id}", response_model=SplitPaymentSummary)
-def get_payment_summary(
-    clubbed_order_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.post("/cancel", response_model=OrderCancellationResponse)
+async def cancel_order(
+    request: OrderCancellationRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Get payment summary for the current user in a clubbed order
+    Cancel a user order and apply penalties/compensation
     """
+    return await db.run_sync(_cancel_order, current_user.id, request)
+
+def _get_payment_summary(db: Session, user_id: str, clubbed_order_id: str):
     try:
-        summary = get_split_payment_summary(db, clubbed_order_id, current_user.id)
+        summary = get_split_payment_summary(db, clubbed_order_id, user_id)
         
         if not summary:
             raise HTTPException(status_code=404, detail="Payment summary not found")
@@ -215,15 +262,18 @@ def get_payment_summary(
         logger.error(f"Failed to get payment summary: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get payment summary")
 
-@router.get("/status/{clubbed_order_id}")
-def get_commitment_status(
+@router.get("/summary/{clubbed_order_id}", response_model=SplitPaymentSummary)
+async def get_payment_summary(
     clubbed_order_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Get commitment and payment status for a clubbed order
+    Get payment summary for the current user in a clubbed order
     """
+    return await db.run_sync(_get_payment_summary, current_user.id, clubbed_order_id)
+
+def _get_commitment_status(db: Session, user_id: str, clubbed_order_id: str):
     try:
         # Get all user orders for this clubbed order
         user_orders = db.query(UserOrder).filter(
@@ -234,7 +284,7 @@ def get_commitment_status(
             raise HTTPException(status_code=404, detail="Clubbed order not found")
         
         # Check if current user is part of this order
-        user_in_order = any(order.user_id == current_user.id for order in user_orders)
+        user_in_order = any(order.user_id == user_id for order in user_orders)
         if not user_in_order:
             raise HTTPException(status_code=403, detail="You are not part of this order")
         
@@ -261,20 +311,23 @@ def get_commitment_status(
         logger.error(f"Failed to get commitment status: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get commitment status")
 
-@router.get("/transactions/{user_order_id}")
-def get_user_transactions(
-    user_order_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/status/{clubbed_order_id}")
+async def get_commitment_status(
+    clubbed_order_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Get all transactions for a user order
+    Get commitment and payment status for a clubbed order
     """
+    return await db.run_sync(_get_commitment_status, current_user.id, clubbed_order_id)
+
+def _get_user_transactions(db: Session, user_id: str, user_order_id: str):
     try:
         # Verify that the user order belongs to the current user
         user_order = db.query(UserOrder).filter(
             UserOrder.id == user_order_id,
-            UserOrder.user_id == current_user.id
+            UserOrder.user_id == user_id
         ).first()
         
         if not user_order:
@@ -306,17 +359,21 @@ def get_user_transactions(
         logger.error(f"Failed to get transactions: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get transactions")
 
-@router.get("/my-orders")
-def get_my_user_orders(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+@router.get("/transactions/{user_order_id}")
+async def get_user_transactions(
+    user_order_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     """
-    Get all user orders for the current user
+    Get all transactions for a user order
     """
+    return await db.run_sync(_get_user_transactions, current_user.id, user_order_id)
+
+def _get_my_user_orders(db: Session, user_id: str):
     try:
         user_orders = db.query(UserOrder).filter(
-            UserOrder.user_id == current_user.id
+            UserOrder.user_id == user_id
         ).order_by(UserOrder.created_at.desc()).all()
         
         return [
@@ -340,3 +397,13 @@ def get_my_user_orders(
     except Exception as e:
         logger.error(f"Failed to get user orders: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get user orders")
+
+@router.get("/my-orders")
+async def get_my_user_orders(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
+    """
+    Get all user orders for the current user
+    """
+    return await db.run_sync(_get_my_user_orders, current_user.id)
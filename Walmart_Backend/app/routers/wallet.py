@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.schemas import WalletBalanceResponse
+from app.auth import get_current_user
+from app.wallet import get_wallet_balance
+
+router = APIRouter(prefix="/wallet", tags=["Wallet"])
+
+@router.get("/", response_model=WalletBalanceResponse)
+def read_wallet(
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's wallet balance (compensation credits less wallet charges)"""
+    wallet = get_wallet_balance(db, current_user.id)
+    if not wallet:
+        return WalletBalanceResponse(user_id=current_user.id, balance=0.0)
+    return WalletBalanceResponse(user_id=wallet.user_id, balance=float(wallet.balance), updated_at=wallet.updated_at)
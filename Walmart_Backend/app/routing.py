@@ -0,0 +1,164 @@
+"""
+Stop ordering for multi-drop deliveries.
+
+A clubbed order is delivered to every member, so each delivery is a small
+open route: start at the driver, visit every drop-off, finish at the last
+one. Routes are built with nearest neighbour and improved with 2-opt and
+Or-opt moves until neither shortens them, over a haversine matrix whose pairwise
+distances are memoized (drop-offs repeat across deliveries in the same
+neighbourhood).
+
+Solving is CPU-bound, so batches can be fanned out to a process pool of
+ROUTING_WORKERS processes (0 solves inline). Like the password hashing
+pool, this module must stay importable without the database, because pool
+workers import it in a fresh interpreter.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from app.geo import haversine
+
+ROUTING_WORKERS = int(os.getenv("ROUTING_WORKERS", "0"))
+ROUTE_DISTANCE_CACHE_SIZE = int(os.getenv("ROUTE_DISTANCE_CACHE_SIZE", "200000"))
+
+Point = Tuple[float, float]
+
+
+def _point_key(point: Point) -> Point:
+    # ~1 m resolution is plenty for ordering stops
+    return round(float(point[0]), 5), round(float(point[1]), 5)
+
+
+@lru_cache(maxsize=ROUTE_DISTANCE_CACHE_SIZE)
+def _leg_meters(a: Point, b: Point) -> float:
+    return haversine(a[0], a[1], b[0], b[1])
+
+
+def distance_matrix(points: Sequence[Point]) -> List[List[float]]:
+    keys = [_point_key(point) for point in points]
+    size = len(keys)
+    matrix = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1, size):
+            # Symmetric: one cache entry per unordered pair
+            a, b = (keys[i], keys[j]) if keys[i] <= keys[j] else (keys[j], keys[i])
+            matrix[i][j] = matrix[j][i] = _leg_meters(a, b)
+    return matrix
+
+
+def _nearest_neighbour(matrix: List[List[float]]) -> List[int]:
+    path = [0]
+    unvisited = set(range(1, len(matrix)))
+    while unvisited:
+        last = matrix[path[-1]]
+        nearest = min(unvisited, key=lambda node: last[node])
+        unvisited.remove(nearest)
+        path.append(nearest)
+    return path
+
+
+def _two_opt(path: List[int], matrix: List[List[float]]) -> List[int]:
+    """Reverse segments while that shortens the open path; path[0] stays fixed"""
+    last = len(path) - 1
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, last):
+            before = path[i - 1]
+            for j in range(i + 1, last + 1):
+                after = path[j + 1] if j < last else None
+                removed = matrix[before][path[i]] + (matrix[path[j]][after] if after is not None else 0.0)
+                added = matrix[before][path[j]] + (matrix[path[i]][after] if after is not None else 0.0)
+                if added < removed - 1e-9:
+                    path[i:j + 1] = reversed(path[i:j + 1])
+                    improved = True
+    return path
+
+
+def _or_opt(path: List[int], matrix: List[List[float]]) -> bool:
+    """Move one run of up to three stops to a cheaper position; returns True if the path changed"""
+    def cost(a, b):
+        return matrix[a][b] if a is not None and b is not None else 0.0
+
+    size = len(path)
+    for length in (1, 2, 3):
+        for start in range(1, size - length + 1):
+            end = start + length - 1
+            before, after = path[start - 1], path[end + 1] if end + 1 < size else None
+            first, last = path[start], path[end]
+            gain = cost(before, first) + cost(last, after) - cost(before, after)
+            rest = path[:start] + path[end + 1:]
+            for position in range(1, len(rest) + 1):
+                if position == start:
+                    continue
+                left, right = rest[position - 1], rest[position] if position < len(rest) else None
+                for segment in (path[start:end + 1], path[end:start - 1:-1]):
+                    added = cost(left, segment[0]) + cost(segment[-1], right) - cost(left, right)
+                    if added < gain - 1e-9:
+                        path[:] = rest[:position] + segment + rest[position:]
+                        return True
+    return False
+
+
+def solve_route(origin: Point, stops: Sequence[Point]) -> Tuple[List[int], List[float]]:
+    """
+    Order `stops` starting from `origin`.
+
+    Returns the stop indices in visiting order and the cumulative distance in
+    meters at which each of those stops is reached.
+    """
+    if not stops:
+        return [], []
+    matrix = distance_matrix([origin, *stops])
+    path = _two_opt(_nearest_neighbour(matrix), matrix)
+    # 2-opt cannot move a stop without reversing what lies between; Or-opt can
+    while _or_opt(path, matrix):
+        _two_opt(path, matrix)
+
+    cumulative, travelled = [], 0.0
+    for previous, node in zip(path, path[1:]):
+        travelled += matrix[previous][node]
+        cumulative.append(travelled)
+    return [node - 1 for node in path[1:]], cumulative
+
+
+def _solve_job(problem):
+    key, origin, stops = problem
+    return key, solve_route(origin, stops)
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: workers must not inherit the server's threads and locks
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+def shutdown_routing_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def solve_routes(problems: Sequence[tuple], workers: int = ROUTING_WORKERS) -> dict:
+    """Solve (key, origin, stops) problems; returns {key: (order, cumulative_meters)}"""
+    if workers <= 0 or len(problems) < 2:
+        return dict(map(_solve_job, problems))
+    chunksize = max(1, len(problems) // (workers * 4))
+    return dict(_get_executor(workers).map(_solve_job, problems, chunksize=chunksize))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from decimal import Decimal
 from datetime import datetime
@@ -166,14 +166,21 @@ class DriverResponse(DriverBase):
         from_attributes = True
 
 # Delivery schemas
+class DriverPosition(BaseModel):
+    lat: float
+    lng: float
+    recorded_at: datetime
+
 class DeliveryResponse(BaseModel):
     id: str
     driver_id: str
     clubbed_order_id: str
     estimated_time_minutes: Optional[int] = None
+    estimated_delivery: Optional[datetime] = None
     status: DeliveryStatus
-    created_at: datetime
+    created_at: Optional[datetime] = None
     driver: Optional[DriverResponse] = None
+    driver_position: Optional[DriverPosition] = None
     
     class Config:
         from_attributes = True
@@ -198,6 +205,27 @@ class LocationUpdate(BaseModel):
     lat: Decimal
     lng: Decimal
 
+# Driver telemetry schemas
+class DriverPing(BaseModel):
+    driver_id: str
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    recorded_at: Optional[datetime] = None
+
+class DriverTelemetryBatch(BaseModel):
+    """GPS fixes posted together by driver devices"""
+    pings: List[DriverPing]
+
+class DriverTelemetryResult(BaseModel):
+    received: int
+    accepted: int
+    stale: int
+    unknown_drivers: int
+
+class DeliveryStatusUpdate(BaseModel):
+    """Status reported by the driver's device"""
+    status: DeliveryStatus
+
 # Split Payment and Commitment schemas
 
 class UserOrderCreate(BaseModel):
@@ -236,6 +264,18 @@ class PaymentConfirmationRequest(BaseModel):
     external_transaction_id: Optional[str] = None  # For online payments
     payment_gateway: Optional[str] = None
 
+class PaymentWebhookBatch(BaseModel):
+    """Settlement callbacks delivered together by the payment gateway"""
+    confirmations: List[PaymentConfirmationRequest]
+
+class PaymentWebhookBatchResult(BaseModel):
+    received: int
+    confirmed: int
+    duplicates: int
+    unknown: List[str]
+    rejected: List[str]
+    completed_clubbed_orders: List[str]
+
 class OrderCancellationRequest(BaseModel):
     user_order_id: str
     cancellation_reason: str
@@ -268,6 +308,11 @@ class PaymentTransactionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class WalletBalanceResponse(BaseModel):
+    user_id: str
+    balance: float
+    updated_at: Optional[datetime] = None
+
 class SplitPaymentSummary(BaseModel):
     clubbed_order_id: str
     total_order_value: float
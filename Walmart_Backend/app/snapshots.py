@@ -0,0 +1,265 @@
+"""
+Materialized, in-process snapshots of clubbed orders.
+
+Every member of a clubbed order polls the clubbed cart and split payment
+summary, and each poll used to rebuild the same totals. A snapshot holds the
+shared state once per clubbed order: per-member cart totals and items, the
+combined value and the payment progress. Member responses are projections of
+it. Snapshots are rebuilt lazily after an invalidation (cart change, commit,
+payment, cancellation or status change) and otherwise expire after a short TTL,
+which also bounds staleness across uvicorn workers.
+
+The split payment summary needs much less: the member's own order plus the
+group's payment aggregates. Those aggregates are cached separately and are
+shared by every member; they are invalidated together with the snapshot.
+"""
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.cache import TTLCache
+from app.database import is_replica
+from app.models import CartItem, ClubbedOrder, ClubbedOrderUser, Product, UserOrder
+
+CLUBBED_SNAPSHOT_TTL_SECONDS = float(os.getenv("CLUBBED_SNAPSHOT_TTL_SECONDS", "30"))
+CLUBBED_SNAPSHOT_MAX_ENTRIES = int(os.getenv("CLUBBED_SNAPSHOT_MAX_ENTRIES", "5000"))
+
+
+class MemberSnapshot:
+    __slots__ = (
+        "user_id", "cart_id", "cart_total", "item_count", "items",
+        "user_order_id", "individual_total", "commitment_deadline", "is_committed", "payment_status",
+    )
+
+    def __init__(self, user_id: str, cart_id: str, cart_total: float, item_count: int):
+        self.user_id = user_id
+        self.cart_id = cart_id
+        self.cart_total = cart_total
+        self.item_count = item_count
+        self.items = []
+        self.user_order_id = None
+        self.individual_total = None
+        self.commitment_deadline = None
+        self.is_committed = False
+        self.payment_status = None
+
+
+class ClubbedOrderSnapshot:
+    """Read-only view of a clubbed order shared by all of its members"""
+
+    def __init__(self, clubbed_order: ClubbedOrder, members: List[MemberSnapshot]):
+        self.id = clubbed_order.id
+        self.status = clubbed_order.status
+        self.combined_value = float(clubbed_order.combined_value or 0)
+        self.payment_confirmation_deadline = clubbed_order.payment_confirmation_deadline
+        self.members = members
+        self.built_at = datetime.utcnow()
+
+        user_orders = [member for member in members if member.user_order_id]
+        self.member_count = len(user_orders)
+        self.committed_count = sum(1 for member in user_orders if member.is_committed)
+        self.confirmed_count = sum(1 for member in user_orders if member.payment_status == 'CONFIRMED')
+
+    @property
+    def all_committed(self) -> bool:
+        return self.committed_count == self.member_count
+
+    def member(self, user_id: str) -> Optional[MemberSnapshot]:
+        for member in self.members:
+            if member.user_id == user_id:
+                return member
+        return None
+
+    def project_for(self, user_id: str):
+        """Return (anonymized_users, own_items, other_users_total) as seen by `user_id`"""
+        anonymized_users = []
+        other_users_total = 0.0
+        own_items = []
+        for i, member in enumerate(self.members):
+            is_current_user = member.user_id == user_id
+            anonymized_users.append({
+                "user_id": "You" if is_current_user else f"User {i + 1}",
+                "cart_total": member.cart_total,
+                "item_count": member.item_count,
+                "is_current_user": is_current_user
+            })
+            if is_current_user:
+                own_items = [dict(item) for item in member.items]
+            else:
+                other_users_total += member.cart_total
+        return anonymized_users, own_items, other_users_total
+
+
+class GroupPaymentAggregate:
+    """Per-group part of the split payment summary"""
+    __slots__ = ("member_count", "committed_count", "confirmed_count", "combined_value")
+
+    def __init__(self, member_count: int, committed_count: int, confirmed_count: int, combined_value: float):
+        self.member_count = member_count
+        self.committed_count = committed_count
+        self.confirmed_count = confirmed_count
+        self.combined_value = combined_value
+
+    @property
+    def all_committed(self) -> bool:
+        return self.committed_count == self.member_count
+
+
+_snapshots = TTLCache(maxsize=CLUBBED_SNAPSHOT_MAX_ENTRIES, ttl=CLUBBED_SNAPSHOT_TTL_SECONDS)
+_aggregates = TTLCache(maxsize=CLUBBED_SNAPSHOT_MAX_ENTRIES, ttl=CLUBBED_SNAPSHOT_TTL_SECONDS)
+# cart_id -> clubbed_order_id for carts that appear in a cached snapshot
+_cart_index = TTLCache(maxsize=CLUBBED_SNAPSHOT_MAX_ENTRIES * 8, ttl=CLUBBED_SNAPSHOT_TTL_SECONDS)
+# Bumped on every invalidation so a build that raced with a write is not stored
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def _generation(clubbed_order_id: str) -> int:
+    with _generations_lock:
+        return _generations.get(clubbed_order_id, 0)
+
+
+def invalidate_clubbed_order(clubbed_order_id: Optional[str]) -> None:
+    if not clubbed_order_id:
+        return
+    with _generations_lock:
+        _generations[clubbed_order_id] = _generations.get(clubbed_order_id, 0) + 1
+        if len(_generations) > CLUBBED_SNAPSHOT_MAX_ENTRIES * 8:
+            _generations.clear()
+    _snapshots.pop(clubbed_order_id)
+    _aggregates.pop(clubbed_order_id)
+
+
+def invalidate_cart(cart_id: str) -> None:
+    """Invalidate the snapshot holding `cart_id`, if one is cached"""
+    invalidate_clubbed_order(_cart_index.get(cart_id))
+
+
+def clear_snapshots() -> None:
+    _snapshots.clear()
+    _aggregates.clear()
+    _cart_index.clear()
+
+
+def build_clubbed_order_snapshot(db: Session, clubbed_order_id: str) -> Optional[ClubbedOrderSnapshot]:
+    """Load everything a member view needs with four queries, independent of group size"""
+    clubbed_order = db.query(ClubbedOrder).filter(ClubbedOrder.id == clubbed_order_id).first()
+    if not clubbed_order:
+        return None
+
+    member_carts = db.query(ClubbedOrderUser.cart_id).filter(
+        ClubbedOrderUser.clubbed_order_id == clubbed_order_id
+    )
+    cart_totals = db.query(
+        CartItem.cart_id.label("cart_id"),
+        func.sum(Product.price * CartItem.quantity).label("cart_total"),
+        func.count(CartItem.id).label("item_count")
+    ).join(
+        Product, Product.id == CartItem.product_id
+    ).filter(
+        CartItem.cart_id.in_(member_carts)
+    ).group_by(CartItem.cart_id).subquery()
+
+    rows = db.query(
+        ClubbedOrderUser.user_id,
+        ClubbedOrderUser.cart_id,
+        cart_totals.c.cart_total,
+        cart_totals.c.item_count
+    ).outerjoin(
+        cart_totals, cart_totals.c.cart_id == ClubbedOrderUser.cart_id
+    ).filter(
+        ClubbedOrderUser.clubbed_order_id == clubbed_order_id
+    ).order_by(ClubbedOrderUser.id).all()
+
+    members = [
+        MemberSnapshot(user_id, cart_id, float(cart_total or 0), item_count or 0)
+        for user_id, cart_id, cart_total, item_count in rows
+    ]
+    by_cart = {member.cart_id: member for member in members}
+
+    items = db.query(
+        CartItem.cart_id, CartItem.quantity, Product.name, Product.price
+    ).join(
+        Product, Product.id == CartItem.product_id
+    ).filter(CartItem.cart_id.in_(list(by_cart))).all()
+    for cart_id, quantity, name, price in items:
+        by_cart[cart_id].items.append({
+            "product_name": name,
+            "quantity": quantity,
+            "price": float(price),
+            "added_by_user": "You"
+        })
+
+    by_user = {member.user_id: member for member in members}
+    user_orders = db.query(
+        UserOrder.id, UserOrder.user_id, UserOrder.individual_total, UserOrder.commitment_deadline,
+        UserOrder.is_committed, UserOrder.payment_status
+    ).filter(UserOrder.clubbed_order_id == clubbed_order_id).all()
+    for user_order_id, user_id, individual_total, commitment_deadline, is_committed, payment_status in user_orders:
+        member = by_user.get(user_id)
+        if member is None:
+            continue
+        member.user_order_id = user_order_id
+        member.individual_total = float(individual_total)
+        member.commitment_deadline = commitment_deadline
+        member.is_committed = bool(is_committed)
+        member.payment_status = payment_status
+
+    return ClubbedOrderSnapshot(clubbed_order, members)
+
+
+def get_clubbed_order_snapshot(db: Session, clubbed_order_id: str) -> Optional[ClubbedOrderSnapshot]:
+    snapshot = _snapshots.get(clubbed_order_id)
+    if snapshot is not None:
+        return snapshot
+
+    generation = _generation(clubbed_order_id)
+    snapshot = build_clubbed_order_snapshot(db, clubbed_order_id)
+    if snapshot is not None and _generation(clubbed_order_id) == generation:
+        _snapshots.set(clubbed_order_id, snapshot)
+        for member in snapshot.members:
+            _cart_index.set(member.cart_id, clubbed_order_id)
+    return snapshot
+
+
+def get_member_payment_view(db: Session, clubbed_order_id: str, user_id: str):
+    """
+    Return (user_order_row, GroupPaymentAggregate) for a member, or None.
+
+    One query either way: the member's order alone when the group aggregate
+    is cached, otherwise the member's order joined with the clubbed order's
+    progress counters.
+    """
+    member_columns = (UserOrder.id, UserOrder.individual_total, UserOrder.commitment_deadline)
+    member_filter = (UserOrder.clubbed_order_id == clubbed_order_id, UserOrder.user_id == user_id)
+
+    aggregate = _aggregates.get(clubbed_order_id)
+    if aggregate is not None:
+        member = db.query(*member_columns).filter(*member_filter).first()
+        return (member, aggregate) if member else None
+
+    generation = _generation(clubbed_order_id)
+    row = db.query(
+        *member_columns,
+        ClubbedOrder.combined_value,
+        ClubbedOrder.member_count,
+        ClubbedOrder.committed_count,
+        ClubbedOrder.confirmed_count
+    ).join(
+        ClubbedOrder, ClubbedOrder.id == UserOrder.clubbed_order_id
+    ).filter(*member_filter).first()
+    if row is None:
+        return None
+
+    aggregate = GroupPaymentAggregate(
+        row.member_count, int(row.committed_count or 0), int(row.confirmed_count or 0),
+        float(row.combined_value or 0)
+    )
+    # Replica rows may predate the last invalidation; only share primary reads
+    if _generation(clubbed_order_id) == generation and not is_replica(db):
+        _aggregates.set(clubbed_order_id, aggregate)
+    return row, aggregate
@@ -0,0 +1,161 @@
+"""
+Latest driver positions, kept in memory.
+
+Drivers post GPS pings in batches. Writing every ping through the ORM would
+cost one row update per ping; instead pings land in `driver_positions`, a
+compact store of parallel arrays indexed by a per-driver slot, and a
+background task writes the positions that changed since its last run to the
+drivers table with one executemany UPDATE every
+DRIVER_POSITION_FLUSH_SECONDS. Any number of pings from one driver between
+flushes coalesce into a single row write.
+
+Driver assignment and order tracking read positions from here; the table is
+the durable copy, used after a restart and by other workers.
+"""
+import os
+import threading
+import time
+from array import array
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+
+from app.models import Driver
+
+DRIVER_POSITION_FLUSH_SECONDS = float(os.getenv("DRIVER_POSITION_FLUSH_SECONDS", "5"))
+
+
+class DriverPositionStore:
+    """Latest (lat, lng, recorded_at) per driver in parallel arrays, with a dirty list for flushing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._driver_ids = []
+        self._lat = array("d")
+        self._lng = array("d")
+        # Unix time of the fix, as reported by the device
+        self._recorded_at = array("d")
+        self._dirty = bytearray()
+        self._dirty_slots = array("l")
+        self.accepted = 0
+        self.stale = 0
+        self.flushed = 0
+
+    def __len__(self) -> int:
+        return len(self._driver_ids)
+
+    def record_many(self, pings: Iterable[Tuple[str, float, float, Optional[float]]]) -> List[Tuple[str, float, float]]:
+        """
+        Store (driver_id, lat, lng, recorded_at) pings; recorded_at defaults to
+        now. Pings older than the stored fix are ignored. Returns the
+        (driver_id, lat, lng) positions that were applied.
+        """
+        now = time.time()
+        applied = []
+        with self._lock:
+            for driver_id, lat, lng, recorded_at in pings:
+                recorded_at = now if recorded_at is None else recorded_at
+                slot = self._slots.get(driver_id)
+                if slot is None:
+                    slot = len(self._driver_ids)
+                    self._slots[driver_id] = slot
+                    self._driver_ids.append(driver_id)
+                    self._lat.append(lat)
+                    self._lng.append(lng)
+                    self._recorded_at.append(recorded_at)
+                    self._dirty.append(0)
+                elif recorded_at < self._recorded_at[slot]:
+                    self.stale += 1
+                    continue
+                else:
+                    self._lat[slot] = lat
+                    self._lng[slot] = lng
+                    self._recorded_at[slot] = recorded_at
+                if not self._dirty[slot]:
+                    self._dirty[slot] = 1
+                    self._dirty_slots.append(slot)
+                self.accepted += 1
+                applied.append((driver_id, lat, lng))
+        return applied
+
+    def unseen(self, driver_ids: Iterable[str]) -> Set[str]:
+        """The ids among `driver_ids` that have no stored position yet"""
+        with self._lock:
+            return {driver_id for driver_id in driver_ids if driver_id not in self._slots}
+
+    def get(self, driver_id: str) -> Optional[Tuple[float, float, float]]:
+        with self._lock:
+            slot = self._slots.get(driver_id)
+            if slot is None:
+                return None
+            return self._lat[slot], self._lng[slot], self._recorded_at[slot]
+
+    def take_dirty(self) -> List[dict]:
+        """Positions changed since the last call, one per driver, as UPDATE parameters"""
+        with self._lock:
+            rows = []
+            for slot in self._dirty_slots:
+                self._dirty[slot] = 0
+                rows.append({"driver_id": self._driver_ids[slot], "lat": self._lat[slot], "lng": self._lng[slot]})
+            self._dirty_slots = array("l")
+            return rows
+
+    def mark_dirty(self, driver_ids: Iterable[str]) -> None:
+        """Queue drivers for the next flush again, e.g. after a failed write"""
+        with self._lock:
+            for driver_id in driver_ids:
+                slot = self._slots.get(driver_id)
+                if slot is not None and not self._dirty[slot]:
+                    self._dirty[slot] = 1
+                    self._dirty_slots.append(slot)
+
+    def record_flushed(self, count: int) -> None:
+        with self._lock:
+            self.flushed += count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots.clear()
+            self._driver_ids.clear()
+            for values in (self._lat, self._lng, self._recorded_at):
+                del values[:]
+            self._dirty = bytearray()
+            self._dirty_slots = array("l")
+            self.accepted = self.stale = self.flushed = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "drivers": len(self._driver_ids),
+                "accepted": self.accepted,
+                "stale": self.stale,
+                "pending_flush": len(self._dirty_slots),
+                "flushed": self.flushed,
+            }
+
+
+driver_positions = DriverPositionStore()
+
+
+def flush_driver_positions(db: Session) -> int:
+    """Write changed positions to the drivers table in one executemany UPDATE; returns rows written"""
+    rows = driver_positions.take_dirty()
+    if not rows:
+        return 0
+    drivers = Driver.__table__
+    try:
+        db.execute(
+            drivers.update().where(drivers.c.id == bindparam("driver_id")).values(
+                lat=bindparam("lat"), lng=bindparam("lng")
+            ),
+            rows
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        driver_positions.mark_dirty(row["driver_id"] for row in rows)
+        raise
+    driver_positions.record_flushed(len(rows))
+    return len(rows)
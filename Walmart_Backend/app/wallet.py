@@ -0,0 +1,211 @@
+"""
+Materialized wallet balances.
+
+Wallet credits and debits live in the PaymentTransaction ledger (rows with
+payment_method WALLET). Instead of summing a user's ledger on every read,
+`wallet_balances` keeps one running balance per user. It is updated by
+`apply_ledger_rows` in the same transaction as the ledger insert, with an
+upsert that adds the delta in the database so concurrent writers do not
+lose updates. `reconcile_wallets` re-derives balances from the ledger in
+bounded chunks to verify (and optionally repair) the materialized values;
+repairs hold the wallet rows locked while they re-read the ledger, so they
+are safe to run next to live writers.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, case, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import PaymentTransaction, WalletBalance
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHUNK_SIZE = 1000
+
+# Ledger entries that move money into (+1) or out of (-1) a wallet
+_WALLET_SIGN = {
+    "COMPENSATION": 1,
+    "REFUND": 1,
+    "PAYMENT": -1,
+    "PENALTY": -1,
+}
+
+
+def wallet_delta(transaction_type: str, payment_method: str, status: str, amount) -> Decimal:
+    """Balance change caused by one ledger row; zero unless it is a settled wallet entry"""
+    if payment_method != "WALLET" or status != "SUCCESS":
+        return Decimal(0)
+    return _WALLET_SIGN.get(transaction_type, 0) * Decimal(str(amount))
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(WalletBalance)
+        return stmt.on_duplicate_key_update(
+            balance=WalletBalance.balance + stmt.inserted.balance,
+            updated_at=stmt.inserted.updated_at,
+        )
+    module = postgresql if dialect == "postgresql" else sqlite
+    stmt = module.insert(WalletBalance)
+    return stmt.on_conflict_do_update(
+        index_elements=[WalletBalance.user_id],
+        set_={
+            "balance": WalletBalance.balance + stmt.excluded.balance,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def credit_wallets(db: Session, deltas: Dict[str, Decimal]) -> None:
+    """Add `deltas` ({user_id: amount}) to wallet balances; does not commit"""
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "balance": delta, "updated_at": now}
+        for user_id, delta in deltas.items() if delta
+    ]
+    if rows:
+        db.execute(_upsert(db), rows)
+
+
+def apply_ledger_rows(db: Session, rows: Iterable[dict]) -> None:
+    """Fold freshly inserted PaymentTransaction rows into wallet balances"""
+    deltas = defaultdict(Decimal)
+    for row in rows:
+        deltas[row["user_id"]] += wallet_delta(
+            row["transaction_type"], row.get("payment_method"), row.get("status"), row["amount"]
+        )
+    credit_wallets(db, deltas)
+
+
+def get_wallet_balance(db: Session, user_id: str) -> Optional[WalletBalance]:
+    return db.get(WalletBalance, user_id)
+
+
+def _ledger_balance_expr():
+    """SQL for the balance implied by a set of PaymentTransaction rows"""
+    sign = case(
+        *[(PaymentTransaction.transaction_type == name, value) for name, value in _WALLET_SIGN.items()],
+        else_=0
+    )
+    return func.coalesce(func.sum(sign * PaymentTransaction.amount), 0)
+
+
+_SETTLED_WALLET_ROWS = and_(
+    PaymentTransaction.payment_method == "WALLET",
+    PaymentTransaction.status == "SUCCESS",
+)
+
+
+def _ledger_balances(db: Session, user_ids) -> Dict[str, Decimal]:
+    return {
+        user_id: Decimal(str(balance))
+        for user_id, balance in db.query(PaymentTransaction.user_id, _ledger_balance_expr()).filter(
+            _SETTLED_WALLET_ROWS,
+            PaymentTransaction.user_id.in_(list(user_ids))
+        ).group_by(PaymentTransaction.user_id)
+    }
+
+
+def _repair(db: Session, user_ids) -> int:
+    """
+    Overwrite the balances of `user_ids` (whose rows must exist) with their
+    ledger totals; returns how many changed.
+
+    The wallet rows are locked before the ledger is summed again, so a
+    writer's ledger insert and balance upsert either committed before the
+    sum (and are in it) or wait for this commit and add their delta on top.
+    """
+    db.commit()  # start a fresh transaction; the ledger must be read after the locks
+    stored = db.query(WalletBalance.user_id, WalletBalance.balance).filter(
+        WalletBalance.user_id.in_(list(user_ids))
+    ).with_for_update().all()
+    ledger = _ledger_balances(db, user_ids)
+
+    fixed = 0
+    for user_id, balance in stored:
+        expected = ledger.get(user_id, Decimal(0))
+        if Decimal(str(balance or 0)) != expected:
+            db.query(WalletBalance).filter(WalletBalance.user_id == user_id).update(
+                {WalletBalance.balance: expected, WalletBalance.updated_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            fixed += 1
+    db.commit()
+    return fixed
+
+
+def reconcile_wallets(db: Session, chunk_size: int = RECONCILE_CHUNK_SIZE, fix: bool = False,
+                      max_reported: int = 100) -> dict:
+    """
+    Compare every stored balance with the balance implied by the ledger.
+
+    Works in keyset-paginated chunks of `chunk_size` users, so memory stays
+    bounded however large the ledger is. With `fix` mismatched balances are
+    rechecked under row locks and overwritten with the ledger values, one
+    commit per chunk.
+    """
+    report = {"checked": 0, "mismatched": 0, "fixed": 0, "mismatches": []}
+
+    def record(user_id, stored, expected):
+        report["mismatched"] += 1
+        if len(report["mismatches"]) < max_reported:
+            report["mismatches"].append({"user_id": user_id, "stored": float(stored), "expected": float(expected)})
+
+    # Users with a stored balance
+    last_user_id = ""
+    while True:
+        balances = db.query(WalletBalance.user_id, WalletBalance.balance).filter(
+            WalletBalance.user_id > last_user_id
+        ).order_by(WalletBalance.user_id).limit(chunk_size).all()
+        if not balances:
+            break
+        last_user_id = balances[-1].user_id
+
+        expected = _ledger_balances(db, [row.user_id for row in balances])
+
+        repairs = []
+        for user_id, stored in balances:
+            report["checked"] += 1
+            ledger = expected.get(user_id, Decimal(0))
+            if Decimal(str(stored or 0)) != ledger:
+                record(user_id, stored or 0, ledger)
+                repairs.append(user_id)
+        if fix and repairs:
+            report["fixed"] += _repair(db, repairs)
+
+    # Users with wallet ledger entries but no stored balance
+    last_user_id = ""
+    while True:
+        missing = db.query(PaymentTransaction.user_id, _ledger_balance_expr()).outerjoin(
+            WalletBalance, WalletBalance.user_id == PaymentTransaction.user_id
+        ).filter(
+            _SETTLED_WALLET_ROWS,
+            WalletBalance.user_id.is_(None),
+            PaymentTransaction.user_id > last_user_id
+        ).group_by(PaymentTransaction.user_id).order_by(PaymentTransaction.user_id).limit(chunk_size).all()
+        if not missing:
+            break
+        last_user_id = missing[-1][0]
+
+        repairs = []
+        for user_id, ledger in missing:
+            report["checked"] += 1
+            ledger = Decimal(str(ledger))
+            if ledger:
+                record(user_id, 0, ledger)
+                repairs.append(user_id)
+        if fix and repairs:
+            # Zero rows first (adding 0 to any a writer created meanwhile), then repair them like the rest
+            now = datetime.utcnow()
+            db.execute(_upsert(db), [
+                {"user_id": user_id, "balance": Decimal(0), "updated_at": now} for user_id in repairs
+            ])
+            report["fixed"] += _repair(db, repairs)
+
+    return report
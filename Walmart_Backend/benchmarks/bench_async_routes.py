@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Load test: threadpool routes vs AsyncSession routes
+
+Starts the API with uvicorn and has `clients` concurrent clients call two
+authenticated routes that each run two queries (resolve the user, then list
+their orders) with the user cache disabled:
+
+  GET /orders/                  sync route; get_db session held on a threadpool thread
+  GET /split-payment/my-orders  async route; AsyncSession on the event loop
+
+Against SQLite the async side goes through aiosqlite, which runs every
+statement on a thread of its own, so the numbers that matter come from
+pointing DATABASE_URL at MySQL (aiomysql).
+
+Reports requests per second and latency percentiles for each, plus the peak
+connections in use from the matching pool in /metrics.
+
+Usage: python benchmarks/bench_async_routes.py [clients] [seconds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_async.db')}"
+)
+os.environ.setdefault("AUTH_USER_CACHE_TTL_SECONDS", "0")
+
+from bench_login_flood import free_port, start_server
+from app.auth import create_access_token
+from app.database import SessionLocal, create_tables
+from app.models import User
+
+
+def seed_user():
+    db = SessionLocal()
+    user = User(id=str(uuid.uuid4()), name="Bench", email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    token = create_access_token({"sub": user.email, "uid": user.id})
+    db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def load(base_url, path, headers, clients, seconds):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        # Warm up so neither server starts with an empty connection pool
+        await client.get(path, headers=headers)
+        deadline = time.perf_counter() + seconds
+
+        async def client_loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path, headers=headers)
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rate": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    create_tables()
+    headers = seed_user()
+
+    print(f"📊 {clients} concurrent clients for {seconds:.0f}s per route, user cache off")
+    for label, path, pool_key in (
+        ("sync  GET /orders/                ", "/orders/", "db_pool"),
+        ("async GET /split-payment/my-orders", "/split-payment/my-orders", "async_db_pool"),
+    ):
+        server, base_url = start_server(free_port())
+        try:
+            result = asyncio.run(load(base_url, path, headers, clients, seconds))
+            pool = httpx.get(f"{base_url}/metrics").json()[pool_key]
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"   {label} {result['rate']:8.1f} req/s   p50 {result['p50_ms']:8.1f} ms   "
+              f"p99 {result['p99_ms']:8.1f} ms   errors {result['errors']}   "
+              f"peak connections {pool['peak_in_use']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark authenticated requests per second with the user cache on and off
+
+Usage: python benchmarks/bench_auth_cache.py [requests]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_auth.db')}"
+)
+
+from fastapi.testclient import TestClient
+
+from app.auth import create_access_token, user_cache
+from app.database import SessionLocal, create_tables
+from app.models import User
+
+
+def run(client, headers, requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get("/auth/me", headers=headers)
+        assert response.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    create_tables()
+
+    db = SessionLocal()
+    user = User(id=str(uuid.uuid4()), name="Bench", email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": user.email, "uid": user.id})}
+    db.close()
+
+    from main import app
+    client = TestClient(app)
+
+    ttl = user_cache.ttl
+    user_cache.ttl = 0
+    uncached = run(client, headers, requests)
+    user_cache.ttl = ttl or 30
+    user_cache.clear()
+    cached = run(client, headers, requests)
+
+    print(f"📊 GET /auth/me x {requests}")
+    print(f"   cache off: {uncached:8.1f} req/s")
+    print(f"   cache on:  {cached:8.1f} req/s  ({cached / uncached:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
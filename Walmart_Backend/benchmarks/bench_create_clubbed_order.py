@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark clubbed order creation: orders created per second
+
+Usage: python benchmarks/bench_create_clubbed_order.py [orders] [group_size] [items_per_cart]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_clubbed.db')}"
+)
+
+from app.crud import create_clubbed_order
+from app.database import SessionLocal, create_tables
+from app.models import BuddyQueue, Cart, CartItem, Product, User
+
+
+def seed_groups(db, orders, group_size, items_per_cart):
+    products = [
+        Product(id=str(uuid.uuid4()), name=f"Product {i}", price=Decimal("25.00"), weight_grams=300, stock=10**6)
+        for i in range(items_per_cart)
+    ]
+    db.add_all(products)
+    groups = []
+    for _ in range(orders):
+        group = []
+        for _ in range(group_size):
+            user = User(id=str(uuid.uuid4()), name="Bench", email=f"{uuid.uuid4()}@example.com", password_hash="x")
+            cart = Cart(id=str(uuid.uuid4()), user_id=user.id, is_active=True)
+            buddy = BuddyQueue(
+                id=str(uuid.uuid4()), user_id=user.id, cart_id=cart.id, value_total=0, weight_total=0,
+                lat=Decimal("12.9716"), lng=Decimal("77.5946"), status="WAITING",
+            )
+            db.add_all([user, cart, buddy])
+            db.add_all([
+                CartItem(id=str(uuid.uuid4()), cart_id=cart.id, product_id=p.id, quantity=2, total_price=p.price * 2)
+                for p in products
+            ])
+            group.append(buddy.id)
+        groups.append(group)
+    db.commit()
+    return groups
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    group_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    items_per_cart = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    create_tables()
+    db = SessionLocal()
+    groups = seed_groups(db, orders, group_size, items_per_cart)
+
+    start = time.perf_counter()
+    for buddy_ids in groups:
+        buddies = db.query(BuddyQueue).filter(BuddyQueue.id.in_(buddy_ids)).all()
+        create_clubbed_order(db, buddies)
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    print(f"📊 create_clubbed_order: {orders} orders, {group_size} members, {items_per_cart} items per cart")
+    print(f"   {orders / elapsed:8.1f} orders/s ({elapsed * 1000 / orders:.2f}ms per order)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Load test connection pool saturation
+
+Starts the API with uvicorn once per pool size and has `clients` threads
+call GET /orders/ (authenticated, one query per request) for a fixed
+duration, more concurrently than the small pools can serve. Reports
+requests per second and latency next to the pool metrics from /metrics:
+how many checkouts had to wait, the wait percentiles, timeouts and the peak
+number of connections in use.
+
+Usage: python benchmarks/bench_db_pool.py [clients] [seconds] [pool sizes, comma separated]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_pool.db')}"
+)
+# Resolve the user on every request so each one needs a connection for longer
+os.environ.setdefault("AUTH_USER_CACHE_TTL_SECONDS", "0")
+
+from bench_login_flood import free_port, start_server
+from app.auth import create_access_token
+from app.database import SessionLocal, create_tables
+from app.models import User
+
+
+def seed_user():
+    db = SessionLocal()
+    user = User(id=str(uuid.uuid4()), name="Bench", email=f"{uuid.uuid4()}@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    token = create_access_token({"sub": user.email, "uid": user.id})
+    db.close()
+    return {"Authorization": f"Bearer {token}"}
+
+
+def run(pool_size, clients, seconds, headers):
+    os.environ.update(DB_POOL_SIZE=str(pool_size), DB_MAX_OVERFLOW="0", DB_POOL_TIMEOUT="30")
+    server, base_url = start_server(free_port())
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client_loop():
+        local = []
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = client.get("/orders/", headers=headers)
+                local.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    with lock:
+                        errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    try:
+        threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        pool = httpx.get(f"{base_url}/metrics").json()["db_pool"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        "rate": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors[0],
+        "pool": pool,
+    }
+
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    pool_sizes = [int(size) for size in (sys.argv[3] if len(sys.argv) > 3 else "2,10,40").split(",")]
+
+    create_tables()
+    headers = seed_user()
+
+    print(f"📊 Pool saturation: {clients} clients on GET /orders/ for {seconds:.0f}s, no overflow")
+    for pool_size in pool_sizes:
+        result = run(pool_size, clients, seconds, headers)
+        pool = result["pool"]
+        print(f"   pool_size={pool_size:<3} {result['rate']:8.1f} req/s   "
+              f"p50 {result['p50_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   errors {result['errors']}")
+        print(f"      checkouts {pool['checkouts']}, waited {pool['waited']}, timeouts {pool['timeouts']}, "
+              f"peak in use {pool['peak_in_use']}, "
+              f"wait p50 {pool['wait_ms']['p50']:.2f} ms p99 {pool['wait_ms']['p99']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
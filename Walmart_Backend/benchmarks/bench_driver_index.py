@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark the driver spatial index: nearest capable driver lookups per second
+
+Spreads drivers with random loads over a city-sized area (~55 x 55 km) and
+compares index lookups with a linear scan over the same drivers, then
+measures driver moves per second.
+
+Usage: python benchmarks/bench_driver_index.py [drivers] [queries]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.driver_index import DriverIndex
+from app.geo import haversine
+
+CENTER_LAT, CENTER_LNG, SPAN = 12.9716, 77.5946, 0.5
+
+
+def random_point(rng):
+    return CENTER_LAT + (rng.random() - 0.5) * SPAN, CENTER_LNG + (rng.random() - 0.5) * SPAN
+
+
+def linear_nearest(drivers, lat, lng, weight):
+    best = None
+    for driver_id, (driver_lat, driver_lng, remaining) in drivers.items():
+        if remaining >= weight:
+            distance = haversine(lat, lng, driver_lat, driver_lng)
+            if best is None or distance < best[1]:
+                best = (driver_id, distance)
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(42)
+
+    drivers = {f"driver-{i}": (*random_point(rng), rng.uniform(0, 20)) for i in range(count)}
+    index = DriverIndex()
+    start = time.perf_counter()
+    for driver_id, (lat, lng, remaining) in drivers.items():
+        index.put(driver_id, lat, lng, remaining)
+    build_elapsed = time.perf_counter() - start
+
+    lookups = [(*random_point(rng), rng.uniform(0, 15)) for _ in range(queries)]
+    start = time.perf_counter()
+    found = [index.nearest(lat, lng, weight) for lat, lng, weight in lookups]
+    index_elapsed = time.perf_counter() - start
+
+    sample = lookups[:max(queries // 50, 1)]
+    start = time.perf_counter()
+    expected = [linear_nearest(drivers, lat, lng, weight) for lat, lng, weight in sample]
+    linear_elapsed = time.perf_counter() - start
+    assert all(a[0] == b[0] for a, b in zip(found, expected)), "index disagrees with linear scan"
+
+    moves = [(f"driver-{rng.randrange(count)}", *random_point(rng), rng.uniform(0, 20)) for _ in range(queries)]
+    start = time.perf_counter()
+    for driver_id, lat, lng, remaining in moves:
+        index.put(driver_id, lat, lng, remaining)
+    move_elapsed = time.perf_counter() - start
+
+    print(f"📊 Driver index: {count} drivers over {SPAN * 111:.0f} x {SPAN * 111:.0f} km")
+    print(f"   build:        {build_elapsed * 1000:8.1f}ms")
+    print(f"   index lookup: {queries / index_elapsed:10.1f} lookups/s ({index_elapsed * 1e6 / queries:.1f}µs each)")
+    print(f"   linear scan:  {len(sample) / linear_elapsed:10.1f} lookups/s ({linear_elapsed * 1e3 / len(sample):.1f}ms each)")
+    print(f"   driver moves: {queries / move_elapsed:10.1f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark driver telemetry ingestion: sustained GPS pings per second
+
+Seeds drivers in a throwaway SQLite database, starts the API with uvicorn
+and has several client threads post batches of pings to
+POST /drivers/telemetry for a fixed duration, while the server flushes
+coalesced positions to the drivers table every DRIVER_POSITION_FLUSH_SECONDS.
+Reports pings/s over HTTP and, for reference, the raw rate of the in-memory
+store.
+
+Usage: python benchmarks/bench_driver_telemetry.py [drivers] [batch_size] [seconds] [clients]
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_telemetry.db')}"
+)
+os.environ.setdefault("DRIVER_TELEMETRY_SECRET", uuid.uuid4().hex)
+
+from bench_login_flood import free_port, start_server
+from app.database import SessionLocal, create_tables
+from app.models import Driver
+from app.telemetry import DriverPositionStore
+
+
+def seed_drivers(count):
+    db = SessionLocal()
+    driver_ids = [str(uuid.uuid4()) for _ in range(count)]
+    db.add_all([
+        Driver(id=driver_id, name="Bench", phone=driver_id[:20], status="AVAILABLE",
+               lat=Decimal("12.9716"), lng=Decimal("77.5946"))
+        for driver_id in driver_ids
+    ])
+    db.commit()
+    db.close()
+    return driver_ids
+
+
+def pings(rng, driver_ids, batch_size):
+    return [
+        {"driver_id": rng.choice(driver_ids), "lat": 12.9 + rng.random() * 0.2, "lng": 77.5 + rng.random() * 0.2}
+        for _ in range(batch_size)
+    ]
+
+
+def main():
+    drivers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    clients = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    secret = os.environ["DRIVER_TELEMETRY_SECRET"].encode()
+
+    create_tables()
+    driver_ids = seed_drivers(drivers)
+
+    store = DriverPositionStore()
+    rng = random.Random(1)
+    local = [(ping["driver_id"], ping["lat"], ping["lng"], None) for ping in pings(rng, driver_ids, 200000)]
+    start = time.perf_counter()
+    store.record_many(local)
+    store_rate = len(local) / (time.perf_counter() - start)
+
+    server, base_url = start_server(free_port())
+    accepted = [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client_loop(index):
+        client_rng = random.Random(index)
+        bodies = [json.dumps({"pings": pings(client_rng, driver_ids, batch_size)}).encode() for _ in range(20)]
+        headers = [
+            {"Content-Type": "application/json", "X-Telemetry-Signature": hmac.new(secret, body, hashlib.sha256).hexdigest()}
+            for body in bodies
+        ]
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            sent = 0
+            while time.perf_counter() < deadline:
+                response = client.post("/drivers/telemetry", content=bodies[sent % len(bodies)],
+                                       headers=headers[sent % len(bodies)])
+                response.raise_for_status()
+                accepted[index] += response.json()["received"]
+                sent += 1
+
+    try:
+        threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        flushed = httpx.get(f"{base_url}/metrics").json()["driver_positions"]
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"📊 Driver telemetry: {drivers} drivers, batches of {batch_size}, {clients} clients for {seconds:.0f}s")
+    print(f"   HTTP ingestion:  {sum(accepted) / elapsed:10.1f} pings/s")
+    print(f"   position store:  {store_rate:10.1f} pings/s (in process)")
+    print(f"   rows flushed:    {flushed['flushed']} for {flushed['accepted']} accepted pings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark delivery event fan-out to order tracking streams
+
+Subscribes `subscribers` consumers to the event bus, spread over clubbed
+orders of `group_size` members (as many streams as tracking members), then
+publishes delivery events for random orders from a worker thread, the way
+request handlers and background tasks do. Each consumer waits on its queue
+like the SSE endpoint does. Reports delivered events per second and the
+publish-to-consumer latency, then repeats with every subscriber on a single
+order (worst-case fan-out of one event).
+
+For comparison, polling GET /orders/{id}/delivery every `poll_seconds` costs
+three queries per poll per member.
+
+Usage: python benchmarks/bench_event_fanout.py [subscribers] [group_size] [events] [poll_seconds]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.events import EventBus
+
+
+async def run(subscribers, group_size, events):
+    bus = EventBus(queue_size=100)
+    topics = [f"order-{n}" for n in range(max(1, subscribers // group_size))]
+    subscriptions = [bus.subscribe(topics[n % len(topics)]) for n in range(subscribers)]
+    latencies = []
+    received = 0
+
+    async def consume(subscription):
+        nonlocal received
+        while True:
+            event = await subscription.queue.get()
+            if event is None:
+                return
+            latencies.append(time.perf_counter() - event["published_at"])
+            received += 1
+
+    consumers = [asyncio.create_task(consume(subscription)) for subscription in subscriptions]
+    await asyncio.sleep(0)
+
+    rng = random.Random(1)
+    chosen = [rng.choice(topics) for _ in range(events)]
+    expected = sum(bus.subscriber_count(topic) for topic in chosen)
+
+    def publisher():
+        for n, topic in enumerate(chosen):
+            bus.publish(topic, {"type": "delivery_status", "seq": n, "published_at": time.perf_counter()})
+            if n % 50 == 49:
+                # Paced like real traffic rather than one burst past the queue bound
+                time.sleep(0.001)
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=publisher)
+    thread.start()
+    # Events dropped from full queues never arrive; stop once the publisher is done and queues drain
+    while thread.is_alive() or any(not subscription.queue.empty() for subscription in subscriptions):
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    thread.join()
+
+    for subscription in subscriptions:
+        subscription.queue.put_nowait(None)
+    await asyncio.gather(*consumers)
+    for subscription in subscriptions:
+        bus.unsubscribe(subscription)
+
+    latencies.sort()
+    return {
+        "topics": len(topics),
+        "delivered": received,
+        "expected": expected,
+        "rate": received / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "dropped": bus.stats()["dropped"],
+    }
+
+
+def report(title, result):
+    print(f"   {title}")
+    print(f"      orders: {result['topics']}, delivered {result['delivered']}/{result['expected']} "
+          f"(dropped {result['dropped']})")
+    print(f"      {result['rate']:12.1f} events/s   p50 {result['p50_ms']:.2f} ms   p99 {result['p99_ms']:.2f} ms")
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    group_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    events = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    poll_seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+
+    print(f"📊 Event fan-out: {subscribers} subscribers")
+    report(f"groups of {group_size}, {events} events", asyncio.run(run(subscribers, group_size, events)))
+    report("one order, 20 events", asyncio.run(run(subscribers, subscribers, 20)))
+    print(f"   polling every {poll_seconds:.0f}s instead: {subscribers * 3 / poll_seconds:.0f} queries/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Load test: cart latency before and during a login flood
+
+Starts the API with uvicorn against a throwaway SQLite database, measures
+GET /cart/ latency with no other load, then again while a pool of clients
+hammers /auth/login. With bcrypt on the dedicated hashing pool the cart
+percentiles should stay roughly flat.
+
+Usage: python benchmarks/bench_login_flood.py [flood_clients] [cart_requests]
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port):
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_login.db')}")
+    env.setdefault("BCRYPT_ROUNDS", "12")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base_url}/health")
+            return server, base_url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+def measure_cart(client, headers, requests, concurrency=8):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(count):
+        for _ in range(count):
+            start = time.perf_counter()
+            client.get("/cart/", headers=headers)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(requests // concurrency,)) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1]
+
+
+def main():
+    flood_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    cart_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+
+    server, base_url = start_server(free_port())
+    try:
+        client = httpx.Client(base_url=base_url, timeout=60)
+        credentials = {"email": "flood@example.com", "password": "flood-password"}
+        client.post("/auth/register", json={"name": "Flood", **credentials})
+        token = client.post("/auth/login", json=credentials).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        idle_p50, idle_p95 = measure_cart(client, headers, cart_requests)
+
+        stop = threading.Event()
+        logins = []
+
+        def flood():
+            with httpx.Client(base_url=base_url, timeout=60) as flood_client:
+                while not stop.is_set():
+                    logins.append(flood_client.post("/auth/login", json=credentials).status_code)
+
+        flooders = [threading.Thread(target=flood) for _ in range(flood_clients)]
+        for thread in flooders:
+            thread.start()
+        time.sleep(1)
+        flood_p50, flood_p95 = measure_cart(client, headers, cart_requests)
+        stop.set()
+        for thread in flooders:
+            thread.join()
+
+        hashing = client.get("/metrics").json()["password_hashing"]
+        print(f"📊 GET /cart/ latency, {flood_clients} concurrent login clients")
+        print(f"   idle:  p50 {idle_p50:7.1f}ms  p95 {idle_p95:7.1f}ms")
+        print(f"   flood: p50 {flood_p50:7.1f}ms  p95 {flood_p95:7.1f}ms")
+        print(f"   logins during flood: {len(logins)} ({logins.count(503)} shed with 503)")
+        print(f"   hash queue wait: avg {hashing['avg_queue_wait_ms']}ms  max {hashing['max_queue_wait_ms']}ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
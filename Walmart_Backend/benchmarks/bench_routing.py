@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the delivery route solver: routes solved per second for 2 to 8 stops
+
+Each route starts at a random driver position and visits random drop-offs
+within a ~5 km neighbourhood. Routes are solved inline and, when more than
+one worker is requested, on the routing process pool as well. Solution
+quality is reported against exhaustive search for a sample of routes.
+
+Usage: python benchmarks/bench_routing.py [routes_per_size] [workers]
+"""
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routing import distance_matrix, shutdown_routing_pool, solve_routes
+
+
+def random_point(rng):
+    return 12.95 + rng.random() * 0.045, 77.57 + rng.random() * 0.045
+
+
+def optimal_length(origin, stops):
+    matrix = distance_matrix([origin, *stops])
+    return min(
+        sum(matrix[a][b] for a, b in zip((0, *perm), perm))
+        for perm in itertools.permutations(range(1, len(stops) + 1))
+    )
+
+
+def main():
+    routes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, (os.cpu_count() or 2) // 2)
+    rng = random.Random(11)
+
+    print(f"📊 Route solver: {routes} routes per stop count, {workers} pool workers")
+    print("   stops   inline routes/s   pool routes/s   avg gap to optimal")
+    try:
+        for stop_count in range(2, 9):
+            problems = [
+                (i, random_point(rng), [random_point(rng) for _ in range(stop_count)])
+                for i in range(routes)
+            ]
+            start = time.perf_counter()
+            solved = solve_routes(problems, workers=0)
+            inline_rate = routes / (time.perf_counter() - start)
+
+            pool_rate = float("nan")
+            if workers > 1:
+                solve_routes(problems[:workers * 2], workers=workers)  # start the workers
+                start = time.perf_counter()
+                solve_routes(problems, workers=workers)
+                pool_rate = routes / (time.perf_counter() - start)
+
+            sample = problems[:200]
+            gap = sum(
+                solved[key][1][-1] / optimal_length(origin, stops) - 1 for key, origin, stops in sample
+            ) / len(sample)
+            print(f"   {stop_count:>5}   {inline_rate:15.1f}   {pool_rate:13.1f}   {gap * 100:17.2f}%")
+    finally:
+        shutdown_routing_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Startup time: importing the app and serving the first request
+
+Each run is a fresh interpreter, as for a new worker:
+
+  import main        importing the module (cheap; the app is built lazily)
+  build app          first access to main.app: routers, schemas, middleware
+  first request      from spawning uvicorn to the first 200 from /health,
+                     against a new database (schema created) and one that
+                     already records the current schema version (skipped)
+
+Reports the median and worst of `runs` runs for each.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_login_flood import BACKEND_DIR, free_port
+
+IMPORT_PROBE = """
+import time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.app
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure_import(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return [float(value) for value in output.split()]
+
+
+def measure_first_request(env):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = start + 30
+        while time.perf_counter() < deadline:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not start")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def report(label, seconds):
+    print(f"   {label:32} median {statistics.median(seconds) * 1000:8.1f} ms   "
+          f"worst {max(seconds) * 1000:8.1f} ms")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}")
+    env.setdefault("BACKGROUND_TASKS", "0")
+
+    imports = [measure_import(env) for _ in range(runs)]
+
+    fresh, existing = [], []
+    for _ in range(runs):
+        run_env = dict(env, DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_startup.db')}")
+        fresh.append(measure_first_request(run_env))
+        existing.append(measure_first_request(run_env))
+
+    print(f"📊 Startup over {runs} runs, background tasks {'on' if env['BACKGROUND_TASKS'] != '0' else 'off'}")
+    report("import main", [imported for imported, _ in imports])
+    report("build app", [built for _, built in imports])
+    report("first request, new database", fresh)
+    report("first request, existing schema", existing)
+
+
+if __name__ == "__main__":
+    main()
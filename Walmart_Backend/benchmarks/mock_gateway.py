@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Mock payment gateway: replays settlement callbacks against the batch webhook
+
+Seeds committed clubbed orders in a throwaway SQLite database, starts the API
+with uvicorn and delivers one confirmation per user order to
+POST /split-payment/webhooks/batch. Half of the orders are settled one
+callback per request, the other half in bursts of `batch_size`, so the two
+rates can be compared. Requests are signed with PAYMENT_WEBHOOK_SECRET, a
+throwaway one unless it is set.
+
+Usage: python benchmarks/mock_gateway.py [orders] [group_size] [batch_size]
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_gateway.db')}"
+)
+os.environ.setdefault("PAYMENT_WEBHOOK_SECRET", uuid.uuid4().hex)
+
+from bench_login_flood import free_port, start_server
+from app.crud import create_clubbed_order
+from app.database import SessionLocal, create_tables
+from app.models import BuddyQueue, Cart, CartItem, Product, User, UserOrder
+
+
+def seed_committed_orders(db, orders, group_size):
+    product = Product(id=str(uuid.uuid4()), name="Product", price=Decimal("25.00"), weight_grams=300, stock=10**6)
+    db.add(product)
+    groups = []
+    for _ in range(orders):
+        group = []
+        for _ in range(group_size):
+            user = User(id=str(uuid.uuid4()), name="Bench", email=f"{uuid.uuid4()}@example.com", password_hash="x")
+            cart = Cart(id=str(uuid.uuid4()), user_id=user.id, is_active=True)
+            buddy = BuddyQueue(
+                id=str(uuid.uuid4()), user_id=user.id, cart_id=cart.id, value_total=0, weight_total=0,
+                lat=Decimal("12.9716"), lng=Decimal("77.5946"), status="WAITING",
+            )
+            item = CartItem(id=str(uuid.uuid4()), cart_id=cart.id, product_id=product.id, quantity=2,
+                            total_price=product.price * 2)
+            db.add_all([user, cart, buddy, item])
+            group.append(buddy)
+        groups.append(group)
+    db.commit()
+
+    for group in groups:
+        create_clubbed_order(db, group)
+    db.query(UserOrder).update({UserOrder.is_committed: True, UserOrder.delivery_address: "Somewhere"})
+    db.query(BuddyQueue).update({BuddyQueue.status: "MATCHED"})
+    db.commit()
+    return [user_order_id for (user_order_id,) in db.query(UserOrder.id).order_by(UserOrder.clubbed_order_id)]
+
+
+def deliver(client, user_order_ids, batch_size, secret):
+    start = time.perf_counter()
+    confirmed = 0
+    for offset in range(0, len(user_order_ids), batch_size):
+        body = json.dumps({"confirmations": [
+            {"user_order_id": user_order_id, "external_transaction_id": f"mock-{user_order_id}",
+             "payment_gateway": "mock"}
+            for user_order_id in user_order_ids[offset:offset + batch_size]
+        ]}).encode()
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Signature": hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(),
+        }
+        response = client.post("/split-payment/webhooks/batch", content=body, headers=headers)
+        response.raise_for_status()
+        confirmed += response.json()["confirmed"]
+    return confirmed, time.perf_counter() - start
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    group_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    secret = os.environ["PAYMENT_WEBHOOK_SECRET"]
+
+    create_tables()
+    db = SessionLocal()
+    user_order_ids = seed_committed_orders(db, orders, group_size)
+    db.close()
+    half = len(user_order_ids) // 2
+
+    server, base_url = start_server(free_port())
+    try:
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            single_confirmed, single_elapsed = deliver(client, user_order_ids[:half], 1, secret)
+            batch_confirmed, batch_elapsed = deliver(client, user_order_ids[half:], batch_size, secret)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"📊 Settlement callbacks: {orders} clubbed orders x {group_size} members")
+    print(f"   one per request:   {single_confirmed / single_elapsed:8.1f} confirmations/s ({single_confirmed} confirmed)")
+    print(f"   batches of {batch_size:<5}: {batch_confirmed / batch_elapsed:8.1f} confirmations/s ({batch_confirmed} confirmed)")
+
+
+if __name__ == "__main__":
+    main()
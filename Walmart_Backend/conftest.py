@@ -0,0 +1,240 @@
+"""
+Shared pytest fixtures: an isolated SQLite database per test and a
+TestClient wired to it. The database is a temporary file so the sync engine
+and the async (aiosqlite) engine used by async routes see the same data.
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Cheap bcrypt cost keeps auth tests fast; production default is 12
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+
+from app.database import async_database_url, create_tables, get_async_db, get_db
+from app.models import Base, User, Product, Cart, CartItem, ClubbedOrder, ClubbedOrderUser, BuddyQueue
+from app.cache import catalog_cache
+from app.auth import user_cache
+from app.snapshots import clear_snapshots
+from app.idempotency import response_cache
+from app.driver_index import driver_index
+from app.telemetry import driver_positions
+from app.events import event_bus
+from app.read_replica import recent_writers
+
+# The legacy script-style tests use the module level engine directly
+create_tables()
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def engine(database_url):
+    engine = create_engine(
+        database_url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_engine(engine, database_url):
+    # TestClient runs each request on a fresh event loop; don't pool connections across them
+    async_engine = create_async_engine(async_database_url(database_url), poolclass=NullPool)
+    yield async_engine
+    async_engine.sync_engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    caches = (catalog_cache, user_cache, response_cache, recent_writers)
+    for cache in caches:
+        cache.clear()
+    clear_snapshots()
+    driver_index.clear()
+    driver_positions.clear()
+    event_bus.reset()
+    yield
+    for cache in caches:
+        cache.clear()
+    clear_snapshots()
+    driver_index.clear()
+    driver_positions.clear()
+    event_bus.reset()
+
+
+class QueryCounter:
+    """Counts statements sent to the database while attached to its engines"""
+
+    def __init__(self, *engines):
+        self.engines = engines
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries(engine, async_engine):
+    return lambda: QueryCounter(engine, async_engine.sync_engine)
+
+
+class Factory:
+    """Minimal row builders for tests"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def user(self, name="Test User"):
+        user_id = str(uuid.uuid4())
+        user = User(
+            id=user_id,
+            name=name,
+            email=f"{user_id}@example.com",
+            password_hash="not-a-real-hash",
+        )
+        self.db.add(user)
+        self.db.commit()
+        return user
+
+    def product(self, price="10.00", weight_grams=500, stock=100, name="Product"):
+        product = Product(
+            id=str(uuid.uuid4()),
+            name=name,
+            price=Decimal(price),
+            weight_grams=weight_grams,
+            stock=stock,
+        )
+        self.db.add(product)
+        self.db.commit()
+        return product
+
+    def cart(self, user, items=()):
+        """Create an active cart holding (product, quantity) pairs"""
+        cart = Cart(id=str(uuid.uuid4()), user_id=user.id, is_active=True)
+        self.db.add(cart)
+        for product, quantity in items:
+            self.db.add(CartItem(
+                id=str(uuid.uuid4()),
+                cart_id=cart.id,
+                product_id=product.id,
+                quantity=quantity,
+                total_price=product.price * quantity,
+            ))
+        self.db.commit()
+        return cart
+
+    def buddy(self, cart, lat="12.971600", lng="77.594600", timeout_minutes=5):
+        """Queue a cart for matching"""
+        entry = BuddyQueue(
+            id=str(uuid.uuid4()),
+            user_id=cart.user_id,
+            cart_id=cart.id,
+            value_total=0,
+            weight_total=0,
+            lat=Decimal(lat),
+            lng=Decimal(lng),
+            timeout_minutes=timeout_minutes,
+            status="WAITING",
+        )
+        self.db.add(entry)
+        self.db.commit()
+        return entry
+
+    def clubbed_order(self, carts, status="CREATED"):
+        """Group existing carts into a clubbed order with totals filled in"""
+        order = ClubbedOrder(id=str(uuid.uuid4()), status=status, combined_value=0, combined_weight=0, total_discount=0)
+        self.db.add(order)
+        self.db.flush()
+        total_value = Decimal("0")
+        total_weight = Decimal("0")
+        for cart in carts:
+            self.db.add(ClubbedOrderUser(
+                id=str(uuid.uuid4()),
+                clubbed_order_id=order.id,
+                user_id=cart.user_id,
+                cart_id=cart.id,
+                discount_given=0.05,
+            ))
+            for item in cart.cart_items:
+                total_value += item.product.price * item.quantity
+                total_weight += Decimal(item.quantity * item.product.weight_grams) / 1000
+        order.combined_value = total_value
+        order.combined_weight = total_weight
+        order.total_discount = total_value * Decimal("0.05")
+        self.db.commit()
+        return order
+
+
+@pytest.fixture
+def factory(db):
+    return Factory(db)
+
+
+@pytest.fixture
+def app(session_factory, async_engine):
+    from main import app
+    async_session_factory = async_sessionmaker(async_engine, autoflush=False)
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    yield app
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+    return TestClient(app)
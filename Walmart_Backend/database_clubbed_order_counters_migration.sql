@@ -0,0 +1,53 @@
+-- Migration: schema version 5, split payment progress counters on clubbed_orders
+-- commit_to_payment and confirm_payment maintain these with conditional updates
+-- instead of reloading every user order. Run after database_split_payment_migration.sql.
+-- Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP PROCEDURE IF EXISTS AddColumnIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddColumnIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN col_name VARCHAR(255),
+    IN col_spec VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.columns 
+        WHERE table_schema = db_name AND table_name = tbl_name AND column_name = col_name
+    )
+    THEN
+        SET @ddl = CONCAT('ALTER TABLE ', tbl_name, ' ADD COLUMN ', col_name, ' ', col_spec);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddColumnIfNotExists(DATABASE(), 'clubbed_orders', 'member_count', 'INT NOT NULL DEFAULT 0');
+CALL AddColumnIfNotExists(DATABASE(), 'clubbed_orders', 'committed_count', 'INT NOT NULL DEFAULT 0');
+CALL AddColumnIfNotExists(DATABASE(), 'clubbed_orders', 'confirmed_count', 'INT NOT NULL DEFAULT 0');
+
+DROP PROCEDURE AddColumnIfNotExists;
+
+-- Backfill counters for orders created before this migration
+UPDATE clubbed_orders co
+JOIN (
+    SELECT clubbed_order_id,
+           COUNT(*) AS member_count,
+           SUM(is_committed) AS committed_count,
+           SUM(payment_status = 'CONFIRMED') AS confirmed_count
+    FROM user_orders
+    GROUP BY clubbed_order_id
+) uo ON uo.clubbed_order_id = co.id
+SET co.member_count = uo.member_count,
+    co.committed_count = uo.committed_count,
+    co.confirmed_count = uo.confirmed_count;
+
+INSERT IGNORE INTO schema_version (version) VALUES (5);
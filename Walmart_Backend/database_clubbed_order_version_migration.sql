@@ -0,0 +1,36 @@
+-- Migration: schema version 2, optimistic version column on clubbed_orders
+-- Used by add_item_to_clubbed_cart to apply total deltas safely under concurrent adds.
+-- Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP PROCEDURE IF EXISTS AddColumnIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddColumnIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN col_name VARCHAR(255),
+    IN col_spec VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.columns 
+        WHERE table_schema = db_name AND table_name = tbl_name AND column_name = col_name
+    )
+    THEN
+        SET @ddl = CONCAT('ALTER TABLE ', tbl_name, ' ADD COLUMN ', col_name, ' ', col_spec);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddColumnIfNotExists(DATABASE(), 'clubbed_orders', 'version', 'INT NOT NULL DEFAULT 0');
+
+DROP PROCEDURE AddColumnIfNotExists;
+
+INSERT IGNORE INTO schema_version (version) VALUES (2);
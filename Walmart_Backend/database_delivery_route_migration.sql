@@ -0,0 +1,66 @@
+-- Migration: schema version 9, planned routes on deliveries
+-- The routing task stores each delivery's stop order with per-stop ETAs.
+-- Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP PROCEDURE IF EXISTS AddColumnIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddColumnIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN col_name VARCHAR(255),
+    IN col_spec VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.columns 
+        WHERE table_schema = db_name AND table_name = tbl_name AND column_name = col_name
+    )
+    THEN
+        SET @ddl = CONCAT('ALTER TABLE ', tbl_name, ' ADD COLUMN ', col_name, ' ', col_spec);
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddColumnIfNotExists(DATABASE(), 'deliveries', 'estimated_delivery', 'TIMESTAMP NULL');
+CALL AddColumnIfNotExists(DATABASE(), 'deliveries', 'actual_delivery', 'TIMESTAMP NULL');
+CALL AddColumnIfNotExists(DATABASE(), 'deliveries', 'route', 'TEXT NULL');
+CALL AddColumnIfNotExists(DATABASE(), 'deliveries', 'route_distance_meters', 'INT NULL');
+CALL AddColumnIfNotExists(DATABASE(), 'deliveries', 'routed_at', 'TIMESTAMP NULL');
+
+DROP PROCEDURE AddColumnIfNotExists;
+
+DROP PROCEDURE IF EXISTS AddIndexIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddIndexIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN idx_name VARCHAR(255),
+    IN idx_cols VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.statistics 
+        WHERE table_schema = db_name AND table_name = tbl_name AND index_name = idx_name
+    )
+    THEN
+        SET @ddl = CONCAT('CREATE INDEX ', idx_name, ' ON ', tbl_name, ' (', idx_cols, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddIndexIfNotExists(DATABASE(), 'deliveries', 'idx_deliveries_routing', 'status, routed_at');
+
+DROP PROCEDURE AddIndexIfNotExists;
+
+INSERT IGNORE INTO schema_version (version) VALUES (9);
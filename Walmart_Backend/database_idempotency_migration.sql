@@ -0,0 +1,20 @@
+-- Migration: schema version 4, stored responses for Idempotency-Key requests
+-- Backs app/idempotency.py across workers. Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    `key` VARCHAR(64) PRIMARY KEY,
+    request_fingerprint VARCHAR(64) NOT NULL,
+    status_code INT NULL,
+    response_body BLOB,
+    content_type VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    INDEX ix_idempotency_keys_expires_at (expires_at)
+);
+
+INSERT IGNORE INTO schema_version (version) VALUES (4);
@@ -0,0 +1,22 @@
+-- Migration: schema version 6, transactional outbox for payment side effects
+-- Events are written with the state change and drained by the worker in app/outbox.py.
+-- Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id VARCHAR(36) PRIMARY KEY,
+    event_type VARCHAR(50) NOT NULL,
+    aggregate_id VARCHAR(36),
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    INDEX idx_outbox_events_pending (processed_at, created_at)
+);
+
+INSERT IGNORE INTO schema_version (version) VALUES (6);
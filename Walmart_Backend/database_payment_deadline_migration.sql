@@ -0,0 +1,37 @@
+-- Migration: schema version 3, deadline indexes for the payment deadline scheduler
+-- enforce_payment_deadlines range-scans these so each cycle touches only expired rows.
+-- Run after database_split_payment_migration.sql. Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP PROCEDURE IF EXISTS AddIndexIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddIndexIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN idx_name VARCHAR(255),
+    IN idx_cols VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.statistics 
+        WHERE table_schema = db_name AND table_name = tbl_name AND index_name = idx_name
+    )
+    THEN
+        SET @ddl = CONCAT('CREATE INDEX ', idx_name, ' ON ', tbl_name, ' (', idx_cols, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddIndexIfNotExists(DATABASE(), 'user_orders', 'idx_user_orders_commitment_deadline', 'payment_status, commitment_deadline');
+CALL AddIndexIfNotExists(DATABASE(), 'clubbed_orders', 'idx_clubbed_orders_payment_deadline', 'status, payment_confirmation_deadline');
+
+DROP PROCEDURE AddIndexIfNotExists;
+
+INSERT IGNORE INTO schema_version (version) VALUES (3);
@@ -0,0 +1,48 @@
+-- Migration: schema version 10, indexes for hot query predicates
+-- Adds the indexes app/models.py declares for the lookups crud.py makes by
+-- foreign key and status. test_query_plans.py checks the queries use them.
+-- Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+DROP PROCEDURE IF EXISTS AddIndexIfNotExists;
+DELIMITER //
+CREATE PROCEDURE AddIndexIfNotExists(
+    IN db_name VARCHAR(255),
+    IN tbl_name VARCHAR(255),
+    IN idx_name VARCHAR(255),
+    IN idx_cols VARCHAR(255)
+)
+BEGIN
+    IF NOT EXISTS (
+        SELECT * FROM information_schema.statistics
+        WHERE table_schema = db_name AND table_name = tbl_name AND index_name = idx_name
+    )
+    THEN
+        SET @ddl = CONCAT('CREATE INDEX ', idx_name, ' ON ', tbl_name, ' (', idx_cols, ')');
+        PREPARE stmt FROM @ddl;
+        EXECUTE stmt;
+        DEALLOCATE PREPARE stmt;
+    END IF;
+END //
+DELIMITER ;
+
+CALL AddIndexIfNotExists(DATABASE(), 'carts', 'idx_carts_user_active', 'user_id, is_active');
+CALL AddIndexIfNotExists(DATABASE(), 'cart_items', 'idx_cart_items_cart_product', 'cart_id, product_id');
+CALL AddIndexIfNotExists(DATABASE(), 'buddy_queue', 'idx_buddy_queue_user_status', 'user_id, status');
+CALL AddIndexIfNotExists(DATABASE(), 'buddy_queue', 'idx_buddy_queue_status_location', 'status, location_hash');
+CALL AddIndexIfNotExists(DATABASE(), 'buddy_queue', 'idx_buddy_queue_cart', 'cart_id');
+CALL AddIndexIfNotExists(DATABASE(), 'buddy_queue', 'idx_buddy_queue_created', 'created_at');
+CALL AddIndexIfNotExists(DATABASE(), 'clubbed_order_users', 'idx_clubbed_order_users_order_user', 'clubbed_order_id, user_id');
+CALL AddIndexIfNotExists(DATABASE(), 'clubbed_order_users', 'idx_clubbed_order_users_user_cart', 'user_id, cart_id');
+CALL AddIndexIfNotExists(DATABASE(), 'drivers', 'idx_drivers_status', 'status');
+CALL AddIndexIfNotExists(DATABASE(), 'deliveries', 'idx_deliveries_clubbed_order', 'clubbed_order_id');
+CALL AddIndexIfNotExists(DATABASE(), 'user_orders', 'idx_user_orders_clubbed_order_user', 'clubbed_order_id, user_id');
+CALL AddIndexIfNotExists(DATABASE(), 'payment_transactions', 'idx_payment_transactions_user_order', 'user_order_id');
+
+DROP PROCEDURE AddIndexIfNotExists;
+
+INSERT IGNORE INTO schema_version (version) VALUES (10);
@@ -71,6 +71,10 @@ CREATE TABLE clubbed_orders (
     combined_weight DECIMAL(10,2),
     total_discount DECIMAL(10,2),
     status ENUM('created', 'preparing', 'dispatched', 'delivered') DEFAULT 'created',
+    version INT NOT NULL DEFAULT 0,
+    member_count INT NOT NULL DEFAULT 0,
+    committed_count INT NOT NULL DEFAULT 0,
+    confirmed_count INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -107,7 +111,13 @@ CREATE TABLE deliveries (
     clubbed_order_id VARCHAR(36),
     estimated_time_minutes INT,
     status ENUM('assigned', 'in_transit', 'delivered') DEFAULT 'assigned',
+    estimated_delivery TIMESTAMP NULL,
+    actual_delivery TIMESTAMP NULL,
+    route TEXT NULL,
+    route_distance_meters INT NULL,
+    routed_at TIMESTAMP NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_deliveries_routing (status, routed_at),
     FOREIGN KEY (driver_id) REFERENCES drivers(id),
     FOREIGN KEY (clubbed_order_id) REFERENCES clubbed_orders(id)
 );
@@ -119,6 +129,16 @@ CREATE INDEX idx_buddy_status ON buddy_queue (status);
 CREATE INDEX idx_cart_user ON carts (user_id);
 CREATE INDEX idx_cart_items_cart ON cart_items (cart_id);
 CREATE INDEX idx_cart_items_product ON cart_items (product_id);
+CREATE INDEX idx_carts_user_active ON carts (user_id, is_active);
+CREATE INDEX idx_cart_items_cart_product ON cart_items (cart_id, product_id);
+CREATE INDEX idx_buddy_queue_user_status ON buddy_queue (user_id, status);
+CREATE INDEX idx_buddy_queue_status_location ON buddy_queue (status, location_hash);
+CREATE INDEX idx_buddy_queue_cart ON buddy_queue (cart_id);
+CREATE INDEX idx_buddy_queue_created ON buddy_queue (created_at);
+CREATE INDEX idx_clubbed_order_users_order_user ON clubbed_order_users (clubbed_order_id, user_id);
+CREATE INDEX idx_clubbed_order_users_user_cart ON clubbed_order_users (user_id, cart_id);
+CREATE INDEX idx_drivers_status ON drivers (status);
+CREATE INDEX idx_deliveries_clubbed_order ON deliveries (clubbed_order_id);
 
 -- Insert sample data
 INSERT INTO users (id, name, email, password_hash, phone, address) VALUES
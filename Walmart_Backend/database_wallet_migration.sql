@@ -0,0 +1,30 @@
+-- Migration: schema version 7, materialized wallet balances
+-- One running balance per user, maintained alongside WALLET ledger inserts.
+-- Backfills from existing settled wallet transactions. Idempotent; safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS wallet_balances (
+    user_id VARCHAR(36) PRIMARY KEY,
+    balance DECIMAL(10,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+INSERT INTO wallet_balances (user_id, balance, updated_at)
+SELECT user_id,
+       SUM(CASE
+               WHEN transaction_type IN ('COMPENSATION', 'REFUND') THEN amount
+               WHEN transaction_type IN ('PAYMENT', 'PENALTY') THEN -amount
+               ELSE 0
+           END),
+       NOW()
+FROM payment_transactions
+WHERE payment_method = 'WALLET' AND status = 'SUCCESS'
+GROUP BY user_id
+ON DUPLICATE KEY UPDATE balance = VALUES(balance), updated_at = VALUES(updated_at);
+
+INSERT IGNORE INTO schema_version (version) VALUES (7);
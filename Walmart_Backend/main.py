@@ -1,67 +1,172 @@
-from fastapi import FastAPI, Depends
-from fastapi.middleware.cors import CORSMiddleware
-from app.database import create_tables, SessionLocal
-from app.routers import auth, products, cart, club, orders, clubbed_cart, split_payment
-from app.crud import timeout_expired_buddies, cleanup_old_buddy_entries
+from contextlib import asynccontextmanager
 import os
-import uvicorn
-import asyncio
 import threading
 
-# Create FastAPI app
-app = FastAPI(
-    title="BuddyCart API",
-    description="Smart order clubbing system for delivery cost savings",
-    version="1.0.0"
-)
+PAYMENT_DEADLINE_CHECK_SECONDS = float(os.getenv("PAYMENT_DEADLINE_CHECK_SECONDS", "30"))
 
-# CORS middleware
-origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001").split(",")
+# Set to 0 on processes that should only serve requests, e.g. all but one of several hosts
+BACKGROUND_TASKS = os.getenv("BACKGROUND_TASKS", "1") != "0"
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+background_lock = threading.Lock()
+background_started = False
 
-# Include routers
-app.include_router(auth.router)
-app.include_router(products.router)
-app.include_router(cart.router)
-app.include_router(club.router)
-app.include_router(orders.router)
-app.include_router(clubbed_cart.router)
-app.include_router(split_payment.router)
+# Imports stay inside the functions below: importing this module only defines
+# them, and the app itself is built on first access to `main.app` (see __getattr__).
 
-@app.on_event("startup")
-def startup_event():
-    """Create database tables on startup"""
-    create_tables()
+def start_background_tasks():
+    """Start the background workers, once per process however many apps start in it"""
+    global background_started
+    with background_lock:
+        if background_started:
+            return
+        background_started = True
+    
+    from app import penalties
     
     # Start background cleanup task
-    global cleanup_thread
     cleanup_thread = threading.Thread(target=cleanup_task, daemon=True)
     cleanup_thread.start()
     print("Background cleanup task started")
+    
+    # Start payment deadline enforcement
+    deadline_thread = threading.Thread(target=deadline_task, daemon=True)
+    deadline_thread.start()
+    print("Payment deadline task started")
+    
+    # Start outbox worker for payment side effects
+    outbox_thread = threading.Thread(target=outbox_task, daemon=True)
+    outbox_thread.start()
+    print("Outbox worker started")
+    
+    # Start penalty collectors; each claims its own batches
+    gateway = penalties.load_gateway()
+    for _ in range(penalties.PENALTY_COLLECTORS):
+        threading.Thread(target=penalty_task, args=(gateway,), daemon=True).start()
+    print(f"{penalties.PENALTY_COLLECTORS} penalty collector(s) started")
+    
+    # Start delivery route planning
+    routing_thread = threading.Thread(target=routing_task, daemon=True)
+    routing_thread.start()
+    print("Delivery routing task started")
+    
+    # Start flushing driver positions from the telemetry store
+    position_thread = threading.Thread(target=position_flush_task, daemon=True)
+    position_thread.start()
+    print("Driver position flush task started")
 
-@app.get("/")
-def read_root():
-    return {
-        "message": "Welcome to BuddyCart API",
-        "description": "Smart order clubbing system for delivery cost savings",
-        "version": "1.0.0",
-        "docs_url": "/docs"
-    }
+@asynccontextmanager
+async def lifespan(app):
+    """Create the schema if needed and start the background workers; release pools on shutdown"""
+    from app import database
+    from app.password_hashing import shutdown_password_pool
+    from app.routing import shutdown_routing_pool
+    
+    database.create_tables()
+    if BACKGROUND_TASKS:
+        start_background_tasks()
+    yield
+    
+    shutdown_password_pool()
+    shutdown_routing_pool()
+    # Close pooled async connections; aiosqlite's per-connection threads would otherwise keep the process alive
+    await database.async_engine.dispose()
+    if database.async_read_engine is not None:
+        await database.async_read_engine.dispose()
 
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+def create_app():
+    """Build the FastAPI application"""
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import ORJSONResponse
+    from app.database import async_connection_pool_stats, connection_pool_stats, read_connection_pool_stats
+    from app.routers import auth, products, cart, club, orders, clubbed_cart, split_payment, wallet, drivers
+    from app.password_hashing import hash_queue_stats
+    from app.idempotency import IdempotencyMiddleware
+    from app.read_replica import ReadYourWritesMiddleware
+    from app import penalties
+    from app.telemetry import driver_positions
+    from app.events import event_bus
+    
+    # Create FastAPI app
+    app = FastAPI(
+        title="BuddyCart API",
+        description="Smart order clubbing system for delivery cost savings",
+        version="1.0.0",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
+    )
+    
+    # Attributes database writes to the request's user so their reads skip the replica for a while.
+    # Innermost, so the idempotency middleware's own bookkeeping writes are not attributed.
+    app.add_middleware(ReadYourWritesMiddleware)
+    
+    # Replays recorded responses for retried split-payment requests.
+    # Added before CORS so replayed responses still get CORS headers.
+    app.add_middleware(IdempotencyMiddleware)
+    
+    # CORS middleware
+    origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001").split(",")
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    # Include routers
+    app.include_router(auth.router)
+    app.include_router(products.router)
+    app.include_router(cart.router)
+    app.include_router(club.router)
+    app.include_router(orders.router)
+    app.include_router(clubbed_cart.router)
+    app.include_router(split_payment.router)
+    app.include_router(wallet.router)
+    app.include_router(drivers.router)
+    
+    @app.get("/")
+    def read_root():
+        return {
+            "message": "Welcome to BuddyCart API",
+            "description": "Smart order clubbing system for delivery cost savings",
+            "version": "1.0.0",
+            "docs_url": "/docs"
+        }
+    
+    @app.get("/health")
+    def health_check():
+        return {"status": "healthy"}
+    
+    @app.get("/metrics")
+    def metrics():
+        return {
+            "password_hashing": hash_queue_stats(),
+            "penalty_collector": penalties.penalty_collector_stats(),
+            "driver_positions": driver_positions.stats(),
+            "delivery_events": event_bus.stats(),
+            "db_pool": connection_pool_stats(),
+            "async_db_pool": async_connection_pool_stats(),
+            "db_read_pool": read_connection_pool_stats()
+        }
+    
+    return app
+
+def __getattr__(name):
+    # `main:app` (uvicorn, gunicorn, tests) builds the app on first access
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Background cleanup task
 def cleanup_task():
     """Background task to clean up expired buddy queue entries"""
+    from app.crud import timeout_expired_buddies, cleanup_old_buddy_entries
+    from app.database import SessionLocal
+    from app.idempotency import purge_expired_keys
     while True:
         try:
             db = SessionLocal()
@@ -75,6 +180,11 @@ def cleanup_task():
                 deleted_count = cleanup_old_buddy_entries(db, hours_old=24)
                 if deleted_count > 0:
                     print(f"Cleaned up {deleted_count} old buddy queue entries")
+                
+                # Drop expired idempotency records
+                purged_count = purge_expired_keys(db)
+                if purged_count > 0:
+                    print(f"Purged {purged_count} expired idempotency keys")
                     
             finally:
                 db.close()
@@ -85,11 +195,110 @@ def cleanup_task():
         import time
         time.sleep(300)
 
-# Start background cleanup task
-cleanup_thread = threading.Thread(target=cleanup_task, daemon=True)
-cleanup_thread.start()
+def deadline_task():
+    """Background task that cancels clubbed orders whose payment deadlines passed"""
+    import time
+    from app.crud import enforce_payment_deadlines
+    from app.database import SessionLocal
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                # Drain every expired batch, then wait for the next cycle. Groups
+                # that fail to cancel are skipped for the rest of this sweep.
+                failed = set()
+                while True:
+                    failures_before = len(failed)
+                    cancelled_count = enforce_payment_deadlines(db, failed=failed)
+                    if cancelled_count == 0 and len(failed) == failures_before:
+                        break
+                    if cancelled_count:
+                        print(f"Cancelled {cancelled_count} clubbed orders after missed payment deadlines")
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error in deadline task: {e}")
+        
+        time.sleep(PAYMENT_DEADLINE_CHECK_SECONDS)
+
+def outbox_task():
+    """Background worker that drains the payment side-effect outbox"""
+    import time
+    from app import outbox
+    from app.database import SessionLocal
+    while True:
+        handled = 0
+        try:
+            db = SessionLocal()
+            try:
+                handled = outbox.process_batch(db)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error in outbox worker: {e}")
+        
+        # Keep draining while there is a backlog
+        if handled == 0:
+            time.sleep(outbox.OUTBOX_POLL_SECONDS)
+
+def penalty_task(gateway):
+    """Background worker that charges PENDING cancellation penalties"""
+    import time
+    from app import penalties
+    from app.database import SessionLocal
+    while True:
+        claimed = 0
+        try:
+            db = SessionLocal()
+            try:
+                claimed = penalties.collect_penalties(db, gateway)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error in penalty collector: {e}")
+        
+        # Keep collecting while full batches are available
+        if claimed < penalties.PENALTY_BATCH_SIZE:
+            time.sleep(penalties.PENALTY_POLL_SECONDS)
+
+def routing_task():
+    """Background worker that plans stop order and ETAs for new deliveries"""
+    import time
+    from app.database import SessionLocal
+    from app.delivery_routes import ROUTING_BATCH_SIZE, ROUTING_POLL_SECONDS, plan_delivery_routes
+    while True:
+        routed = 0
+        try:
+            db = SessionLocal()
+            try:
+                routed = plan_delivery_routes(db)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error in routing task: {e}")
+        
+        # Keep routing while full batches are waiting
+        if routed < ROUTING_BATCH_SIZE:
+            time.sleep(ROUTING_POLL_SECONDS)
+
+def position_flush_task():
+    """Background task that writes coalesced driver positions to the drivers table"""
+    import time
+    from app.database import SessionLocal
+    from app.telemetry import DRIVER_POSITION_FLUSH_SECONDS, flush_driver_positions
+    while True:
+        time.sleep(DRIVER_POSITION_FLUSH_SECONDS)
+        try:
+            db = SessionLocal()
+            try:
+                flush_driver_positions(db)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error in driver position flush: {e}")
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
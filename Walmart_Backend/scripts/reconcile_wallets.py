@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Verify materialized wallet balances against the PaymentTransaction ledger
+
+Walks users in chunks, so it can run against the production database without
+loading the ledger into memory. Exits non-zero when mismatches are found;
+pass --fix to overwrite the stored balances with the ledger values.
+
+Usage: python scripts/reconcile_wallets.py [--fix] [--chunk-size N]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.wallet import RECONCILE_CHUNK_SIZE, reconcile_wallets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fix", action="store_true", help="overwrite mismatched balances with ledger values")
+    parser.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconcile_wallets(db, chunk_size=args.chunk_size, fix=args.fix)
+    finally:
+        db.close()
+
+    print(f"🔎 Checked {report['checked']} wallets: {report['mismatched']} mismatched, {report['fixed']} fixed")
+    for mismatch in report["mismatches"]:
+        print(f"   {mismatch['user_id']}: stored {mismatch['stored']:.2f}, ledger {mismatch['expected']:.2f}")
+    sys.exit(1 if report["mismatched"] and not args.fix else 0)
+
+
+if __name__ == "__main__":
+    main()
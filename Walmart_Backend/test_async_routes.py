@@ -0,0 +1,56 @@
+"""
+Tests for routes served on the async engine
+"""
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import create_access_token
+from app.database import to_schema
+from app.models import Cart
+from app.schemas import CartResponse
+
+
+def test_cart_route_resolves_token_and_reads_on_async_engine(client, factory, engine, async_engine):
+    user = factory.user()
+    product = factory.product(price="4.50")
+    factory.cart(user, [(product, 2)])
+    token = create_access_token({"sub": user.email, "uid": user.id})
+
+    statements = {"sync": 0, "async": 0}
+
+    def counter(key):
+        def record(conn, cursor, statement, *args):
+            statements[key] += 1
+        return record
+
+    sync_record, async_record = counter("sync"), counter("async")
+    event.listen(engine, "before_cursor_execute", sync_record)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", async_record)
+    try:
+        response = client.get("/cart/", headers={"Authorization": f"Bearer {token}"})
+    finally:
+        event.remove(engine, "before_cursor_execute", sync_record)
+        event.remove(async_engine.sync_engine, "before_cursor_execute", async_record)
+
+    assert response.status_code == 200
+    assert [item["product"]["price"] for item in response.json()["cart_items"]] == ["4.50"]
+    # User, cart, items and product all loaded through the asyncio driver
+    assert statements["sync"] == 0
+    assert statements["async"] >= 3
+
+
+def test_to_schema_loads_relationships_before_validating(factory, async_engine):
+    user = factory.user()
+    product = factory.product(name="Loaded")
+    cart = factory.cart(user, [(product, 3)])
+
+    async def load():
+        async with AsyncSession(async_engine) as db:
+            return await db.run_sync(lambda session: to_schema(CartResponse, session.get(Cart, cart.id)))
+
+    schema = asyncio.run(load())
+
+    assert schema.cart_items[0].quantity == 3
+    assert schema.cart_items[0].product.name == "Loaded"
@@ -0,0 +1,63 @@
+"""
+Tests for the authenticated-user cache in app.auth
+"""
+from app.auth import create_access_token, invalidate_cached_user, user_cache
+
+
+def _auth_header(user, with_uid=True):
+    claims = {"sub": user.email}
+    if with_uid:
+        claims["uid"] = user.id
+    return {"Authorization": f"Bearer {create_access_token(claims)}"}
+
+
+def test_second_request_skips_user_lookup(client, factory, count_queries):
+    user = factory.user(name="Asha")
+    headers = _auth_header(user)
+
+    with count_queries() as counter:
+        assert client.get("/auth/me", headers=headers).json()["name"] == "Asha"
+    assert counter.count == 1
+    assert "WHERE users.id = ?" in counter.statements[0]
+
+    with count_queries() as counter:
+        assert client.get("/auth/me", headers=headers).json()["name"] == "Asha"
+    assert counter.count == 0
+
+
+def test_tokens_without_uid_claim_still_resolve(client, factory):
+    user = factory.user()
+    response = client.get("/auth/me", headers=_auth_header(user, with_uid=False))
+    assert response.status_code == 200
+    assert response.json()["id"] == user.id
+
+
+def test_invalidation_reloads_updated_user(client, factory, db):
+    user = factory.user(name="Before")
+    headers = _auth_header(user)
+    client.get("/auth/me", headers=headers)
+
+    user.name = "After"
+    db.commit()
+    assert client.get("/auth/me", headers=headers).json()["name"] == "Before"
+
+    invalidate_cached_user(user_id=user.id, email=user.email)
+    assert client.get("/auth/me", headers=headers).json()["name"] == "After"
+
+
+def test_disabled_cache_always_queries(client, factory, count_queries, monkeypatch):
+    monkeypatch.setattr(user_cache, "ttl", 0)
+    headers = _auth_header(factory.user())
+    client.get("/auth/me", headers=headers)
+
+    with count_queries() as counter:
+        client.get("/auth/me", headers=headers)
+    assert counter.count == 1
+
+
+def test_unknown_user_is_rejected(client, factory, db):
+    user = factory.user()
+    headers = _auth_header(user)
+    db.delete(user)
+    db.commit()
+    assert client.get("/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,84 @@
+"""
+Tests for the pre-encoded catalog response cache
+"""
+from app.auth import get_current_user, get_current_user_async
+from app.cache import catalog_cache, invalidate_product
+from app.crud import add_item_to_cart, get_products
+from app.routers import products
+from app.schemas import CartItemCreate
+
+
+def test_product_list_is_served_from_cache(client, factory, count_queries):
+    factory.product(name="Bananas")
+
+    first = client.get("/products/")
+    assert first.status_code == 200
+    assert [p["name"] for p in first.json()] == ["Bananas"]
+
+    with count_queries() as counter:
+        second = client.get("/products/")
+    assert counter.count == 0
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_if_none_match_returns_304(client, factory):
+    product = factory.product()
+
+    first = client.get(f"/products/{product.id}")
+    etag = first.headers["etag"]
+
+    not_modified = client.get(f"/products/{product.id}", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    weak = client.get(f"/products/{product.id}", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert weak.status_code == 304
+
+    stale = client.get(f"/products/{product.id}", headers={"If-None-Match": '"stale"'})
+    assert stale.status_code == 200
+
+
+def test_missing_product_is_not_cached(client):
+    assert client.get("/products/missing").status_code == 404
+    assert client.get("/products/missing").status_code == 404
+
+
+def test_product_create_invalidates_list(app, client, factory):
+    user = factory.user()
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_current_user_async] = lambda: user
+    factory.product(name="Bread")
+    etag = client.get("/products/").headers["etag"]
+
+    created = client.post("/products/", json={"name": "Milk", "price": "55.00", "weight_grams": 1000, "stock": 5})
+    assert created.status_code == 200
+
+    refreshed = client.get("/products/", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200
+    assert sorted(p["name"] for p in refreshed.json()) == ["Bread", "Milk"]
+
+
+def test_stock_change_invalidates_product(client, factory, db):
+    product = factory.product(stock=10)
+    user = factory.user()
+    cart = factory.cart(user)
+    assert client.get(f"/products/{product.id}").json()["stock"] == 10
+
+    add_item_to_cart(db, cart.id, CartItemCreate(product_id=product.id, quantity=3))
+
+    assert client.get(f"/products/{product.id}").json()["stock"] == 7
+
+
+def test_read_racing_an_invalidation_is_not_cached(client, factory, monkeypatch):
+    factory.product(name="Old")
+
+    def read_then_write(db, **kwargs):
+        rows = get_products(db, **kwargs)
+        invalidate_product()  # a write commits while the read's response is being built
+        return rows
+
+    monkeypatch.setattr(products, "get_products", read_then_write)
+    assert client.get("/products/").status_code == 200
+    assert len(catalog_cache) == 0
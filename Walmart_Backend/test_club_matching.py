@@ -0,0 +1,57 @@
+"""
+Tests for clubbed order creation from matched buddies
+"""
+import pytest
+from sqlalchemy import event
+
+from app.crud import create_clubbed_order
+from app.models import BuddyQueue, ClubbedOrder, ClubbedOrderUser, UserOrder
+
+
+def _buddies(factory, members, items_per_cart=3):
+    products = [factory.product(price="20.00", weight_grams=400) for _ in range(items_per_cart)]
+    return [
+        factory.buddy(factory.cart(factory.user(), [(product, 1) for product in products]))
+        for _ in range(members)
+    ]
+
+
+def test_creates_order_members_and_user_orders(factory, db):
+    buddies = _buddies(factory, members=3)
+
+    order = create_clubbed_order(db, buddies)
+
+    assert order.status == "PAYMENT_PENDING"
+    assert float(order.combined_value) == 180.0
+    assert float(order.combined_weight) == 3.6
+    assert float(order.total_discount) == 9.0
+    assert order.payment_confirmation_deadline is not None
+    assert db.query(ClubbedOrderUser).filter_by(clubbed_order_id=order.id).count() == 3
+    user_orders = db.query(UserOrder).filter_by(clubbed_order_id=order.id).all()
+    assert sorted(float(uo.individual_total) for uo in user_orders) == [60.0, 60.0, 60.0]
+    assert {uo.commitment_deadline for uo in user_orders} == {order.payment_confirmation_deadline}
+    assert {b.status.value for b in db.query(BuddyQueue).all()} == {"MATCHED"}
+
+
+@pytest.mark.parametrize("members", [2, 4])
+def test_single_transaction_and_fixed_statement_count(factory, db, engine, count_queries, members):
+    buddies = _buddies(factory, members)
+    for buddy in buddies:
+        buddy.user_id, buddy.cart_id, buddy.id  # load before counting
+
+    commits = []
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    event.listen(engine, "commit", on_commit)
+    try:
+        with count_queries() as counter:
+            create_clubbed_order(db, buddies)
+    finally:
+        event.remove(engine, "commit", on_commit)
+
+    assert len(commits) == 1
+    # aggregate, order insert, members insert, user orders insert, buddy update
+    assert counter.count == 5
+    assert db.query(ClubbedOrder).count() == 1
@@ -0,0 +1,215 @@
+"""
+Tests for GET /clubbed-cart/{id}
+"""
+import pytest
+
+from app.auth import get_current_user, get_current_user_async
+
+
+def _group(factory, members, items_per_cart):
+    products = [factory.product(price=f"{10 + i}.00", name=f"Item {i}") for i in range(items_per_cart)]
+    carts = []
+    for i in range(members):
+        user = factory.user(name=f"Member {i}")
+        carts.append(factory.cart(user, [(product, 2) for product in products]))
+    return factory.clubbed_order(carts), carts
+
+
+def test_response_is_anonymized(app, client, factory):
+    order, carts = _group(factory, members=3, items_per_cart=2)
+    requester = carts[0].user
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+
+    body = client.get(f"/clubbed-cart/{order.id}").json()
+
+    assert body["total_amount"] == 126.0
+    assert sum(1 for user in body["users"] if user["is_current_user"]) == 1
+    assert {user["user_id"] for user in body["users"] if not user["is_current_user"]} <= {"User 1", "User 2", "User 3"}
+    assert all(user["cart_total"] == 42.0 and user["item_count"] == 2 for user in body["users"])
+    assert body["other_users_total"] == 84.0
+    assert sorted(item["product_name"] for item in body["items"]) == ["Item 0", "Item 1"]
+    assert all(item["added_by_user"] == "You" for item in body["items"])
+
+
+def test_non_member_gets_404(app, client, factory):
+    order, _ = _group(factory, members=2, items_per_cart=1)
+    outsider = factory.user()
+    app.dependency_overrides[get_current_user] = lambda: outsider
+    app.dependency_overrides[get_current_user_async] = lambda: outsider
+    assert client.get(f"/clubbed-cart/{order.id}").status_code == 404
+
+
+@pytest.mark.parametrize("members,items_per_cart", [(2, 1), (4, 10)])
+def test_query_count_is_fixed(app, client, factory, count_queries, members, items_per_cart):
+    order, carts = _group(factory, members, items_per_cart)
+    requester = carts[0].user
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+    url = f"/clubbed-cart/{order.id}"
+
+    with count_queries() as counter:
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(response.json()["users"]) == members
+    assert counter.count == 4
+
+    # Every member's poll is then served from the shared snapshot
+    with count_queries() as counter:
+        assert client.get(url).json() == response.json()
+    assert counter.count == 0
+
+
+def test_cart_change_invalidates_snapshot(app, client, factory):
+    order, carts = _group(factory, members=2, items_per_cart=1)
+    requester = carts[0].user
+    extra = factory.product(price="5.00", name="Extra")
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+    url, product_id = f"/clubbed-cart/{order.id}", extra.id
+
+    def own_entry():
+        return next(user for user in client.get(url).json()["users"] if user["is_current_user"])
+
+    assert own_entry()["cart_total"] == 20.0
+    assert client.post("/cart/items", json={"product_id": product_id, "quantity": 1}).status_code == 200
+
+    assert own_entry()["cart_total"] == 25.0
+    assert own_entry()["item_count"] == 2
+
+
+def test_payment_summary_follows_commitments(app, client, factory, db):
+    from app.crud import commit_to_payment, create_user_orders_for_clubbed_order
+
+    order, carts = _group(factory, members=2, items_per_cart=1)
+    requester = carts[0].user
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+    url = f"/split-payment/summary/{order.id}"
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+
+    summary = client.get(url).json()
+    assert summary["your_portion"] == 20.0
+    assert summary["delivery_fee"] == 20.0
+    assert summary["all_users_committed"] is False
+
+    for user_order in user_orders:
+        assert commit_to_payment(db, user_order.id, "ONLINE", "Somewhere", "9999999999")
+    assert client.get(url).json()["all_users_committed"] is True
+
+
+def test_payment_summary_shares_group_aggregate(app, client, factory, db, count_queries):
+    from app.crud import commit_to_payment, create_user_orders_for_clubbed_order
+
+    order, carts = _group(factory, members=3, items_per_cart=2)
+    members = [cart.user for cart in carts]
+    url = f"/split-payment/summary/{order.id}"
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+    for member in members:
+        db.refresh(member)
+        db.expunge(member)  # behave like cached, detached users
+
+    app.dependency_overrides[get_current_user] = lambda: members[0]
+    app.dependency_overrides[get_current_user_async] = lambda: members[0]
+    with count_queries() as counter:
+        first = client.get(url).json()
+    assert counter.count == 1
+    assert first["confirmed_payments"] == 0 and first["pending_payments"] == 3
+
+    # Other members reuse the cached group aggregate and only read their own order
+    app.dependency_overrides[get_current_user] = lambda: members[1]
+    app.dependency_overrides[get_current_user_async] = lambda: members[1]
+    with count_queries() as counter:
+        second = client.get(url).json()
+    assert counter.count == 1
+    assert "clubbed_orders.committed_count" not in counter.statements[0]
+    assert second["total_order_value"] == first["total_order_value"] == 126.0
+
+    assert commit_to_payment(db, user_orders[0].id, "ONLINE", "Somewhere", "9999999999")
+    with count_queries() as counter:
+        third = client.get(url).json()
+    assert "clubbed_orders.committed_count" in counter.statements[0]
+    assert "count(" not in counter.statements[0].lower()
+    assert third["pending_payments"] == 3 and third["all_users_committed"] is False
+
+
+def _add_url(order):
+    return f"/clubbed-cart/{order.id}/items"
+
+
+def test_add_item_applies_delta_in_one_commit(app, client, factory, db, count_queries):
+    order, carts = _group(factory, members=3, items_per_cart=1)
+    requester = carts[0].user
+    extra = factory.product(price="7.50", weight_grams=250, stock=10, name="Extra")
+    requester_name = requester.name
+    db.expunge(requester)  # behave like a cached, detached user
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+    url, product_id, order_id = _add_url(order), extra.id, order.id
+
+    with count_queries() as counter:
+        response = client.post(url, json={"product_id": product_id, "quantity": 2})
+
+    assert response.status_code == 200
+    assert response.json() == {"product_name": "Extra", "quantity": 2, "price": 7.5, "added_by_user": requester_name}
+    assert not any("FROM users" in statement for statement in counter.statements)
+    assert sum(1 for statement in counter.statements if statement.startswith("UPDATE clubbed_orders")) == 1
+
+    db.expire_all()
+    order = db.get(type(order), order_id)
+    assert float(order.combined_value) == 60.0 + 15.0
+    assert float(order.combined_weight) == 3.0 + 0.5
+    assert float(order.total_discount) == 75.0 * 0.05
+    assert order.version == 1
+    assert db.get(type(extra), product_id).stock == 8
+
+
+def test_add_item_retries_when_version_moves(app, client, factory, db, monkeypatch):
+    from sqlalchemy import update
+    from app import crud
+    from app.models import ClubbedOrder
+
+    order, carts = _group(factory, members=2, items_per_cart=1)
+    requester = carts[0].user
+    extra = factory.product(name="Extra")
+    app.dependency_overrides[get_current_user] = lambda: requester
+    app.dependency_overrides[get_current_user_async] = lambda: requester
+    url, product_id, order_id = _add_url(order), extra.id, order.id
+
+    calls = []
+    original = crud._stage_cart_item
+
+    def racing_stage(session, cart_id, item):
+        calls.append(cart_id)
+        if len(calls) == 1:
+            # Simulate another member's add landing between our read and write
+            session.execute(update(ClubbedOrder).where(ClubbedOrder.id == order_id).values(version=ClubbedOrder.version + 1))
+        return original(session, cart_id, item)
+
+    monkeypatch.setattr(crud, "_stage_cart_item", racing_stage)
+    response = client.post(url, json={"product_id": product_id, "quantity": 1})
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    db.expire_all()
+    assert float(db.get(ClubbedOrder, order_id).combined_value) == 40.0 + 10.0
+
+
+def test_add_item_gives_up_after_retries(app, client, factory, monkeypatch):
+    from sqlalchemy import update
+    from app import crud
+    from app.models import ClubbedOrder
+
+    order, carts = _group(factory, members=2, items_per_cart=1)
+    app.dependency_overrides[get_current_user] = lambda: carts[0].user
+    app.dependency_overrides[get_current_user_async] = lambda: carts[0].user
+    url, product_id, order_id = _add_url(order), factory.product().id, order.id
+    original = crud._stage_cart_item
+
+    def always_racing(session, cart_id, item):
+        session.execute(update(ClubbedOrder).where(ClubbedOrder.id == order_id).values(version=ClubbedOrder.version + 1))
+        return original(session, cart_id, item)
+
+    monkeypatch.setattr(crud, "_stage_cart_item", always_racing)
+    assert client.post(url, json={"product_id": product_id, "quantity": 1}).status_code == 409
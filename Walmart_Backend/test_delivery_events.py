@@ -0,0 +1,195 @@
+"""
+Tests for the delivery event bus and the order tracking stream
+"""
+import asyncio
+import hashlib
+import hmac
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import orjson
+import pytest
+
+from app.auth import create_access_token
+from app.crud import assign_driver_to_order, update_delivery_status
+from app.enums import DeliveryStatus
+from app.events import EventBus, event_bus
+from app.models import ClubbedOrder, Driver
+from app.routers import drivers as drivers_router, orders
+
+SECRET = "s3cret"
+
+
+@pytest.fixture(autouse=True)
+def driver_secret(monkeypatch):
+    monkeypatch.setattr(drivers_router, "DRIVER_TELEMETRY_SECRET", SECRET)
+
+
+def _driver(db):
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20], status="AVAILABLE",
+                    lat=Decimal("12.972000"), lng=Decimal("77.595000"),
+                    current_load=Decimal("0"), max_capacity=Decimal("10"))
+    db.add(driver)
+    db.commit()
+    return driver.id
+
+
+def _assigned_order(factory, db, members=2):
+    product = factory.product(weight_grams=1000)
+    carts = [factory.cart(factory.user(), [(product, 1)]) for _ in range(members)]
+    for cart in carts:
+        factory.buddy(cart)
+    order = factory.clubbed_order(carts)
+    driver_id = _driver(db)
+    delivery = assign_driver_to_order(db, order.id)
+    return order.id, delivery.id, driver_id, [cart.user for cart in carts]
+
+
+def _signature(message):
+    return hmac.new(SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _post_telemetry(client, pings):
+    body = orjson.dumps({"pings": pings})
+    return client.post("/drivers/telemetry", content=body, headers={"X-Telemetry-Signature": _signature(body)})
+
+
+def _report_status(client, delivery_id, status, signed_for=None):
+    body = orjson.dumps({"status": status})
+    signature = _signature((signed_for or delivery_id).encode() + b"\n" + body)
+    return client.post(f"/drivers/deliveries/{delivery_id}/status", content=body,
+                       headers={"X-Telemetry-Signature": signature})
+
+
+def _token(user):
+    return create_access_token({"sub": user.email, "uid": user.id})
+
+
+def _events(body: bytes):
+    events = []
+    for block in body.decode().split("\n\n"):
+        for line in block.splitlines():
+            if line.startswith("data: "):
+                events.append(orjson.loads(line[len("data: "):]))
+    return events
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_bus_fans_out_across_threads_and_drops_oldest_when_full():
+    async def scenario():
+        bus = EventBus(queue_size=2)
+        members = [bus.subscribe("order-1") for _ in range(3)]
+        other = bus.subscribe("order-2")
+
+        publisher = threading.Thread(target=lambda: [bus.publish("order-1", {"seq": n}) for n in range(3)])
+        publisher.start()
+        publisher.join()
+        await asyncio.sleep(0)
+
+        for subscription in members:
+            assert [subscription.queue.get_nowait()["seq"] for _ in range(2)] == [1, 2]
+        assert other.queue.empty()
+        assert bus.stats()["dropped"] == 3
+
+        bus.watch_driver("driver-1", "order-1")
+        for subscription in members:
+            bus.unsubscribe(subscription)
+        assert bus.stats()["watched_drivers"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_members_follow_status_and_position_until_delivered(app, client, factory, db):
+    order_id, delivery_id, driver_id, members = _assigned_order(factory, db)
+    bodies = {}
+
+    def follow(member):
+        bodies[member.id] = client.get(f"/orders/{order_id}/events", params={"token": _token(member)}).content
+
+    streams = [threading.Thread(target=follow, args=(member,)) for member in members]
+    for stream in streams:
+        stream.start()
+    # Both streams have sent their snapshot and follow the driver
+    _wait_for(lambda: event_bus.subscriber_count(order_id) == 2 and event_bus.stats()["watched_drivers"] == 1)
+
+    assert _report_status(client, delivery_id, "IN_TRANSIT").status_code == 200
+    _post_telemetry(client, [{"driver_id": driver_id, "lat": 12.9801, "lng": 77.6001, "recorded_at": None}])
+    response = _report_status(client, delivery_id, "DELIVERED")
+    assert response.json()["status"] == "DELIVERED"
+
+    for stream in streams:
+        stream.join(timeout=5)
+        assert not stream.is_alive()
+    assert event_bus.subscriber_count() == 0
+
+    for member in members:
+        events = _events(bodies[member.id])
+        assert [event["type"] for event in events] == [
+            "snapshot", "delivery_status", "driver_position", "delivery_status"
+        ]
+        assert events[0]["delivery"]["status"] == "ASSIGNED"
+        assert events[1]["order_status"] == "DISPATCHED"
+        assert (events[2]["lat"], events[2]["lng"]) == (12.9801, 77.6001)
+        assert events[3]["order_status"] == "DELIVERED" and events[3]["actual_delivery"]
+
+
+def test_idle_stream_ends_when_another_worker_finishes_the_order(app, client, factory, db, monkeypatch):
+    order_id, _, _, members = _assigned_order(factory, db)
+    monkeypatch.setattr(orders, "EVENT_STREAM_HEARTBEAT_SECONDS", 0.05)
+    bodies = []
+    stream = threading.Thread(target=lambda: bodies.append(
+        client.get(f"/orders/{order_id}/events", params={"token": _token(members[0])}).content
+    ))
+    stream.start()
+    _wait_for(lambda: event_bus.subscriber_count(order_id) == 1)
+
+    # Cancelled by another process: nothing is published on this bus
+    db.query(ClubbedOrder).filter(ClubbedOrder.id == order_id).update({"status": "CANCELLED"})
+    db.commit()
+
+    stream.join(timeout=5)
+    assert not stream.is_alive()
+    events = _events(bodies[0])
+    assert [event["type"] for event in events] == ["snapshot", "snapshot"]
+    assert events[-1]["order_status"] == "CANCELLED"
+
+
+def test_stream_requires_membership(app, client, factory, db):
+    order_id, _, _, _ = _assigned_order(factory, db)
+    outsider = factory.user()
+
+    assert client.get(f"/orders/{order_id}/events").status_code == 401
+    assert client.get(f"/orders/{order_id}/events", params={"token": _token(outsider)}).status_code == 404
+
+
+def test_status_reports_must_be_signed_for_their_delivery(client, factory, db, monkeypatch):
+    order_id, delivery_id, _, _ = _assigned_order(factory, db)
+    _, other_delivery_id, _, _ = _assigned_order(factory, db)
+    url = f"/drivers/deliveries/{delivery_id}/status"
+
+    assert client.post(url, json={"status": "DELIVERED"}).status_code == 401
+    # A valid report for another delivery does not carry over
+    assert _report_status(client, delivery_id, "DELIVERED", signed_for=other_delivery_id).status_code == 401
+    monkeypatch.setattr(drivers_router, "DRIVER_TELEMETRY_SECRET", None)
+    assert _report_status(client, delivery_id, "DELIVERED").status_code == 503
+
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "PREPARING"
+
+
+def test_delivery_status_only_moves_forward(factory, db):
+    order_id, delivery_id, _, _ = _assigned_order(factory, db)
+
+    assert update_delivery_status(db, delivery_id, DeliveryStatus.DELIVERED).status == DeliveryStatus.DELIVERED
+    # A late IN_TRANSIT report does not move the delivery back
+    assert update_delivery_status(db, delivery_id, DeliveryStatus.IN_TRANSIT).status == DeliveryStatus.DELIVERED
+    assert db.get(ClubbedOrder, order_id).status == "DELIVERED"
+    assert update_delivery_status(db, "missing", DeliveryStatus.DELIVERED) is None
@@ -0,0 +1,139 @@
+"""
+Tests for nearest-driver assignment and the in-memory driver index
+"""
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import assign_driver_to_order
+from app.driver_index import DriverIndex, driver_index
+from app.geo import haversine
+from app.models import Base, ClubbedOrder, Delivery, Driver
+
+
+def _driver(db, lat, lng, load="0.00", capacity="10.00", status="AVAILABLE"):
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20], status=status,
+                    lat=Decimal(lat), lng=Decimal(lng), current_load=Decimal(load), max_capacity=Decimal(capacity))
+    db.add(driver)
+    db.commit()
+    return driver.id
+
+
+def _located_order(factory, lat="12.971600", lng="77.594600"):
+    product = factory.product(weight_grams=1000)
+    carts = [factory.cart(factory.user(), [(product, 2)]) for _ in range(2)]
+    for cart in carts:
+        factory.buddy(cart, lat=lat, lng=lng)
+    return factory.clubbed_order(carts).id  # 4 kg
+
+
+def test_assigns_nearest_driver_with_capacity(factory, db):
+    order_id = _located_order(factory)
+    far = _driver(db, "13.050000", "77.700000")
+    near_but_full = _driver(db, "12.972000", "77.595000", load="8.00")
+    near = _driver(db, "12.975000", "77.598000")
+
+    delivery = assign_driver_to_order(db, order_id)
+
+    assert delivery.driver_id == near
+    assert {near_but_full, far} <= set(driver_index._driver_cells)
+    assert driver_index.nearest(12.9716, 77.5946, 4)[0] == near  # 4 of 10 kg used, still available
+
+
+def test_index_follows_assignments_and_stale_rows(factory, db):
+    first_order, second_order = _located_order(factory), _located_order(factory)
+    near = _driver(db, "12.971700", "77.594700", capacity="4.00")
+    backup = _driver(db, "12.990000", "77.610000")
+
+    assert assign_driver_to_order(db, first_order).driver_id == near
+    assert near not in driver_index._driver_cells  # now BUSY
+
+    # Another worker filled the backup driver; the index still thinks it has room
+    db.get(Driver, backup).current_load = Decimal("9.00")
+    db.commit()
+    assert assign_driver_to_order(db, second_order) is None
+    assert driver_index.nearest(12.9716, 77.5946, 4) is None
+    assert db.query(Delivery).count() == 1
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(7)
+    index = DriverIndex(cell_degrees=0.005)
+    drivers = {}
+    for i in range(3000):
+        lat, lng, remaining = 12.9 + rng.random() * 0.2, 77.5 + rng.random() * 0.2, rng.uniform(0, 10)
+        drivers[str(i)] = (lat, lng, remaining)
+        index.put(str(i), lat, lng, remaining)
+    for i in range(0, 3000, 3):  # moves and removals keep cells consistent
+        lat, lng, _ = drivers[str(i)]
+        drivers[str(i)] = (lat + 0.01, lng, 5.0)
+        index.put(str(i), lat + 0.01, lng, 5.0)
+    for i in range(1, 3000, 5):
+        del drivers[str(i)]
+        index.remove(str(i))
+
+    for _ in range(200):
+        lat, lng, weight = 12.9 + rng.random() * 0.2, 77.5 + rng.random() * 0.2, rng.uniform(0, 9)
+        expected = min(
+            (haversine(lat, lng, d_lat, d_lng) for d_lat, d_lng, remaining in drivers.values() if remaining >= weight),
+            default=None
+        )
+        found = index.nearest(lat, lng, weight)
+        assert found is not None and abs(found[1] - expected) < 1e-6
+
+
+def test_concurrent_assignments_never_exceed_capacity(factory, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'drivers.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    setup = Session()
+    setup_factory = type(factory)(setup)
+    order_ids = [_located_order(setup_factory) for _ in range(40)]  # 4 kg each
+    driver_ids = [_driver(setup, "12.971700", "77.594700") for _ in range(5)]  # 10 kg each: two orders apiece
+    setup.close()
+
+    pending = list(order_ids)
+    lock = threading.Lock()
+
+    def dispatcher():
+        db = Session()
+        try:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    order_id = pending.pop()
+                while True:
+                    try:
+                        assign_driver_to_order(db, order_id)
+                        break
+                    except OperationalError:  # SQLite writer contention; retry the order
+                        db.rollback()
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=dispatcher) for _ in range(8)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"{len(order_ids) / elapsed:.1f} assignment attempts/s with {len(threads)} threads")
+
+    check = Session()
+    loads = dict(check.query(Delivery.driver_id, func.sum(ClubbedOrder.combined_weight)).join(
+        ClubbedOrder, ClubbedOrder.id == Delivery.clubbed_order_id
+    ).group_by(Delivery.driver_id).all())
+    for driver in check.query(Driver).filter(Driver.id.in_(driver_ids)):
+        assert driver.current_load <= driver.max_capacity
+        assert driver.current_load == loads.get(driver.id, 0)
+    assert check.query(Delivery).count() == 10
+    check.close()
+    engine.dispose()
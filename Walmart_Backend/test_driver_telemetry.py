@@ -0,0 +1,116 @@
+"""
+Tests for driver telemetry ingestion and the in-memory position store
+"""
+import hashlib
+import hmac
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from app.auth import get_current_user, get_current_user_async
+from app.crud import assign_driver_to_order
+from app.models import Driver
+from app.routers import drivers as drivers_router
+from app.telemetry import driver_positions, flush_driver_positions
+
+SECRET = "s3cret"
+
+
+@pytest.fixture(autouse=True)
+def telemetry_secret(monkeypatch):
+    monkeypatch.setattr(drivers_router, "DRIVER_TELEMETRY_SECRET", SECRET)
+
+
+def _driver(db, lat="13.100000", lng="77.700000"):
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20], status="AVAILABLE",
+                    lat=Decimal(lat), lng=Decimal(lng), current_load=Decimal("0"), max_capacity=Decimal("10"))
+    db.add(driver)
+    db.commit()
+    return driver.id
+
+
+def _ping(driver_id, lat, lng, recorded_at):
+    return {"driver_id": driver_id, "lat": lat, "lng": lng, "recorded_at": recorded_at}
+
+
+def _post_pings(client, pings):
+    body = json.dumps({"pings": pings}).encode()
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return client.post("/drivers/telemetry", content=body, headers={"X-Telemetry-Signature": signature})
+
+
+def test_pings_coalesce_into_one_row_write_per_driver(app, client, db, count_queries):
+    first, second = _driver(db), _driver(db)
+    response = _post_pings(client, [
+        _ping(first, 12.95, 77.59, "2030-01-01T10:00:00Z"),
+        _ping(first, 12.96, 77.60, "2030-01-01T10:00:05Z"),
+        _ping(first, 12.90, 77.50, "2030-01-01T09:59:00Z"),  # arrived late
+        _ping(second, 12.97, 77.61, "2030-01-01T10:00:01Z"),
+    ])
+    assert response.json() == {"received": 4, "accepted": 3, "stale": 1, "unknown_drivers": 0}
+    assert driver_positions.get(first)[:2] == (12.96, 77.60)
+
+    with count_queries() as counter:
+        assert flush_driver_positions(db) == 2
+    assert sum(1 for statement in counter.statements if statement.startswith("UPDATE drivers")) == 1
+    assert flush_driver_positions(db) == 0
+
+    db.expire_all()
+    assert float(db.get(Driver, first).lat) == 12.96
+
+
+def test_assignment_and_tracking_read_live_positions(app, client, factory, db):
+    product = factory.product(weight_grams=1000)
+    carts = [factory.cart(factory.user(), [(product, 1)]) for _ in range(2)]
+    for cart in carts:
+        factory.buddy(cart, lat="12.971600", lng="77.594600")
+    order = factory.clubbed_order(carts)
+    order_id, member = order.id, carts[0].user
+    parked_nearby = _driver(db, lat="12.972000", lng="77.595000")
+    moving = _driver(db)  # the table still has its old, distant position
+
+    _post_pings(client, [_ping(moving, 12.9716, 77.5946, None)])
+    assert assign_driver_to_order(db, order_id).driver_id == moving
+    assert parked_nearby != moving
+
+    app.dependency_overrides[get_current_user] = lambda: member
+    app.dependency_overrides[get_current_user_async] = lambda: member
+    body = client.get(f"/orders/{order_id}/delivery").json()
+    assert body["driver_id"] == moving
+    assert (body["driver_position"]["lat"], body["driver_position"]["lng"]) == (12.9716, 77.5946)
+
+
+def test_signed_batches_are_verified(app, client, db):
+    driver_id = _driver(db)
+    body = json.dumps({"pings": [_ping(driver_id, 12.9, 77.5, None)]}).encode()
+
+    assert client.post("/drivers/telemetry", content=body).status_code == 401
+    assert client.post("/drivers/telemetry", content=body, headers={"X-Telemetry-Signature": "bad"}).status_code == 401
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    response = client.post("/drivers/telemetry", content=body, headers={"X-Telemetry-Signature": signature})
+    assert response.json()["accepted"] == 1
+
+
+def test_telemetry_is_refused_without_a_secret(app, client, db, monkeypatch):
+    monkeypatch.setattr(drivers_router, "DRIVER_TELEMETRY_SECRET", None)
+    driver_id = _driver(db)
+
+    response = client.post("/drivers/telemetry", json={"pings": [_ping(driver_id, 12.9, 77.5, None)]})
+    assert response.status_code == 503
+    assert driver_positions.get(driver_id) is None
+
+
+def test_pings_for_unknown_drivers_are_dropped(app, client, db, count_queries):
+    driver_id = _driver(db)
+
+    response = _post_pings(client, [_ping(driver_id, 12.9, 77.5, None), _ping("no-such-driver", 12.9, 77.5, None)])
+    assert response.json() == {"received": 2, "accepted": 1, "stale": 0, "unknown_drivers": 1}
+    assert driver_positions.get("no-such-driver") is None
+    assert len(driver_positions) == 1
+
+    # Drivers already in the store are not looked up again
+    with count_queries() as counter:
+        assert _post_pings(client, [_ping(driver_id, 12.8, 77.4, None)]).json()["accepted"] == 1
+    assert counter.count == 0
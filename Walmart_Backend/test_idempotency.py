@@ -0,0 +1,121 @@
+"""
+Tests for Idempotency-Key handling on split-payment endpoints
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from app import outbox
+from app.auth import create_access_token, get_current_user, get_current_user_async
+from app.crud import commit_to_payment, create_user_orders_for_clubbed_order
+from app.idempotency import _scope_key, response_cache
+from app.models import IdempotencyKey, PaymentTransaction
+
+
+def _committed_order(app, factory, db):
+    product = factory.product(price="10.00")
+    carts = [factory.cart(factory.user(name=f"Member {i}"), [(product, 1)]) for i in range(2)]
+    order = factory.clubbed_order(carts)
+    user_order = create_user_orders_for_clubbed_order(db, order.id)[0]
+    assert commit_to_payment(db, user_order.id, "ONLINE", "Somewhere", "9999999999")
+    owner = db.get(type(carts[0].user), user_order.user_id)
+    app.dependency_overrides[get_current_user] = lambda: owner
+    app.dependency_overrides[get_current_user_async] = lambda: owner
+    return user_order.id
+
+
+def _confirm(client, user_order_id, key, transaction_id="txn-1"):
+    return client.post(
+        "/split-payment/confirm",
+        json={"user_order_id": user_order_id, "external_transaction_id": transaction_id},
+        headers={"Idempotency-Key": key},
+    )
+
+
+def _payments(db, user_order_id):
+    outbox.drain(db)
+    return db.query(PaymentTransaction).filter(PaymentTransaction.user_order_id == user_order_id).count()
+
+
+def test_retry_replays_first_response_without_db_access(app, client, factory, db, count_queries):
+    user_order_id = _committed_order(app, factory, db)
+    first = _confirm(client, user_order_id, "key-1")
+    assert first.status_code == 200
+
+    with count_queries() as counter:
+        retry = _confirm(client, user_order_id, "key-1")
+
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert counter.count == 0
+    assert _payments(db, user_order_id) == 1
+
+
+def test_replay_falls_back_to_database(app, client, factory, db, count_queries):
+    user_order_id = _committed_order(app, factory, db)
+    first = _confirm(client, user_order_id, "key-1")
+    response_cache.clear()  # as if the retry reached another worker
+
+    with count_queries() as counter:
+        retry = _confirm(client, user_order_id, "key-1")
+
+    assert retry.json() == first.json()
+    assert not any("user_orders" in statement or "payment_transactions" in statement
+                   for statement in counter.statements)
+    assert _payments(db, user_order_id) == 1
+
+
+def test_key_reused_with_different_body_is_rejected(app, client, factory, db):
+    user_order_id = _committed_order(app, factory, db)
+    assert _confirm(client, user_order_id, "key-1").status_code == 200
+    assert _confirm(client, user_order_id, "key-1", transaction_id="txn-2").status_code == 422
+    assert _payments(db, user_order_id) == 1
+
+
+def test_in_flight_key_gets_conflict(app, client, factory, db):
+    user_order_id = _committed_order(app, factory, db)
+    body = json.dumps({"user_order_id": user_order_id, "external_transaction_id": "txn-1"}).encode()
+    db.add(IdempotencyKey(
+        key=_scope_key("", "/split-payment/confirm", "key-1"),
+        request_fingerprint=hashlib.sha256(body).hexdigest(),
+        created_at=datetime.utcnow(),
+        expires_at=datetime.utcnow() + timedelta(hours=1),
+    ))
+    db.commit()
+
+    response = _confirm(client, user_order_id, "key-1")
+    assert response.status_code == 409
+    assert _payments(db, user_order_id) == 0
+
+
+def test_requests_without_key_are_untouched(app, client, factory, db):
+    user_order_id = _committed_order(app, factory, db)
+    for _ in range(2):
+        response = client.post("/split-payment/confirm", json={"user_order_id": user_order_id})
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+    # The repeat confirmation is a no-op: one PAYMENT row
+    assert _payments(db, user_order_id) == 1
+    assert db.query(IdempotencyKey).count() == 0
+
+
+def test_retry_after_token_refresh_is_replayed(app, client, factory, db):
+    user_order_id = _committed_order(app, factory, db)
+    owner = app.dependency_overrides[get_current_user]()
+    claims = {"sub": owner.email, "uid": owner.id}
+    tokens = [create_access_token(claims, expires_delta=timedelta(minutes=minutes)) for minutes in (5, 30)]
+    assert tokens[0] != tokens[1]
+
+    responses = [
+        client.post(
+            "/split-payment/confirm",
+            json={"user_order_id": user_order_id, "external_transaction_id": "txn-1"},
+            headers={"Idempotency-Key": "key-1", "Authorization": f"Bearer {token}"},
+        )
+        for token in tokens
+    ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    assert _payments(db, user_order_id) == 1
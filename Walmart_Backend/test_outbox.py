@@ -0,0 +1,85 @@
+"""
+Tests for the payment side-effect outbox
+"""
+from sqlalchemy import event
+
+from app import outbox
+from app.crud import cancel_user_order, commit_to_payment, confirm_payment, create_user_orders_for_clubbed_order
+from app.models import ClubbedOrder, OrderCancellation, OutboxEvent, PaymentTransaction, UserOrder
+
+
+def _group(factory, db, members=3):
+    product = factory.product(price="100.00")
+    carts = [factory.cart(factory.user(name=f"Member {i}"), [(product, 5)]) for i in range(members)]
+    order = factory.clubbed_order(carts)
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+    return order.id, [(user_order.id, user_order.user_id) for user_order in user_orders]
+
+
+def _transactions(db, transaction_type):
+    return db.query(PaymentTransaction).filter(PaymentTransaction.transaction_type == transaction_type).all()
+
+
+def test_cancellation_commits_once_and_defers_compensation(factory, db):
+    order_id, user_orders = _group(factory, db)
+    user_order_id, user_id = user_orders[0]
+    commits = []
+    record_commit = commits.append
+    event.listen(db, "after_commit", record_commit)
+
+    cancellation = cancel_user_order(db, user_order_id, user_id)
+    event.remove(db, "after_commit", record_commit)
+    assert cancellation is not None
+    assert len(commits) == 1
+
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+    assert {uo.payment_status for uo in db.query(UserOrder)} == {"CANCELLED"}
+    assert db.query(PaymentTransaction).count() == 0
+    assert db.query(OutboxEvent).filter(OutboxEvent.processed_at.is_(None)).count() == 1
+
+    assert outbox.drain(db) == 1
+    compensations = _transactions(db, "COMPENSATION")
+    assert len(compensations) == 2
+    assert sum(float(row.amount) for row in compensations) == 30.0  # 60% of a 50.0 fee
+    assert len(_transactions(db, "PENALTY")) == 1
+    assert db.get(OrderCancellation, cancellation.id).compensation_processed is True
+
+
+def test_redelivered_events_do_not_duplicate_rows(factory, db):
+    _, user_orders = _group(factory, db)
+    (first, first_user), (second, _), _ = user_orders
+    for user_order_id, _ in user_orders:
+        assert commit_to_payment(db, user_order_id, "ONLINE", "Somewhere", "9999999999")
+    assert confirm_payment(db, second, "txn-1")
+    assert cancel_user_order(db, first, first_user)
+    assert outbox.drain(db) == 2
+    counts = db.query(PaymentTransaction).count()
+
+    # Simulate the worker crashing after the handlers ran but before acknowledging
+    db.query(OutboxEvent).update({OutboxEvent.processed_at: None})
+    db.commit()
+    assert outbox.drain(db) == 2
+    assert db.query(PaymentTransaction).count() == counts
+    assert len(_transactions(db, "PAYMENT")) == 1
+
+
+def test_failing_handler_is_retried(factory, db, monkeypatch):
+    order_id, user_orders = _group(factory, db)
+    user_order_id, user_id = user_orders[0]
+    assert cancel_user_order(db, user_order_id, user_id)
+
+    original = outbox._handlers["order.cancelled"]
+
+    def flaky(session, payload):
+        raise RuntimeError("ledger unavailable")
+
+    monkeypatch.setitem(outbox._handlers, "order.cancelled", flaky)
+    assert outbox.process_batch(db) == 0
+    event = db.query(OutboxEvent).one()
+    assert event.attempts == 1 and "ledger unavailable" in event.last_error
+    assert db.query(PaymentTransaction).count() == 0
+
+    monkeypatch.setitem(outbox._handlers, "order.cancelled", original)
+    assert outbox.process_batch(db) == 1
+    assert db.query(PaymentTransaction).count() == 3
@@ -0,0 +1,57 @@
+"""
+Tests for bcrypt offloading to the password hashing process pool
+"""
+from app import password_hashing
+from app.password_hashing import hash_queue_stats, pwd_context
+
+
+def _register(client, email="asha@example.com", password="s3cret-pass"):
+    return client.post("/auth/register", json={"name": "Asha", "email": email, "password": password})
+
+
+def test_register_and_login_use_hash_pool(client):
+    before = hash_queue_stats()["completed"]
+
+    registered = _register(client)
+    assert registered.status_code == 200
+
+    login = client.post("/auth/login", json={"email": "asha@example.com", "password": "s3cret-pass"})
+    assert login.status_code == 200
+    token = login.json()["access_token"]
+    me = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.json()["email"] == "asha@example.com"
+
+    stats = hash_queue_stats()
+    assert stats["completed"] == before + 2
+    assert stats["pending"] == 0
+    assert stats["bcrypt_rounds"] == 4
+
+
+def test_stored_hash_uses_configured_cost(client, db):
+    from app.models import User
+    _register(client)
+    stored = db.query(User).one().password_hash
+    assert pwd_context.identify(stored) == "bcrypt"
+    assert "$04$" in stored
+
+
+def test_wrong_password_and_duplicate_email(client):
+    _register(client)
+    bad = client.post("/auth/login", json={"email": "asha@example.com", "password": "nope"})
+    assert bad.status_code == 401
+    assert _register(client).status_code == 400
+
+
+def test_full_queue_returns_503(client, monkeypatch):
+    _register(client)
+    monkeypatch.setattr(password_hashing, "PASSWORD_HASH_MAX_PENDING", 0)
+    response = client.post("/auth/login", json={"email": "asha@example.com", "password": "s3cret-pass"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert hash_queue_stats()["rejected"] >= 1
+
+
+def test_metrics_report_queue_wait(client):
+    _register(client)
+    body = client.get("/metrics").json()["password_hashing"]
+    assert {"avg_queue_wait_ms", "max_queue_wait_ms", "pending", "workers"} <= body.keys()
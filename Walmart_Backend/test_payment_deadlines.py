@@ -0,0 +1,143 @@
+"""
+Tests for the payment deadline scheduler (enforce_payment_deadlines)
+"""
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import crud
+from app.crud import (
+    _expired_payment_offenders, assign_driver_to_order, commit_to_payment, create_user_orders_for_clubbed_order,
+    enforce_payment_deadlines
+)
+from app.models import ClubbedOrder, Driver, OrderCancellation, UserOrder
+
+
+def _pending_group(factory, db, members=2):
+    product = factory.product(price="10.00", weight_grams=1000)
+    carts = [factory.cart(factory.user(name=f"Member {i}"), [(product, 2)]) for i in range(members)]
+    order = factory.clubbed_order(carts)
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+    return order.id, user_orders
+
+
+def _assign_driver(db, clubbed_order_id, load="1.00", capacity="5.00"):
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20],
+                    status="AVAILABLE", current_load=Decimal(load), max_capacity=Decimal(capacity))
+    db.add(driver)
+    db.commit()
+    delivery = assign_driver_to_order(db, clubbed_order_id)
+    assert delivery.driver_id == driver.id
+    return driver.id
+
+
+def test_missed_commitment_cancels_group_with_timeout(factory, db):
+    order_id, user_orders = _pending_group(factory, db)
+    committed, missed = user_orders
+    committed_id, missed_id, missed_user_id = committed.id, missed.id, missed.user_id
+    assert commit_to_payment(db, committed_id, "ONLINE", "Somewhere", "9999999999")
+
+    later = datetime.utcnow() + timedelta(minutes=11)
+    assert enforce_payment_deadlines(db, now=later) == 1
+
+    db.expire_all()
+    cancellation = db.query(OrderCancellation).filter(OrderCancellation.clubbed_order_id == order_id).one()
+    assert cancellation.cancellation_reason == "TIMEOUT"
+    assert cancellation.user_order_id == missed_id
+    assert cancellation.cancelled_by_user_id == missed_user_id
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+    assert {uo.payment_status for uo in db.query(UserOrder).filter(UserOrder.clubbed_order_id == order_id)} == {"CANCELLED"}
+
+    # Cancelled orders leave the deadline range; the next cycle finds nothing
+    assert enforce_payment_deadlines(db, now=later) == 0
+
+
+def test_missed_payment_confirmation_is_enforced(factory, db):
+    order_id, user_orders = _pending_group(factory, db)
+    for user_order in user_orders:
+        assert commit_to_payment(db, user_order.id, "ONLINE", "Somewhere", "9999999999")
+
+    # Everyone committed, so commitment deadlines no longer apply
+    assert enforce_payment_deadlines(db, now=datetime.utcnow() + timedelta(minutes=11)) == 0
+    assert enforce_payment_deadlines(db, now=datetime.utcnow() + timedelta(minutes=31)) == 1
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+
+
+def test_open_deadlines_are_left_alone(factory, db, engine, count_queries):
+    order_id, _ = _pending_group(factory, db)
+
+    with count_queries() as counter:
+        assert enforce_payment_deadlines(db) == 0
+    assert counter.count == 2
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "PAYMENT_PENDING"
+
+
+def test_driver_capacity_is_released(factory, db):
+    order_id, _ = _pending_group(factory, db)  # 4 kg combined
+    driver_id = _assign_driver(db, order_id)
+    assert db.get(Driver, driver_id).status == "BUSY"
+
+    assert enforce_payment_deadlines(db, now=datetime.utcnow() + timedelta(minutes=11)) == 1
+
+    db.expire_all()
+    driver = db.get(Driver, driver_id)
+    assert driver.current_load == Decimal("1.00")
+    assert driver.status == "AVAILABLE"
+
+
+def test_missed_payment_on_a_group_with_a_driver_is_enforced(factory, db):
+    order_id, user_orders = _pending_group(factory, db)
+    driver_id = _assign_driver(db, order_id)
+    for user_order in user_orders:
+        assert commit_to_payment(db, user_order.id, "ONLINE", "Somewhere", "9999999999")
+    assert db.get(ClubbedOrder, order_id).status == "PREPARING"
+
+    assert enforce_payment_deadlines(db, now=datetime.utcnow() + timedelta(minutes=31)) == 1
+
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+    assert db.get(Driver, driver_id).current_load == Decimal("1.00")
+
+
+def test_missed_payment_offender_is_a_committed_member(factory, db):
+    # Group A: the first member never committed, the second committed but did not pay
+    order_id, (uncommitted, committed) = _pending_group(factory, db)
+    committed_id = committed.id
+    assert commit_to_payment(db, committed_id, "ONLINE", "Somewhere", "9999999999")
+    # Group B's older commitment deadline fills the one-row commitment batch
+    other_id, other_orders = _pending_group(factory, db)
+    for user_order in other_orders:
+        user_order.commitment_deadline -= timedelta(minutes=5)
+    db.get(ClubbedOrder, other_id).payment_confirmation_deadline = datetime.utcnow() + timedelta(hours=1)
+    db.commit()
+
+    offenders = _expired_payment_offenders(db, datetime.utcnow() + timedelta(minutes=31), batch_size=1)
+
+    assert offenders[order_id][0] == committed_id
+
+
+def test_group_that_fails_to_cancel_does_not_block_the_sweep(factory, db, monkeypatch):
+    stuck_id, stuck_orders = _pending_group(factory, db)
+    for user_order in stuck_orders:
+        user_order.commitment_deadline -= timedelta(minutes=5)  # first in line
+    db.commit()
+    stuck = {user_order.id for user_order in stuck_orders}
+    order_id, _ = _pending_group(factory, db)
+
+    cancel = crud.cancel_user_order
+    monkeypatch.setattr(crud, "cancel_user_order", lambda db, user_order_id, user_id, reason: (
+        None if user_order_id in stuck
+        else cancel(db, user_order_id, user_id, reason=reason)
+    ))
+    later = datetime.utcnow() + timedelta(minutes=11)
+    failed = set()
+
+    assert enforce_payment_deadlines(db, now=later, batch_size=1, failed=failed) == 0
+    assert failed == {stuck_id}
+    assert enforce_payment_deadlines(db, now=later, batch_size=1, failed=failed) == 1
+
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+    assert db.get(ClubbedOrder, stuck_id).status == "PAYMENT_PENDING"
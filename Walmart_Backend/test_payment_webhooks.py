@@ -0,0 +1,130 @@
+"""
+Tests for POST /split-payment/webhooks/batch
+"""
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from app.crud import commit_to_payment, create_user_orders_for_clubbed_order
+from app.models import ClubbedOrder, PaymentTransaction, UserOrder
+from app.routers import split_payment
+
+URL = "/split-payment/webhooks/batch"
+SECRET = "shh"
+
+
+@pytest.fixture(autouse=True)
+def webhook_secret(monkeypatch):
+    monkeypatch.setattr(split_payment, "PAYMENT_WEBHOOK_SECRET", SECRET)
+
+
+def _committed_groups(factory, db, groups, members):
+    product = factory.product(price="10.00")
+    ids = []
+    for _ in range(groups):
+        carts = [factory.cart(factory.user(), [(product, 1)]) for _ in range(members)]
+        order = factory.clubbed_order(carts)
+        user_orders = create_user_orders_for_clubbed_order(db, order.id)
+        for user_order in user_orders:
+            assert commit_to_payment(db, user_order.id, "ONLINE", "Somewhere", "9999999999")
+        ids.append((order.id, [user_order.id for user_order in user_orders]))
+    return ids
+
+
+def _batch(user_order_ids):
+    return {"confirmations": [
+        {"user_order_id": user_order_id, "external_transaction_id": f"txn-{user_order_id}", "payment_gateway": "mock"}
+        for user_order_id in user_order_ids
+    ]}
+
+
+def _deliver(client, batch):
+    body = json.dumps(batch).encode()
+    return client.post(URL, content=body, headers={
+        "Content-Type": "application/json",
+        "X-Webhook-Signature": hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest(),
+    })
+
+
+@pytest.mark.parametrize("groups", [2, 20])
+def test_batch_is_applied_with_fixed_statement_count(client, factory, db, count_queries, groups):
+    orders = _committed_groups(factory, db, groups, members=3)
+    # First two members of every group pay; the last group is fully paid
+    paid = [user_order_id for _, user_orders in orders for user_order_id in user_orders[:2]]
+    paid.append(orders[-1][1][2])
+
+    with count_queries() as counter:
+        result = _deliver(client, _batch(paid)).json()
+
+    # lookup, status UPDATE, transaction INSERT, counter UPDATE (executemany), completion check
+    assert counter.count == 5
+    assert result["confirmed"] == len(paid)
+    assert result["completed_clubbed_orders"] == [orders[-1][0]]
+
+    db.expire_all()
+    assert db.query(PaymentTransaction).count() == len(paid)
+    assert db.get(ClubbedOrder, orders[-1][0]).status == "PAYMENT_CONFIRMED"
+    assert db.get(ClubbedOrder, orders[0][0]).confirmed_count == 2
+    assert db.get(ClubbedOrder, orders[0][0]).status == "PAYMENT_PENDING"
+
+
+def test_redelivery_and_unknown_ids_are_reported(client, factory, db):
+    (order_id, user_orders), = _committed_groups(factory, db, groups=1, members=2)
+    assert _deliver(client, _batch(user_orders[:1])).json()["confirmed"] == 1
+
+    result = _deliver(client, _batch([user_orders[0], user_orders[0], "missing"])).json()
+    assert result["confirmed"] == 0
+    assert result["duplicates"] == 2
+    assert result["unknown"] == ["missing"]
+    assert db.query(PaymentTransaction).count() == 1
+
+
+def test_uncommitted_orders_are_rejected(client, factory, db):
+    product = factory.product()
+    order = factory.clubbed_order([factory.cart(factory.user(), [(product, 1)]) for _ in range(2)])
+    user_order_id = create_user_orders_for_clubbed_order(db, order.id)[0].id
+
+    result = _deliver(client, _batch([user_order_id])).json()
+    assert result["rejected"] == [user_order_id]
+    db.expire_all()
+    assert db.get(UserOrder, user_order_id).payment_status == "PENDING"
+
+
+def test_cancelled_groups_are_rejected(client, factory, db):
+    (order_id, user_orders), = _committed_groups(factory, db, groups=1, members=2)
+    # Cancelled as a group while the member orders are still PENDING
+    db.get(ClubbedOrder, order_id).status = "CANCELLED"
+    db.commit()
+
+    result = _deliver(client, _batch(user_orders)).json()
+    assert result["confirmed"] == 0
+    assert sorted(result["rejected"]) == sorted(user_orders)
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).confirmed_count == 0
+    assert db.query(PaymentTransaction).count() == 0
+
+
+def test_signature_is_required(client, factory, db):
+    (_, user_orders), = _committed_groups(factory, db, groups=1, members=2)
+    body = json.dumps(_batch(user_orders)).encode()
+    headers = {"Content-Type": "application/json"}
+
+    assert client.post(URL, content=body, headers=headers).status_code == 401
+    headers["X-Webhook-Signature"] = "0" * 64
+    assert client.post(URL, content=body, headers=headers).status_code == 401
+
+    headers["X-Webhook-Signature"] = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    response = client.post(URL, content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["confirmed"] == 2
+
+
+def test_webhooks_are_refused_without_a_secret(client, factory, db, monkeypatch):
+    (_, user_orders), = _committed_groups(factory, db, groups=1, members=2)
+    monkeypatch.setattr(split_payment, "PAYMENT_WEBHOOK_SECRET", None)
+
+    assert client.post(URL, json=_batch(user_orders)).status_code == 503
+    db.expire_all()
+    assert {db.get(UserOrder, user_order_id).payment_status for user_order_id in user_orders} == {"PENDING"}
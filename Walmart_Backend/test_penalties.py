@@ -0,0 +1,131 @@
+"""
+Tests for the penalty collector
+"""
+import threading
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import penalties
+from app.models import Base, PaymentTransaction
+from app.penalties import ChargeResult, StubPenaltyGateway, claim_penalties, collect_penalties, record_outcomes
+
+
+def _penalties(db, factory, count, status="PENDING"):
+    user = factory.user()
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    db.add_all([
+        PaymentTransaction(id=transaction_id, user_id=user.id, transaction_type="PENALTY", amount=Decimal("50.00"),
+                           payment_method="ONLINE", status=status)
+        for transaction_id in ids
+    ])
+    db.commit()
+    return ids
+
+
+def _statuses(db):
+    db.expire_all()
+    return {row.id: row for row in db.query(PaymentTransaction)}
+
+
+def test_batch_is_claimed_charged_and_settled(factory, db, count_queries):
+    ids = _penalties(db, factory, 5)
+    _penalties(db, factory, 2, status="SUCCESS")
+
+    with count_queries() as counter:
+        assert collect_penalties(db, StubPenaltyGateway(), batch_size=3) == 3
+    # candidates, claim UPDATE, claimed rows, one executemany settle UPDATE
+    assert counter.count == 4
+
+    assert collect_penalties(db, StubPenaltyGateway(), batch_size=3) == 2
+    assert collect_penalties(db, StubPenaltyGateway(), batch_size=3) == 0
+    rows = _statuses(db)
+    assert all(rows[i].status == "SUCCESS" and rows[i].external_transaction_id == f"stub-{i}" for i in ids)
+    assert all(rows[i].claimed_by is None and rows[i].attempts == 1 for i in ids)
+
+
+def test_declined_charges_back_off_then_fail(factory, db, monkeypatch):
+    monkeypatch.setattr(penalties, "PENALTY_MAX_ATTEMPTS", 2)
+    declined, approved = _penalties(db, factory, 2)
+    gateway = StubPenaltyGateway(declined=[declined])
+
+    assert collect_penalties(db, gateway) == 2
+    rows = _statuses(db)
+    assert rows[approved].status == "SUCCESS"
+    assert rows[declined].status == "PENDING" and rows[declined].attempts == 1
+    assert rows[declined].next_attempt_at > datetime.utcnow()
+
+    # Not collectable until the backoff has passed
+    assert collect_penalties(db, gateway) == 0
+    rows[declined].next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert collect_penalties(db, gateway) == 1
+    row = _statuses(db)[declined]
+    assert row.status == "FAILED" and row.attempts == 2 and "Declined" in row.failure_reason
+
+
+def test_expired_claims_are_reclaimed(factory, db):
+    transaction_id, = _penalties(db, factory, 1)
+    assert len(claim_penalties(db)) == 1
+    assert claim_penalties(db) == []  # still leased
+
+    later = datetime.utcnow() + timedelta(seconds=penalties.PENALTY_CLAIM_LEASE_SECONDS + 1)
+    assert [charge.transaction_id for charge in claim_penalties(db, now=later)] == [transaction_id]
+
+
+def test_collector_that_lost_its_lease_cannot_settle(factory, db, caplog):
+    transaction_id, = _penalties(db, factory, 1)
+    stale, = claim_penalties(db)
+    later = datetime.utcnow() + timedelta(seconds=penalties.PENALTY_CLAIM_LEASE_SECONDS + 1)
+    current, = claim_penalties(db, now=later)
+
+    declined = [ChargeResult(transaction_id, False, error="Declined", retryable=False)]
+    assert record_outcomes(db, declined, "stub", current.claim_token) == (0, 0, 1)
+    # The stale collector's success arrives afterwards and is dropped
+    approved = [ChargeResult(transaction_id, True, external_transaction_id="late")]
+    assert record_outcomes(db, approved, "stub", stale.claim_token) == (0, 0, 0)
+
+    row = _statuses(db)[transaction_id]
+    assert row.status == "FAILED" and row.external_transaction_id is None
+    assert "reclaimed" in caplog.text
+
+
+def test_parallel_collectors_never_charge_twice(factory, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'penalties.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    setup = Session()
+    ids = set(_penalties(setup, type(factory)(setup), 200))
+    setup.close()
+
+    charged = []
+    lock = threading.Lock()
+
+    class RecordingGateway(StubPenaltyGateway):
+        def charge(self, charges):
+            with lock:
+                charged.extend(charge.transaction_id for charge in charges)
+            return super().charge(charges)
+
+    def collector():
+        db = Session()
+        try:
+            while collect_penalties(db, RecordingGateway(), batch_size=7):
+                pass
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=collector) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(charged) == sorted(ids)
+    check = Session()
+    assert {row.status for row in check.query(PaymentTransaction)} == {"SUCCESS"}
+    check.close()
+    engine.dispose()
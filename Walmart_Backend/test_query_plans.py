@@ -0,0 +1,187 @@
+"""
+Index coverage: every statement crud.py sends while serving the main flows is
+run through SQLite's EXPLAIN QUERY PLAN, and any full table scan fails the test.
+"""
+import os
+import re
+import sys
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+from app import crud
+from app.enums import DeliveryStatus
+from app.models import Driver, UserOrder
+from app.schemas import BuddyQueueCreate, CartItemCreate, ProductCreate, UserCreate
+
+CRUD_FILE = os.path.abspath(crud.__file__)
+
+# Full scans that are inherent to the query, with the reason
+ALLOWED_SCANS = {
+    # Paging through the whole catalog
+    "SELECT products.id AS products_id": "products",
+}
+
+_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+class CrudStatements:
+    """Statements whose call stack passes through crud.py, with their parameters"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        frame = sys._getframe()
+        while frame is not None:
+            if frame.f_code.co_filename == CRUD_FILE:
+                self.statements.append((statement, parameters[0] if executemany else parameters))
+                return
+            frame = frame.f_back
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def full_scans(engine, statements):
+    """(table, statement) for every full table scan in the plans of `statements`"""
+    scans = []
+    seen = set()
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                match = _SCAN.match(row[-1])
+                if match is None:
+                    continue
+                table = match.group(1)
+                allowed = [prefix for prefix, name in ALLOWED_SCANS.items()
+                           if name == table and statement.startswith(prefix)]
+                if not allowed:
+                    scans.append((table, " ".join(statement.split())))
+    return scans
+
+
+def assert_no_full_scans(engine, statements):
+    assert statements, "no crud statements were captured"
+    scans = full_scans(engine, statements)
+    assert not scans, "full table scans:\n" + "\n".join(f"  {table}: {sql}" for table, sql in scans)
+
+
+@pytest.fixture
+def crud_statements(engine):
+    with CrudStatements(engine) as statements:
+        yield statements
+
+
+def _user(db):
+    name = str(uuid.uuid4())
+    return crud.create_user(db, UserCreate(name=name, email=f"{name}@example.com", password="pw"),
+                            hashed_password="not-a-real-hash")
+
+
+def _driver(db, load="0.00"):
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20], status="AVAILABLE",
+                    lat=Decimal("12.972000"), lng=Decimal("77.595000"), current_load=Decimal(load),
+                    max_capacity=Decimal("50.00"))
+    db.add(driver)
+    db.commit()
+    return driver.id
+
+
+def _matched_group(db, members=2):
+    """Users with carts who joined the queue and were matched into a clubbed order"""
+    product = crud.create_product(db, ProductCreate(name="Rice", price=Decimal("30.00"), weight_grams=1000, stock=100))
+    buddies = []
+    for _ in range(members):
+        user = _user(db)
+        cart = crud.create_cart(db, user.id)
+        crud.add_item_to_cart(db, cart.id, CartItemCreate(product_id=product.id, quantity=2))
+        buddies.append(crud.join_buddy_queue(db, user.id, BuddyQueueCreate(
+            cart_id=cart.id, lat=Decimal("12.971600"), lng=Decimal("77.594600"))))
+    group = crud.find_compatible_buddies(db, buddies[0].id)
+    return crud.create_clubbed_order(db, group), product
+
+
+def test_user_catalog_and_cart_queries_use_indexes(db, engine, crud_statements):
+    user = _user(db)
+    crud.get_user_by_email(db, user.email)
+    product = crud.create_product(db, ProductCreate(name="Dal", price=Decimal("12.50"), weight_grams=500, stock=10))
+    crud.get_products(db)
+    crud.get_product(db, product.id)
+
+    cart = crud.create_cart(db, user.id)
+    crud.get_active_cart(db, user.id)
+    item = crud.add_item_to_cart(db, cart.id, CartItemCreate(product_id=product.id, quantity=2))
+    crud.update_cart_item_quantity(db, cart.id, item.id, 3)
+    crud.get_cart_details(db, cart.id)
+    crud.calculate_cart_totals(db, cart.id)
+    crud.remove_item_from_cart(db, cart.id, item.id)
+    crud.add_item_to_cart(db, cart.id, CartItemCreate(product_id=product.id, quantity=1))
+    crud.clear_cart(db, cart.id)
+    crud.delete_cart(db, cart.id)
+
+    assert_no_full_scans(engine, crud_statements.statements)
+
+
+def test_matching_and_clubbed_cart_queries_use_indexes(db, engine, crud_statements):
+    order, product = _matched_group(db)
+    member = db.query(UserOrder).filter(UserOrder.clubbed_order_id == order.id).first()
+    crud.check_club_readiness(db, member.user_id, 12.9716, 77.5946)
+    crud.get_clubbed_order_details(db, order.id, member.user_id)
+    crud.add_item_to_clubbed_cart(db, order.id, member.user_id,
+                                  CartItemCreate(product_id=product.id, quantity=1), "Member")
+    crud.get_user_orders(db, member.user_id)
+
+    assert_no_full_scans(engine, crud_statements.statements)
+
+
+def test_payment_and_delivery_queries_use_indexes(db, engine, crud_statements):
+    order, _ = _matched_group(db)
+    _driver(db)
+    delivery = crud.assign_driver_to_order(db, order.id)
+    user_orders = db.query(UserOrder).filter(UserOrder.clubbed_order_id == order.id).all()
+    first, second = user_orders[0].id, user_orders[1].id
+    first_user = user_orders[0].user_id
+
+    crud.commit_to_payment(db, first, "ONLINE", "Somewhere", "9999999999")
+    crud.commit_to_payment(db, second, "ONLINE", "Somewhere", "9999999999")
+    crud.check_all_commitments(db, order.id)
+    crud.confirm_payment(db, first, "txn-1", "stub")
+    crud.apply_payment_confirmations(db, [
+        {"user_order_id": second, "external_transaction_id": "txn-2", "payment_gateway": "stub"}
+    ])
+    crud.check_all_payments_confirmed(db, order.id)
+    crud.get_split_payment_summary(db, order.id, first_user)
+    crud.update_delivery_status(db, delivery.id, DeliveryStatus.IN_TRANSIT)
+    crud.update_delivery_status(db, delivery.id, DeliveryStatus.DELIVERED)
+
+    assert_no_full_scans(engine, crud_statements.statements)
+
+
+def test_cancellation_deadline_and_cleanup_queries_use_indexes(db, engine, crud_statements):
+    cancelled, _ = _matched_group(db, members=3)
+    user_orders = db.query(UserOrder).filter(UserOrder.clubbed_order_id == cancelled.id).all()
+    cancellation = crud.cancel_user_order(db, user_orders[0].id, user_orders[0].user_id)
+    crud.process_cancellation_compensation(db, cancelled.id, cancellation.id)
+    db.commit()
+
+    expired, _ = _matched_group(db)
+    _driver(db)
+    crud.assign_driver_to_order(db, expired.id)
+    crud.enforce_payment_deadlines(db, now=datetime.utcnow() + timedelta(minutes=31))
+
+    crud.timeout_expired_buddies(db)
+    crud.cleanup_old_buddy_entries(db, hours_old=0)
+
+    assert_no_full_scans(engine, crud_statements.statements)
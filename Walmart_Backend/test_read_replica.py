@@ -0,0 +1,88 @@
+"""
+Tests for read-replica routing, with the primary and the replica in two SQLite files
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import database
+from app.auth import create_access_token
+from app.cache import catalog_cache, invalidate_product
+from app.models import Base
+from app.read_replica import recent_writers
+from conftest import Factory
+
+
+@pytest.fixture
+def replica(tmp_path, monkeypatch):
+    """A second database standing in for a replica that has not caught up"""
+    url = f"sqlite:///{tmp_path / 'replica.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(database.async_database_url(url), poolclass=NullPool)
+    monkeypatch.setattr(database, "ReadSessionLocal", sessionmaker(bind=engine, info={"replica": True}))
+    monkeypatch.setattr(database, "AsyncReadSessionLocal", async_sessionmaker(async_engine, info={"replica": True}))
+    session = sessionmaker(bind=engine)()
+    yield Factory(session)
+    session.close()
+    async_engine.sync_engine.dispose()
+    engine.dispose()
+
+
+def _auth(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': user.email, 'uid': user.id})}"}
+
+
+def test_user_reads_own_writes_from_primary_then_replica_again(client, factory, replica):
+    user = factory.user()
+    order = factory.clubbed_order([factory.cart(user, [(factory.product(), 1)])])
+    headers = _auth(user)
+
+    def delivery_lookup(headers):
+        # "Order not found" means the membership row was missing: the read went to the replica
+        return client.get(f"/orders/{order.id}/delivery", headers=headers).json()["detail"]
+
+    assert delivery_lookup(headers) == "Order not found"
+
+    response = client.post("/cart/items", json={"product_id": factory.product().id, "quantity": 1}, headers=headers)
+    assert response.status_code == 200
+    assert delivery_lookup(headers) == "Delivery not found"
+
+    recent_writers.clear()  # the window has passed
+    assert delivery_lookup(headers) == "Order not found"
+
+
+def test_async_read_route_uses_replica(client, factory, replica):
+    user = factory.user()
+    neighbour = replica.user()
+    replica.buddy(replica.cart(neighbour), lat="12.971600", lng="77.594600")
+
+    body = client.post(
+        "/club/queue-stats", json={"lat": "12.971600", "lng": "77.594600"}, headers=_auth(user)
+    ).json()
+
+    assert body["nearby_users"] == 1
+
+
+def test_replica_reads_right_after_a_catalog_write_are_not_cached(client, replica):
+    replica.product(name="Old")
+    invalidate_product()
+
+    assert [product["name"] for product in client.get("/products/").json()] == ["Old"]
+    assert len(catalog_cache) == 0
+
+
+def test_payment_summary_reads_from_primary(client, factory, db, replica):
+    from app.crud import create_user_orders_for_clubbed_order
+
+    user = factory.user()
+    order = factory.clubbed_order([factory.cart(user, [(factory.product(), 1)])])
+    create_user_orders_for_clubbed_order(db, order.id)
+    recent_writers.clear()  # no read-your-writes window to fall back on
+
+    response = client.get(f"/split-payment/summary/{order.id}", headers=_auth(user))
+
+    assert response.status_code == 200
+    assert response.json()["pending_payments"] == 1
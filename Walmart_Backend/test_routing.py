@@ -0,0 +1,82 @@
+"""
+Tests for the multi-drop route solver and delivery route planning
+"""
+import itertools
+import json
+import random
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app.delivery_routes import plan_delivery_routes
+from app.models import Delivery, Driver
+from app.crud import create_user_orders_for_clubbed_order
+from app.routing import distance_matrix, solve_route, solve_routes
+
+
+def _optimal_length(origin, stops):
+    matrix = distance_matrix([origin, *stops])
+    return min(
+        sum(matrix[a][b] for a, b in zip((0, *perm), perm))
+        for perm in itertools.permutations(range(1, len(stops) + 1))
+    )
+
+
+def test_collinear_stops_are_visited_in_order():
+    stops = [(12.93, 77.6), (12.91, 77.6), (12.94, 77.6), (12.92, 77.6)]
+    order, cumulative = solve_route((12.90, 77.6), stops)
+    assert order == [1, 3, 0, 2]
+    assert cumulative == sorted(cumulative)
+
+
+def test_routes_are_close_to_optimal():
+    rng = random.Random(3)
+    ratios = []
+    for stop_count in range(2, 8):
+        for _ in range(30):
+            origin = (12.9 + rng.random() * 0.1, 77.5 + rng.random() * 0.1)
+            stops = [(12.9 + rng.random() * 0.1, 77.5 + rng.random() * 0.1) for _ in range(stop_count)]
+            order, cumulative = solve_route(origin, stops)
+            assert sorted(order) == list(range(stop_count))
+            ratios.append(cumulative[-1] / _optimal_length(origin, stops))
+    assert max(ratios) < 1.15
+    assert sum(ratios) / len(ratios) < 1.01
+
+
+def test_pool_and_inline_agree():
+    rng = random.Random(5)
+    problems = [
+        (i, (12.9, 77.5), [(12.9 + rng.random() * 0.1, 77.5 + rng.random() * 0.1) for _ in range(5)])
+        for i in range(40)
+    ]
+    assert solve_routes(problems, workers=2) == solve_routes(problems, workers=0)
+
+
+def test_plan_delivery_routes_stores_route_and_etas(factory, db):
+    product = factory.product(weight_grams=500)
+    locations = [("12.930000", "77.600000"), ("12.910000", "77.600000"), ("12.920000", "77.600000")]
+    carts = []
+    for lat, lng in locations:
+        cart = factory.cart(factory.user(), [(product, 1)])
+        factory.buddy(cart, lat=lat, lng=lng)
+        carts.append(cart)
+    order = factory.clubbed_order(carts)
+    user_orders = {user_order.cart_id: user_order.id for user_order in create_user_orders_for_clubbed_order(db, order.id)}
+    driver = Driver(id=str(uuid.uuid4()), name="Driver", phone="555", status="BUSY",
+                    lat=Decimal("12.900000"), lng=Decimal("77.600000"))
+    db.add(driver)
+    db.add(Delivery(id=str(uuid.uuid4()), driver_id=driver.id, clubbed_order_id=order.id))
+    db.add(Delivery(id=str(uuid.uuid4()), driver_id=driver.id, clubbed_order_id=str(uuid.uuid4())))  # no stops
+    db.commit()
+    now = datetime(2030, 1, 1, 12, 0)
+
+    assert plan_delivery_routes(db, now=now) == 2
+    assert plan_delivery_routes(db, now=now) == 0
+
+    delivery = db.query(Delivery).filter(Delivery.clubbed_order_id == order.id).one()
+    route = json.loads(delivery.route)
+    assert [stop["user_order_id"] for stop in route] == [user_orders[carts[i].id] for i in (1, 2, 0)]
+    etas = [datetime.fromisoformat(stop["eta"].rstrip("Z")) for stop in route]
+    assert now < etas[0] < etas[1] < etas[2] < now + timedelta(minutes=30)
+    assert delivery.estimated_delivery == etas[-1]
+    assert 3000 < delivery.route_distance_meters < 3500
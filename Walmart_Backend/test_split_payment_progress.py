@@ -0,0 +1,119 @@
+"""
+Tests for the commitment/confirmation counters on clubbed orders
+"""
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from app.auth import get_current_user, get_current_user_async
+from app.crud import (
+    assign_driver_to_order, cancel_user_order, commit_to_payment, confirm_payment,
+    create_user_orders_for_clubbed_order
+)
+from app.models import ClubbedOrder, Driver, User, UserOrder
+
+COMMIT_BODY = {"payment_method": "ONLINE", "delivery_address": "Somewhere", "delivery_phone": "9999999999"}
+
+
+def _group(factory, db, members):
+    product = factory.product(price="10.00")
+    carts = [factory.cart(factory.user(name=f"Member {i}"), [(product, 1)]) for i in range(members)]
+    order = factory.clubbed_order(carts)
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+    return order.id, [(user_order.id, user_order.user_id) for user_order in user_orders]
+
+
+def _act_as(app, db, user_id):
+    user = db.get(User, user_id)
+    db.expunge(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_current_user_async] = lambda: user
+
+
+def test_counters_track_commitments_and_confirmations(factory, db):
+    order_id, user_orders = _group(factory, db, members=2)
+    (first, _), (second, _) = user_orders
+
+    assert commit_to_payment(db, first, **COMMIT_BODY).all_committed is False
+    # Committing again only refreshes details; the counter does not move
+    assert commit_to_payment(db, first, **COMMIT_BODY).committed_count == 1
+    assert commit_to_payment(db, second, **COMMIT_BODY).all_committed is True
+
+    assert confirm_payment(db, first).all_confirmed is False
+    progress = confirm_payment(db, second)
+    assert progress == (2, 2, 2) and progress.all_confirmed
+
+    db.expire_all()
+    order = db.get(ClubbedOrder, order_id)
+    assert order.status == "PAYMENT_CONFIRMED"
+    assert order.all_payments_confirmed is True
+    assert order.order_confirmed_at is not None
+
+
+@pytest.mark.parametrize("members", [2, 8])
+def test_commit_and_confirm_query_counts_are_fixed(app, client, factory, db, count_queries, members):
+    _, user_orders = _group(factory, db, members)
+    user_order_id, user_id = user_orders[0]
+    _act_as(app, db, user_id)
+
+    with count_queries() as counter:
+        response = client.post("/split-payment/commit", json={"user_order_id": user_order_id, **COMMIT_BODY})
+    assert response.status_code == 200
+    assert response.json()["all_users_committed"] is False
+    # ownership check, user order, conditional user order and counter UPDATEs, counters
+    assert counter.count == 5
+
+    with count_queries() as counter:
+        response = client.post("/split-payment/confirm", json={"user_order_id": user_order_id})
+    assert response.status_code == 200
+    assert response.json()["all_payments_confirmed"] is False
+    # ownership check, user order, conditional UPDATE, outbox INSERT, counter UPDATE, counters
+    assert counter.count == 6
+
+
+def test_group_with_assigned_driver_can_still_be_paid(factory, db):
+    order_id, user_orders = _group(factory, db, members=2)
+    db.add(Driver(id=str(uuid.uuid4()), name="Driver", phone=str(uuid.uuid4())[:20], status="AVAILABLE",
+                  lat=Decimal("12.972000"), lng=Decimal("77.595000"),
+                  current_load=Decimal("0"), max_capacity=Decimal("10")))
+    db.commit()
+    assert assign_driver_to_order(db, order_id)
+    for user_order_id, _ in user_orders:
+        assert commit_to_payment(db, user_order_id, **COMMIT_BODY)
+
+    (first, _), (second, _) = user_orders
+    assert confirm_payment(db, first).all_confirmed is False
+    assert confirm_payment(db, second).all_confirmed is True
+    # Repeat confirmations report progress without counting twice
+    assert confirm_payment(db, second) == (2, 2, 2)
+
+
+def test_cancelled_order_cannot_be_confirmed(factory, db):
+    order_id, user_orders = _group(factory, db, members=2)
+    (first, first_user), (second, _) = user_orders
+    for user_order_id in (first, second):
+        assert commit_to_payment(db, user_order_id, **COMMIT_BODY)
+    assert cancel_user_order(db, first, first_user)
+
+    assert confirm_payment(db, second) is None
+
+    db.expire_all()
+    assert db.get(ClubbedOrder, order_id).status == "CANCELLED"
+    assert {user_order.payment_status for user_order in
+            db.query(UserOrder).filter(UserOrder.clubbed_order_id == order_id)} == {"CANCELLED"}
+
+
+def test_creating_user_orders_again_keeps_existing_orders_and_progress(factory, db):
+    order_id, user_orders = _group(factory, db, members=2)
+    (first, _), _ = user_orders
+    commit_to_payment(db, first, **COMMIT_BODY)
+    confirm_payment(db, first)
+
+    again = create_user_orders_for_clubbed_order(db, order_id)
+
+    assert sorted(user_order.id for user_order in again) == sorted(user_order_id for user_order_id, _ in user_orders)
+    assert db.query(UserOrder).filter(UserOrder.clubbed_order_id == order_id).count() == 2
+    db.expire_all()
+    order = db.get(ClubbedOrder, order_id)
+    assert (order.member_count, order.committed_count, order.confirmed_count) == (2, 1, 1)
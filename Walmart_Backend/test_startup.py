@@ -0,0 +1,82 @@
+"""
+Tests for startup: schema creation gated by the schema version, and
+background workers started once per process
+"""
+from sqlalchemy import create_engine, event, select
+
+import main
+from app import database
+from app.models import BASELINE_SCHEMA_VERSION, SCHEMA_VERSION, Base, SchemaVersion
+
+
+def _ddl_statements(engine, action):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(("CREATE", "PRAGMA")):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        action()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def test_create_tables_records_version_and_then_skips_schema_checks(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    monkeypatch.setattr(database, "engine", engine)
+
+    assert _ddl_statements(engine, database.create_tables)
+    with engine.connect() as conn:
+        assert conn.execute(select(SchemaVersion.version)).scalars().all() == [SCHEMA_VERSION]
+
+    # Second start: one version lookup, no per-table checks or DDL
+    assert not [statement for statement in _ddl_statements(engine, database.create_tables)
+                if "schema_version" not in statement]
+    engine.dispose()
+
+
+def test_create_tables_records_unversioned_databases_at_the_baseline(tmp_path, monkeypatch, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'startup.db'}")
+    Base.metadata.tables["users"].create(bind=engine)
+    monkeypatch.setattr(database, "engine", engine)
+
+    assert _ddl_statements(engine, database.create_tables)
+    with engine.connect() as conn:
+        assert database.schema_version(conn) == BASELINE_SCHEMA_VERSION
+
+    # Later starts leave the rest to the migrations, but keep warning until they run
+    caplog.clear()
+    assert not [statement for statement in _ddl_statements(engine, database.create_tables)
+                if "schema_version" not in statement]
+    assert f"version {BASELINE_SCHEMA_VERSION} of {SCHEMA_VERSION}" in caplog.text
+
+    with engine.begin() as conn:
+        conn.execute(SchemaVersion.__table__.insert().values(version=SCHEMA_VERSION))
+    caplog.clear()
+    database.create_tables()
+    assert not caplog.text
+    engine.dispose()
+
+
+def test_background_tasks_start_once_per_process(monkeypatch):
+    started = []
+
+    class RecordingThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target = target
+
+        def start(self):
+            started.append(self.target.__name__)
+
+    monkeypatch.setattr(main.threading, "Thread", RecordingThread)
+    monkeypatch.setattr(main, "background_started", False)
+
+    main.start_background_tasks()
+    first = list(started)
+    main.start_background_tasks()
+
+    assert "cleanup_task" in first and first.count("cleanup_task") == 1
+    assert started == first
@@ -0,0 +1,97 @@
+"""
+Tests for materialized wallet balances and their reconciliation
+"""
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from app import outbox, wallet
+from app.auth import get_current_user, get_current_user_async
+from app.crud import cancel_user_order, create_user_orders_for_clubbed_order
+from app.models import PaymentTransaction, User, WalletBalance
+from app.wallet import apply_ledger_rows, credit_wallets, reconcile_wallets
+
+
+def _cancelled_group(factory, db, members=3):
+    product = factory.product(price="100.00")
+    carts = [factory.cart(factory.user(name=f"Member {i}"), [(product, 5)]) for i in range(members)]
+    order = factory.clubbed_order(carts)
+    user_orders = create_user_orders_for_clubbed_order(db, order.id)
+    canceller = user_orders[0]
+    assert cancel_user_order(db, canceller.id, canceller.user_id)
+    outbox.drain(db)
+    return [user_order.user_id for user_order in user_orders]
+
+
+def test_compensation_credits_wallets_in_the_same_commit(factory, db):
+    canceller, *others = _cancelled_group(factory, db)
+
+    for user_id in others:
+        assert db.get(WalletBalance, user_id).balance == Decimal("15.00")  # 60% of 50.0, split two ways
+    # The penalty is charged online, not to the wallet
+    assert db.get(WalletBalance, canceller) is None
+
+
+def test_wallet_endpoint_reads_the_balance(app, client, factory, db, count_queries):
+    _, compensated, _ = _cancelled_group(factory, db)
+    user = db.get(User, compensated)
+    db.expunge(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_current_user_async] = lambda: user
+
+    with count_queries() as counter:
+        body = client.get("/wallet/").json()
+    assert body["balance"] == 15.0
+    assert counter.count == 1
+
+    newcomer = factory.user()
+    app.dependency_overrides[get_current_user] = lambda: newcomer
+    app.dependency_overrides[get_current_user_async] = lambda: newcomer
+    assert client.get("/wallet/").json()["balance"] == 0.0
+
+
+def test_reconciliation_finds_and_repairs_drift(factory, db):
+    _, first, second = _cancelled_group(factory, db)
+    _, third, _ = _cancelled_group(factory, db)
+    credit_wallets(db, {first: Decimal("5.00")})  # drift: no matching ledger row
+    db.query(WalletBalance).filter(WalletBalance.user_id == second).delete()  # lost row
+    db.commit()
+
+    report = reconcile_wallets(db, chunk_size=1)
+    assert report["checked"] == 4
+    assert {row["user_id"] for row in report["mismatches"]} == {first, second}
+
+    report = reconcile_wallets(db, chunk_size=1, fix=True)
+    assert report["fixed"] == 2
+    assert reconcile_wallets(db)["mismatched"] == 0
+    assert db.get(WalletBalance, first).balance == Decimal("15.00")
+    assert db.get(WalletBalance, second).balance == Decimal("15.00")
+    assert db.query(PaymentTransaction).filter(PaymentTransaction.user_id == third).count() == 1
+
+
+def test_repair_keeps_a_credit_committed_after_the_check(factory, db, monkeypatch):
+    _, first, _ = _cancelled_group(factory, db)
+    credit_wallets(db, {first: Decimal("5.00")})  # drift: 20.00 stored, 15.00 in the ledger
+    db.commit()
+    ledger_balances = wallet._ledger_balances
+    calls = []
+
+    def check_then_concurrent_credit(session, user_ids):
+        balances = ledger_balances(session, user_ids)
+        if not calls:
+            # Another request credits the wallet after the mismatch was detected
+            row = {"id": str(uuid.uuid4()), "user_id": first, "transaction_type": "REFUND",
+                   "amount": Decimal("7.00"), "payment_method": "WALLET", "status": "SUCCESS",
+                   "processed_at": datetime.utcnow()}
+            db.add(PaymentTransaction(**row))
+            apply_ledger_rows(db, [row])
+            db.commit()
+        calls.append(user_ids)
+        return balances
+
+    monkeypatch.setattr(wallet, "_ledger_balances", check_then_concurrent_credit)
+    report = reconcile_wallets(db, fix=True)
+
+    assert report["fixed"] == 1
+    db.expire_all()
+    assert db.get(WalletBalance, first).balance == Decimal("22.00")